@@ -0,0 +1,459 @@
+"""Task `backtest.run`: vectorized backtests of rule- and signal-driven strategies over stored candles.
+
+A strategy turns a pair's candle columns into a target position per bar (-1, 0 or 1, decided at the
+bar's close); the rest is array arithmetic, no per-bar loop:
+- strategy return of a bar = previous position * close-to-close return - |position change| * cost,
+  with cost = fee + slippage in bps of traded notional;
+- an optional stoploss (Freqtrade convention, e.g. -0.05) ends a trade on the first bar whose low
+  (high for shorts) crosses the stop, filled at the stop or at the open if the bar gapped through it;
+- trades are the runs of equal non-zero position.
+
+Pairs run in a process pool, one job per pair; the portfolio is the equal-weight mix of the pair
+return series (rebalanced every bar). Candles come from market_candles and are mirrored per
+(exchange, timeframe, pair) into .npz files under AGENT_CANDLE_MIRROR, so repeated runs over a range
+that is already mirrored do not touch Postgres. Set AGENT_CANDLE_MIRROR to an empty string to disable.
+
+Strategy spec (`strategy` in the payload, or `backtest` in an alignment's freqtrade_overrides):
+    {"rule": "sma_cross" | "rsi" | "breakout" | "bollinger" | "signals", "params": {...},
+     "direction": "long" | "short" | "both"}
+"""
+
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import signal_eval
+from market_backfill import TF_SECONDS
+from runtime import report_progress
+
+CANDLE_COLUMNS = ("ts", "open", "high", "low", "close", "volume")
+CURVE_POINTS = 200
+YEAR_SEC = 365 * 86400
+DIRECTIONS = ("long", "short", "both")
+CONFIG_KEYS = ("exchange", "timeframe", "pairs", "start", "end", "strategy", "fee_bps", "slippage_bps", "stoploss")
+RULE_DEFAULTS: dict[str, dict[str, Any]] = {
+    "sma_cross": {"fast": 20, "slow": 50},
+    "rsi": {"period": 14, "lower": 30, "upper": 70, "exit": 50},
+    "breakout": {"period": 20, "exit_period": 10},
+    "bollinger": {"period": 20, "k": 2.0},
+    "signals": {"provider_ids": None, "min_confidence": 0.0, "hold_sec": 86400},
+}
+
+_conn = None
+_pool: ProcessPoolExecutor | None = None
+
+
+def _db():
+    """Per-process connection, reused across the jobs a pool process runs."""
+    global _conn
+    if _conn is None or _conn.closed:
+        _conn = signal_eval._connect()
+        _conn.autocommit = True
+    return _conn
+
+
+def mirror_root() -> Path | None:
+    path = os.getenv("AGENT_CANDLE_MIRROR", os.path.join(tempfile.gettempdir(), "trade-candles"))
+    return Path(path) if path else None
+
+
+def _mirror_path(root: Path, exchange: str, timeframe: str, pair: str) -> Path:
+    return root / exchange / timeframe / f"{pair.replace('/', '_').replace(':', '_')}.npz"
+
+
+def load_candles(exchange: str, timeframe: str, pair: str, start: int, end: int) -> dict[str, np.ndarray]:
+    """Candle columns for bars opening in [start, end), `ts` in unix seconds."""
+    root = mirror_root()
+    path = _mirror_path(root, exchange, timeframe, pair) if root else None
+    if path is not None and path.exists():
+        with np.load(path) as z:
+            lo_cached, hi_cached = z["range"]
+            if lo_cached <= start and end <= hi_cached:
+                lo, hi = np.searchsorted(z["ts"], [start, end])
+                return {name: z[name][lo:hi] for name in CANDLE_COLUMNS}
+
+    with _db().cursor() as cur:
+        cur.execute(
+            "SELECT extract(epoch FROM ts)::bigint, open, high, low, close, volume FROM market_candles "
+            "WHERE exchange = %s AND timeframe = %s AND normalized_pair = %s "
+            "AND ts >= to_timestamp(%s) AND ts < to_timestamp(%s) ORDER BY ts",
+            (exchange, timeframe, pair, start, end),
+        )
+        data = np.asarray(cur.fetchall(), dtype=np.float64).reshape(-1, len(CANDLE_COLUMNS))
+    cols = {name: data[:, i] for i, name in enumerate(CANDLE_COLUMNS)}
+    cols["ts"] = cols["ts"].astype(np.int64)
+
+    covered = _covered_until(cols["ts"], start, min(end, int(time.time())), TF_SECONDS[timeframe])
+    if path is not None and covered > start:
+        keep = cols["ts"] < covered
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, range=np.array([start, covered], dtype=np.int64), **{k: v[keep] for k, v in cols.items()})
+        os.replace(tmp, path)
+    return cols
+
+
+def _covered_until(ts: np.ndarray, start: int, end: int, tf_sec: int) -> int:
+    """End of the gap-free run of closed bars from `start`: the mirror only vouches for what Postgres had.
+
+    A bar missing from the table (backfill still running, or never loaded) ends the run, so a later
+    request for that span goes back to Postgres instead of trusting a hole in the mirror.
+    """
+    closed = end // tf_sec * tf_sec
+    expected = np.arange(-(-start // tf_sec) * tf_sec, closed, tf_sec, dtype=np.int64)
+    have = ts[ts < closed]
+    n = min(have.size, expected.size)
+    mismatch = np.flatnonzero(have[:n] != expected[:n])
+    if mismatch.size:
+        return int(expected[mismatch[0]])
+    return int(expected[n]) if n < expected.size else closed
+
+
+def _sma(x: np.ndarray, n: int) -> np.ndarray:
+    out = np.full(x.size, np.nan)
+    if x.size >= n:
+        c = np.cumsum(np.insert(x, 0, 0.0))
+        out[n - 1 :] = (c[n:] - c[:-n]) / n
+    return out
+
+
+def _rolling(x: np.ndarray, n: int, fn) -> np.ndarray:
+    out = np.full(x.size, np.nan)
+    if x.size >= n:
+        out[n - 1 :] = fn(sliding_window_view(x, n), axis=1)
+    return out
+
+
+def _prev(x: np.ndarray, fill: float = np.nan) -> np.ndarray:
+    return np.r_[fill, x[:-1]] if x.size else x
+
+
+def _hold(enter: np.ndarray, leave: np.ndarray) -> np.ndarray:
+    """In position from a bar where `enter` holds until the next bar where `leave` does (enter wins ties)."""
+    marks = np.where(enter, 1, np.where(leave, 0, -1))
+    idx = np.maximum.accumulate(np.where(marks >= 0, np.arange(marks.size), -1))
+    return (idx >= 0) & (marks[np.maximum(idx, 0)] == 1)
+
+
+def _rsi(close: np.ndarray, n: int) -> np.ndarray:
+    delta = np.diff(close, prepend=close[:1])
+    gain, loss = _sma(np.clip(delta, 0, None), n), _sma(np.clip(-delta, 0, None), n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(loss > 0, 100 - 100 / (1 + gain / loss), np.where(gain > 0, 100.0, 50.0))
+
+
+def _signal_states(c: dict[str, np.ndarray], signals: dict[str, np.ndarray], tf_sec: int, p: dict) -> tuple[np.ndarray, np.ndarray]:
+    sides = np.array([signal_eval.DIRECTION_SIDES.get(str(d).lower(), 0) for d in signals["direction"]], dtype=np.int8)
+    conf = signal_eval._floats(signals["confidence"])
+    keep = (sides != 0) & ~(conf < float(p["min_confidence"]))
+    ts = signals["ts"][keep].astype(np.int64)
+    order = np.argsort(ts, kind="stable")
+    ts, sides = ts[order], sides[keep][order]
+    # Position at a bar's close follows the latest signal published by then, while it is fresh.
+    closes_at = c["ts"] + tf_sec
+    idx = np.searchsorted(ts, closes_at, side="right") - 1
+    fresh = (idx >= 0) & (closes_at - ts[np.maximum(idx, 0)] <= int(p["hold_sec"])) if ts.size else np.zeros(closes_at.size, bool)
+    side = np.where(fresh, sides[np.maximum(idx, 0)] if ts.size else 0, 0)
+    return side > 0, side < 0
+
+
+def positions(c: dict[str, np.ndarray], spec: dict, *, tf_sec: int, signals: dict[str, np.ndarray] | None = None) -> np.ndarray:
+    """Target position per bar (-1, 0, 1) for a strategy spec."""
+    rule = spec["rule"]
+    p = {**RULE_DEFAULTS[rule], **(spec.get("params") or {})}
+    close, high, low = c["close"], c["high"], c["low"]
+    with np.errstate(invalid="ignore"):
+        if rule == "sma_cross":
+            fast, slow = _sma(close, int(p["fast"])), _sma(close, int(p["slow"]))
+            long, short = fast > slow, fast < slow
+        elif rule == "rsi":
+            r = _rsi(close, int(p["period"]))
+            long = _hold(r < p["lower"], r > p["exit"])
+            short = _hold(r > p["upper"], r < p["exit"])
+        elif rule == "breakout":
+            n, m = int(p["period"]), int(p["exit_period"])
+            long = _hold(close > _prev(_rolling(high, n, np.max)), close < _prev(_rolling(low, m, np.min)))
+            short = _hold(close < _prev(_rolling(low, n, np.min)), close > _prev(_rolling(high, m, np.max)))
+        elif rule == "bollinger":
+            n, k = int(p["period"]), float(p["k"])
+            mid = _sma(close, n)
+            sd = np.sqrt(np.maximum(_sma(close * close, n) - mid * mid, 0))
+            long = _hold(close < mid - k * sd, close >= mid)
+            short = _hold(close > mid + k * sd, close <= mid)
+        else:
+            long, short = _signal_states(c, signals or {}, tf_sec, p)
+    direction = spec.get("direction", "long")
+    pos = np.zeros(close.size)
+    if direction in ("long", "both"):
+        pos += long
+    if direction in ("short", "both"):
+        pos -= short
+    return pos
+
+
+def simulate(c: dict[str, np.ndarray], position: np.ndarray, *, fee_bps: float, slippage_bps: float, stoploss: float | None) -> dict[str, np.ndarray]:
+    """Bar returns, equity and trades for a target position array."""
+    close, n = c["close"], c["close"].size
+    pos = position.astype(np.float64).copy()
+    cost = (fee_bps + slippage_bps) / 1e4
+    mark = close.copy()  # price each bar's return is measured to
+    bar = np.arange(n)
+
+    if stoploss and n:
+        start = (pos != 0) & (pos != _prev(pos, 0.0))
+        seg = np.cumsum(start) * (pos != 0)
+        entry = np.flatnonzero(start)
+        side = pos[entry]
+        stop = close[entry] * (1 + side * stoploss)
+        held = _prev(seg, 0).astype(np.int64)  # trade exposed over each bar
+        at = np.flatnonzero(held)
+        sid = held[at] - 1
+        hit = np.where(side[sid] > 0, c["low"][at] <= stop[sid], c["high"][at] >= stop[sid])
+        ids, first = np.unique(sid[hit], return_index=True)
+        if ids.size:
+            f = at[hit][first]
+            gap = np.where(side[ids] > 0, c["open"][f] < stop[ids], c["open"][f] > stop[ids])
+            mark[f] = np.where(gap, c["open"][f], stop[ids])
+            stopped_at = np.full(entry.size + 1, n)
+            stopped_at[ids + 1] = f
+            pos[(seg > 0) & (bar >= stopped_at[seg])] = 0
+
+    prev_pos = _prev(pos, 0.0)
+    r = np.zeros(n)
+    r[1:] = mark[1:] / close[:-1] - 1
+    ret = prev_pos * r - np.abs(pos - prev_pos) * cost
+    equity = np.cumprod(1 + ret)
+
+    change = np.flatnonzero(pos != prev_pos)
+    opens = change[pos[change] != 0]
+    exits = np.r_[change, n - 1][np.searchsorted(change, opens, side="right")]
+    side = pos[opens]
+    gross = side * (mark[exits] / close[opens] - 1)
+    return {
+        "ret": ret,
+        "equity": equity,
+        "position": pos,
+        "trade_pnl": gross - 2 * cost,
+        "trade_bars": exits - opens,
+        "fees": np.abs(pos - prev_pos) * cost,
+    }
+
+
+def _num(v: Any) -> float | None:
+    v = float(v)
+    return round(v, 6) if np.isfinite(v) else None
+
+
+def stats(ret: np.ndarray, tf_sec: int, sim: dict[str, np.ndarray] | None = None) -> dict[str, Any]:
+    equity = np.cumprod(1 + ret)
+    per_year = YEAR_SEC / tf_sec
+    out: dict[str, Any] = {"bars": int(ret.size)}
+    if not ret.size:
+        return out
+    sd = ret.std()
+    downside = np.sqrt(np.mean(np.minimum(ret, 0) ** 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out.update(
+            total_return=_num(equity[-1] - 1),
+            cagr=_num(equity[-1] ** (per_year / ret.size) - 1) if equity[-1] > 0 else -1.0,
+            sharpe=_num(ret.mean() / sd * np.sqrt(per_year)) if sd > 0 else None,
+            sortino=_num(ret.mean() / downside * np.sqrt(per_year)) if downside > 0 else None,
+            max_drawdown=_num((equity / np.maximum.accumulate(equity) - 1).min()),
+        )
+    if sim is not None:
+        pnl = sim["trade_pnl"]
+        wins, losses = pnl[pnl > 0].sum(), -pnl[pnl < 0].sum()
+        out.update(
+            exposure=_num(np.mean(sim["position"] != 0)),
+            fees=_num(sim["fees"].sum()),
+            trades=int(pnl.size),
+            win_rate=_num(np.mean(pnl > 0)) if pnl.size else None,
+            avg_trade=_num(pnl.mean()) if pnl.size else None,
+            best_trade=_num(pnl.max()) if pnl.size else None,
+            worst_trade=_num(pnl.min()) if pnl.size else None,
+            profit_factor=_num(wins / losses) if losses > 0 else None,
+            avg_bars_held=_num(sim["trade_bars"].mean()) if pnl.size else None,
+        )
+    return out
+
+
+def curve(ts: np.ndarray, ret: np.ndarray) -> list[list[float]]:
+    equity = np.cumprod(1 + ret)
+    step = max(1, -(-equity.size // CURVE_POINTS))
+    pick = np.unique(np.r_[np.arange(0, equity.size, step), equity.size - 1]) if equity.size else np.empty(0, dtype=np.int64)
+    return [[int(ts[i]), float(equity[i])] for i in pick]
+
+
+def backtest_pair(job: dict[str, Any]) -> dict[str, Any]:
+    """Process-pool job: one pair, returns its stats plus the bar return series for the portfolio."""
+    pair, tf = job["pair"], job["timeframe"]
+    tf_sec = TF_SECONDS[tf]
+    c = load_candles(job["exchange"], tf, pair, job["start"], job["end"])
+    if c["ts"].size < 2:
+        return {"pair": pair, "error": "no candles"}
+    signals = None
+    if job["strategy"]["rule"] == "signals":
+        p = {**RULE_DEFAULTS["signals"], **(job["strategy"].get("params") or {})}
+        signals = signal_eval.load_signals_from_history(
+            _db(), providers=p["provider_ids"], pairs=[pair], start=job["start"] - int(p["hold_sec"]), end=job["end"]
+        )
+    pos = positions(c, job["strategy"], tf_sec=tf_sec, signals=signals)
+    sim = simulate(c, pos, fee_bps=job["fee_bps"], slippage_bps=job["slippage_bps"], stoploss=job["stoploss"])
+    return {"pair": pair, "stats": stats(sim["ret"], tf_sec, sim), "ts": c["ts"], "ret": sim["ret"]}
+
+
+def load_alignment(conn, alignment_id: str) -> tuple[dict, dict]:
+    """(freqtrade_overrides, freqai_overrides) of an alignment."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT freqtrade_overrides, freqai_overrides FROM strategy_alignments WHERE alignment_id = %s", (alignment_id,)
+        )
+        row = cur.fetchone()
+    if row is None:
+        raise LookupError(f"alignment not found: {alignment_id}")
+    return tuple(v if isinstance(v, dict) else json.loads(v or "{}") for v in row)
+
+
+def freqtrade_config(ft: dict[str, Any]) -> dict[str, Any]:
+    """Backtest settings from freqtrade overrides (timeframe, exchange, pairs, stoploss, fee, backtest spec)."""
+    cfg: dict[str, Any] = {}
+    if "timeframe" in ft:
+        cfg["timeframe"] = ft["timeframe"]
+    ex = ft.get("exchange") or {}
+    if ex.get("name"):
+        cfg["exchange"] = ex["name"]
+    if ex.get("pair_whitelist"):
+        # Futures pairs are written "BTC/USDT:USDT"; candles are stored under the spot form.
+        cfg["pairs"] = [p.split(":", 1)[0] for p in ex["pair_whitelist"]]
+    if ft.get("stoploss") is not None:
+        cfg["stoploss"] = float(ft["stoploss"])
+    if ft.get("fee") is not None:
+        cfg["fee_bps"] = float(ft["fee"]) * 1e4
+    if ft.get("backtest"):
+        cfg["strategy"] = ft["backtest"]
+    return cfg
+
+
+def resolve_config(payload: dict[str, Any], freqtrade_overrides: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Payload settings over freqtrade overrides (given, or the alignment's) over defaults.
+
+    Raises ValueError on bad input and LookupError for an unknown alignment.
+    """
+    cfg: dict[str, Any] = {"exchange": "binance", "timeframe": "5m", "fee_bps": 10.0, "slippage_bps": 5.0, "stoploss": None}
+    if freqtrade_overrides is None and payload.get("alignment_id"):
+        conn = signal_eval._connect()
+        try:
+            freqtrade_overrides, _ = load_alignment(conn, payload["alignment_id"])
+        finally:
+            conn.close()
+    cfg.update(freqtrade_config(freqtrade_overrides or {}))
+    cfg.update({k: v for k, v in payload.items() if k in CONFIG_KEYS and v is not None})
+    strategy = cfg.get("strategy")
+    if not isinstance(strategy, dict) or strategy.get("rule") not in RULE_DEFAULTS:
+        raise ValueError(f"strategy.rule must be one of: {', '.join(RULE_DEFAULTS)}")
+    if strategy.get("direction", "long") not in DIRECTIONS:
+        raise ValueError(f"strategy.direction must be one of: {', '.join(DIRECTIONS)}")
+    if cfg["timeframe"] not in TF_SECONDS:
+        raise ValueError(f"unsupported timeframe: {cfg['timeframe']}")
+    if not cfg.get("pairs"):
+        raise ValueError("pairs required")
+    if "start" not in cfg:
+        raise ValueError("start required")
+    cfg["start"] = int(cfg["start"])
+    cfg["end"] = int(cfg.get("end") or time.time())
+    return cfg
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=int(os.getenv("AGENT_BACKTEST_PROCESSES", str(os.cpu_count() or 1))))
+    return _pool
+
+
+def _drop_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    if _pool is pool:
+        _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_pairs(cfg: dict[str, Any], pairs: list[str] | None = None) -> list[dict[str, Any]]:
+    """Backtest `pairs` (default: all of the config's) in the process pool; results in completion order.
+
+    If a pool process dies (OOM kill, segfault) the pool is broken for good: it is replaced and the
+    pairs without a result yet are run once more on the new one.
+    """
+    pairs = cfg["pairs"] if pairs is None else pairs
+    job = {k: cfg[k] for k in CONFIG_KEYS if k != "pairs"}
+    results: list[dict[str, Any]] = []
+    todo = list(pairs)
+    for attempt in range(2):
+        pool = _get_pool()
+        try:
+            futures = {pool.submit(backtest_pair, {**job, "pair": pair}): pair for pair in todo}
+            for fut in as_completed(futures):
+                results.append(fut.result())
+                todo.remove(futures[fut])
+                report_progress(100 * len(results) / len(pairs), f"{len(results)}/{len(pairs)} pairs")
+            break
+        except BrokenProcessPool:
+            print(f"[agent] backtest process pool broke with {len(todo)} pairs left, starting a new one")
+            _drop_pool(pool)
+            if attempt:
+                raise
+    return results
+
+
+def portfolio(results: list[dict[str, Any]], tf_sec: int) -> dict[str, Any] | None:
+    """Equal-weight mix of the pair return series, rebalanced every bar."""
+    ok = [r for r in results if "ret" in r]
+    if not ok:
+        return None
+    ts = np.unique(np.concatenate([r["ts"] for r in ok]))
+    grid = np.zeros((len(ok), ts.size))
+    for i, r in enumerate(ok):
+        grid[i, np.searchsorted(ts, r["ts"])] = r["ret"]
+    ret = grid.mean(axis=0)
+    return {**stats(ret, tf_sec), "curve": curve(ts, ret)}
+
+
+def report(results: list[dict[str, Any]], tf_sec: int) -> dict[str, Any]:
+    out: dict[str, Any] = {
+        "pairs": {r["pair"]: r["stats"] for r in sorted(results, key=lambda r: r["pair"]) if "stats" in r},
+        "errors": {r["pair"]: r["error"] for r in results if "error" in r},
+    }
+    combined = portfolio(results, tf_sec)
+    if combined is not None:
+        out["portfolio"] = combined
+    return out
+
+
+def evaluate(cfg: dict[str, Any]) -> dict[str, Any]:
+    """Backtest a resolved config across its pairs and combine them into the portfolio."""
+    return report(run_pairs(cfg), TF_SECONDS[cfg["timeframe"]])
+
+
+def run(payload: dict[str, Any]) -> dict[str, Any]:
+    """Task `backtest.run`.
+
+    payload: strategy, pairs, start, end? (unix seconds), exchange="binance", timeframe="5m",
+    fee_bps=10, slippage_bps=5, stoploss?; or alignment_id to take them from the alignment's
+    freqtrade_overrides (payload keys still win).
+    """
+    try:
+        cfg = resolve_config(payload)
+    except (ValueError, LookupError) as e:
+        return {"ok": False, "error": str(e)}
+    started = time.monotonic()
+    report = evaluate(cfg)
+    return {"ok": True, "config": cfg, "elapsed_sec": round(time.monotonic() - started, 2), **report}
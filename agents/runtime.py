@@ -0,0 +1,452 @@
+"""Async task worker: a handler registry plus per-lane bounded sets of in-flight tasks.
+
+Handlers are plain functions `fn(payload: dict) -> dict`:
+- `async def` handlers run on the event loop (I/O bound work);
+- sync handlers registered with `cpu=True` run in a process pool, so one container uses every core;
+- other sync handlers run in a thread so they cannot stall the loop.
+
+Tasks come from the Redis Streams queue in task_queue.py. The backend routes each task to a lane;
+an agent serves the lanes in AGENT_LANES, each with its own slot limit, so a batch burst never takes
+the slots of interactive tasks. Within a lane the priority bands are read by smooth weighted
+round-robin (high 6 : normal 3 : low 1), so low priority is slowed down but never starved.
+
+A handler that raises is retried with backoff; a handler that returns `{"ok": False, ...}` has failed
+for good and is not retried. Handlers of any kind may call `report_progress()` to publish progress
+events (percent, message, partial results) that clients follow over GET /tasks/{id}/events.
+
+On SIGTERM/SIGINT the worker stops taking tasks and waits for in-flight ones, still heartbeating them so
+nobody reclaims them meanwhile; anything cut off stays pending in the group and is reclaimed by another agent.
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import signal
+import socket
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any
+
+import redis
+from redis.asyncio import Redis
+
+from scheduler import Scheduler, scheduler_from_env
+from task_queue import EVENTS_MAXLEN, LANES, PRIORITIES, Entry, TaskQueue, events_key, stream_key, task_key
+
+POLL_TIMEOUT_SEC = 1
+TERMINAL_STATUSES = {"done", "error", "dead"}
+PRIORITY_WEIGHTS = {"high": 6, "normal": 3, "low": 1}
+# Progress events without partial results are dropped if they come faster than this (100% always passes).
+PROGRESS_MIN_INTERVAL_SEC = 0.5
+
+Handler = Callable[[dict], Any]
+
+# Task being handled in the current context: set per asyncio task, copied into to_thread workers and
+# set explicitly in process-pool children by _call_with_task.
+_current_task: ContextVar[str | None] = ContextVar("current_task", default=None)
+_current_redis: ContextVar[Redis | None] = ContextVar("current_redis", default=None)
+_last_progress: dict[str, float] = {}
+_sync_redis: redis.Redis | None = None
+_pending_reports: set[asyncio.Task] = set()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _progress(percent: float | None, message: str | None, partial: Any) -> dict[str, Any]:
+    progress: dict[str, Any] = {}
+    if percent is not None:
+        progress["percent"] = round(float(percent), 2)
+    if message is not None:
+        progress["message"] = message
+    if partial is not None:
+        progress["partial"] = partial
+    return progress
+
+
+def _queue_progress(pipe, task_id: str, progress: dict[str, Any]) -> None:
+    fields = {"event": "progress"}
+    for name, value in progress.items():
+        fields[name] = json.dumps(value, ensure_ascii=False, default=str) if name == "partial" else str(value)
+    pipe.xadd(events_key(task_id), fields, maxlen=EVENTS_MAXLEN, approximate=True)
+    # Latest progress also lands on the hash for GET /tasks/{id}.
+    pipe.hset(task_key(task_id), "progress", json.dumps(progress, ensure_ascii=False, default=str))
+
+
+async def _publish_async(r: Redis, task_id: str, progress: dict[str, Any]) -> None:
+    pipe = r.pipeline(transaction=False)
+    _queue_progress(pipe, task_id, progress)
+    try:
+        await pipe.execute()
+    except Exception as e:  # noqa: BLE001
+        print(f"[agent] progress publish failed for {task_id}: {e}")
+
+
+def _publish_sync(task_id: str, progress: dict[str, Any]) -> None:
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    pipe = _sync_redis.pipeline(transaction=False)
+    _queue_progress(pipe, task_id, progress)
+    try:
+        pipe.execute()
+    except Exception as e:  # noqa: BLE001
+        print(f"[agent] progress publish failed for {task_id}: {e}")
+
+
+def report_progress(percent: float | None = None, message: str | None = None, partial: Any = None) -> None:
+    """Publish a progress event for the task the caller is handling; a no-op outside a task.
+
+    Works from async handlers (published in the background on the worker loop), thread handlers and
+    process-pool handlers (published with a per-process sync client).
+    """
+    task_id = _current_task.get()
+    if task_id is None:
+        return
+    now = time.monotonic()
+    if partial is None and (percent is None or percent < 100):
+        if now - _last_progress.get(task_id, 0.0) < PROGRESS_MIN_INTERVAL_SEC:
+            return
+    _last_progress[task_id] = now
+    progress = _progress(percent, message, partial)
+
+    r = _current_redis.get()
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None and r is not None:
+        report = loop.create_task(_publish_async(r, task_id, progress))
+        _pending_reports.add(report)
+        report.add_done_callback(_pending_reports.discard)
+    else:
+        _publish_sync(task_id, progress)
+
+
+def _call_with_task(fn: Handler, task_id: str, payload: dict) -> Any:
+    """Process-pool entry point: makes report_progress() inside `fn` address the right task."""
+    token = _current_task.set(task_id)
+    try:
+        return fn(payload)
+    finally:
+        _current_task.reset(token)
+        _last_progress.pop(task_id, None)
+
+
+def parse_lanes(spec: str) -> dict[str, int]:
+    """`interactive=4,default=16,batch=2` -> {lane: slots}."""
+    lanes: dict[str, int] = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, slots = item.partition("=")
+        name = name.strip()
+        if name not in LANES:
+            raise ValueError(f"unknown lane {name!r}; expected one of {', '.join(LANES)}")
+        lanes[name] = int(slots)
+        if lanes[name] <= 0:
+            raise ValueError(f"lane {name!r} needs at least one slot")
+    if not lanes:
+        raise ValueError("no lanes configured")
+    return lanes
+
+
+class Lane:
+    def __init__(self, name: str, slots: int) -> None:
+        self.name = name
+        self.slots = slots
+        self.streams = {band: stream_key(name, band) for band in PRIORITIES}
+        # Entries read from Redis (and pending under this consumer) that wait for a free slot.
+        self.backlog: deque[Entry] = deque()
+        # in-flight task -> (stream, entry id) it holds in the pending list
+        self.inflight: dict[asyncio.Task, tuple[str, str]] = {}
+        self._current = dict.fromkeys(PRIORITIES, 0)
+
+    def free(self) -> int:
+        return self.slots - len(self.inflight) - len(self.backlog)
+
+    def band_order(self) -> list[str]:
+        """Smooth weighted round-robin pick of the band to read first; the rest follow by priority."""
+        total = sum(PRIORITY_WEIGHTS.values())
+        for band in PRIORITIES:
+            self._current[band] += PRIORITY_WEIGHTS[band]
+        first = max(PRIORITIES, key=lambda band: self._current[band])
+        self._current[first] -= total
+        return [first, *(band for band in PRIORITIES if band != first)]
+
+
+class Worker:
+    def __init__(
+        self,
+        redis_url: str,
+        *,
+        lanes: dict[str, int],
+        processes: int,
+        drain_timeout: float = 300.0,
+        consumer: str | None = None,
+        max_attempts: int = 3,
+        claim_idle_sec: float = 60.0,
+        retry_base_sec: float = 5.0,
+        scheduler: Scheduler | None = None,
+    ) -> None:
+        self.redis_url = redis_url
+        self.lanes = {name: Lane(name, slots) for name, slots in lanes.items()}
+        self.processes = processes
+        self.drain_timeout = drain_timeout
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.max_attempts = max_attempts
+        self.claim_idle_sec = claim_idle_sec
+        self.retry_base_sec = retry_base_sec
+        self.scheduler = scheduler
+        self.handlers: dict[str, tuple[Handler, bool]] = {}
+        self._pool: ProcessPoolExecutor | None = None
+        self._lane_of = {stream: lane for lane in self.lanes.values() for stream in lane.streams.values()}
+        self._stop = asyncio.Event()
+
+    def register(self, task_type: str, fn: Handler, *, cpu: bool = False) -> None:
+        if cpu and inspect.iscoroutinefunction(fn):
+            raise ValueError(f"{task_type}: cpu handlers must be sync functions")
+        self.handlers[task_type] = (fn, cpu)
+
+    def handler(self, task_type: str, *, cpu: bool = False) -> Callable[[Handler], Handler]:
+        def decorator(fn: Handler) -> Handler:
+            self.register(task_type, fn, cpu=cpu)
+            return fn
+
+        return decorator
+
+    async def execute(self, task_type: str, payload: dict) -> dict:
+        entry = self.handlers.get(task_type)
+        if entry is None:
+            return {"ok": False, "error": f"unknown task type: {task_type}"}
+        fn, cpu = entry
+        if inspect.iscoroutinefunction(fn):
+            return await fn(payload)
+        if cpu:
+            loop = asyncio.get_running_loop()
+            for attempt in range(2):
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.processes)
+                pool = self._pool
+                try:
+                    return await loop.run_in_executor(pool, _call_with_task, fn, _current_task.get(), payload)
+                except BrokenProcessPool:
+                    # A pool process died (OOM kill, segfault) and took every task on the pool with it.
+                    # The first task to notice replaces the pool; each one is run once more on the new one.
+                    if self._pool is pool:
+                        print(f"[agent] process pool broke running {task_type}, starting a new one")
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        self._pool = None
+                    if attempt:
+                        raise
+        return await asyncio.to_thread(fn, payload)
+
+    async def process(self, q: TaskQueue, stream: str, entry_id: str, task_id: str) -> None:
+        r = q.r
+        key = task_key(task_id)
+        task = await r.hgetall(key)
+        if not task or task.get("status") in TERMINAL_STATUSES:
+            # Unknown id, or a redelivery of a task that settled right before its ack was lost.
+            await q.ack(stream, entry_id)
+            return
+
+        attempts = await r.hincrby(key, "attempts", 1)
+        if attempts > self.max_attempts:
+            # Reclaimed again after its worker died mid-task every time: likely the task kills workers.
+            status = await q.fail(stream, entry_id, task, attempts - 1, "worker lost during every attempt")
+            print(f"[agent] {task_id}: {status}")
+            return
+
+        started = datetime.now(timezone.utc)
+        try:
+            queue_wait_ms = int((started - datetime.fromisoformat(task["created_at"])).total_seconds() * 1000)
+        except (KeyError, ValueError):
+            queue_wait_ms = -1
+        await q.set_status(
+            task_id,
+            "running",
+            {"started_at": started.isoformat(), "worker": self.consumer, "queue_wait_ms": queue_wait_ms},
+        )
+
+        payload_raw = task.get("payload") or "{}"
+        try:
+            payload = json.loads(payload_raw)
+        except Exception:  # noqa: BLE001
+            payload = {"_raw": payload_raw}
+
+        # process() runs as its own asyncio task, so these stay local to this task.
+        _current_task.set(task_id)
+        _current_redis.set(r)
+        try:
+            result = await self.execute(task.get("type", ""), payload)
+        except Exception as e:  # noqa: BLE001
+            status = await q.fail(stream, entry_id, task, attempts, f"{type(e).__name__}: {e}")
+            print(f"[agent] {task_id}: attempt {attempts} failed, {status}")
+            return
+        finally:
+            _last_progress.pop(task_id, None)
+            # Progress published in the background must precede the terminal status event.
+            if _pending_reports:
+                await asyncio.wait(set(_pending_reports))
+
+        await q.settle(
+            stream,
+            entry_id,
+            task_id,
+            "done" if result.get("ok") else "error",
+            {"finished_at": _now(), "result": json.dumps(result, ensure_ascii=False, default=str)},
+        )
+        print(f"[agent] processed {task_id}: ok={bool(result.get('ok'))}")
+
+    def _held(self) -> list[tuple[str, str]]:
+        held: list[tuple[str, str]] = []
+        for lane in self.lanes.values():
+            held += lane.inflight.values()
+            held += [(stream, entry_id) for stream, entry_id, _ in lane.backlog]
+        return held
+
+    def _inflight(self) -> set[asyncio.Task]:
+        return {task for lane in self.lanes.values() for task in lane.inflight}
+
+    def _accept(self, entries: list[Entry]) -> None:
+        for entry in entries:
+            self._lane_of[entry[0]].backlog.append(entry)
+
+    async def maintain(self, q: TaskQueue) -> None:
+        """Heartbeat held entries, re-queue due retries and take over stale entries of dead consumers."""
+        await q.touch(self._held())
+        await q.promote_due()
+        await q.prune_consumers()
+        for lane in self.lanes.values():
+            for band in PRIORITIES:
+                if lane.free() > 0:
+                    self._accept(await q.claim_stale(lane.streams[band], lane.free()))
+
+    async def fill(self, q: TaskQueue) -> int:
+        """Non-blocking reads into every lane with free slots, bands in weighted round-robin order."""
+        fetched = 0
+        for lane in self.lanes.values():
+            for band in lane.band_order():
+                free = lane.free()
+                if free <= 0:
+                    break
+                entries = await q.read([lane.streams[band]], free)
+                self._accept(entries)
+                fetched += len(entries)
+        return fetched
+
+    def start(self, q: TaskQueue) -> None:
+        for lane in self.lanes.values():
+            while lane.backlog and len(lane.inflight) < lane.slots:
+                stream, entry_id, task_id = lane.backlog.popleft()
+                task = asyncio.create_task(self.process(q, stream, entry_id, task_id))
+                lane.inflight[task] = (stream, entry_id)
+                task.add_done_callback(lambda t, lane=lane: self._done(lane, t))
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except NotImplementedError:  # pragma: no cover - non-unix
+                pass
+
+        r = Redis.from_url(self.redis_url, decode_responses=True)
+        q = TaskQueue(
+            r,
+            self.consumer,
+            list(self._lane_of),
+            max_attempts=self.max_attempts,
+            claim_idle_sec=self.claim_idle_sec,
+            retry_base_sec=self.retry_base_sec,
+        )
+        lanes = ", ".join(f"{lane.name}={lane.slots}" for lane in self.lanes.values())
+        print(f"[agent] connected to redis: {self.redis_url} as {self.consumer} (lanes: {lanes}, processes={self.processes})")
+        maintain_every = max(1.0, self.claim_idle_sec / 3)
+        next_maintenance = 0.0
+        scheduling: asyncio.Task | None = None
+        try:
+            await q.setup()
+            if self.scheduler is not None:
+                scheduling = asyncio.create_task(self.scheduler.run(r, self._stop))
+            while not self._stop.is_set():
+                try:
+                    if time.monotonic() >= next_maintenance:
+                        await self.maintain(q)
+                        next_maintenance = time.monotonic() + maintain_every
+                    fetched = await self.fill(q)
+                    self.start(q)
+                    if fetched:
+                        continue
+                    # Nothing queued anywhere: block on every stream of lanes that could take a task. count=1
+                    # per stream keeps what a lane can receive beyond its free slots to one entry per band.
+                    waiting = [s for lane in self.lanes.values() if lane.free() > 0 for s in lane.streams.values()]
+                    if waiting:
+                        self._accept(await q.read(waiting, 1, POLL_TIMEOUT_SEC * 1000))
+                        self.start(q)
+                    else:
+                        await asyncio.wait(self._inflight(), timeout=POLL_TIMEOUT_SEC, return_when=asyncio.FIRST_COMPLETED)
+                except Exception as e:  # noqa: BLE001
+                    print(f"[agent] worker error: {e}")
+                    await asyncio.sleep(1)
+        finally:
+            if scheduling is not None:
+                await scheduling
+            await self.drain(q)
+            await r.aclose()
+
+    def _done(self, lane: Lane, task: asyncio.Task) -> None:
+        lane.inflight.pop(task, None)
+        if not task.cancelled() and task.exception() is not None:
+            # The entry stays pending and is reclaimed once its idle time passes claim_idle_sec.
+            print(f"[agent] task bookkeeping failed: {task.exception()}")
+
+    async def _heartbeat(self, q: TaskQueue) -> None:
+        """Keep touching in-flight entries; the main loop's maintain() no longer runs while draining."""
+        while True:
+            await asyncio.sleep(max(0.1, self.claim_idle_sec / 3))
+            try:
+                await q.touch([held for lane in self.lanes.values() for held in lane.inflight.values()])
+            except Exception as e:  # noqa: BLE001
+                print(f"[agent] heartbeat failed: {e}")
+
+    async def drain(self, q: TaskQueue | None = None) -> None:
+        # Backlog entries were never started; they stay pending and are reclaimed by another agent.
+        inflight = self._inflight()
+        if inflight:
+            print(f"[agent] draining {len(inflight)} in-flight task(s)")
+            heartbeat = asyncio.create_task(self._heartbeat(q)) if q is not None else None
+            try:
+                _, pending = await asyncio.wait(inflight, timeout=self.drain_timeout)
+            finally:
+                if heartbeat is not None:
+                    heartbeat.cancel()
+            for task in pending:
+                task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+
+def worker_from_env() -> Worker:
+    cpus = os.cpu_count() or 1
+    default_lanes = f"interactive={max(2, cpus)},default={cpus * 4},batch={cpus}"
+    consumer = os.getenv("AGENT_CONSUMER") or f"{socket.gethostname()}-{os.getpid()}"
+    return Worker(
+        os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+        lanes=parse_lanes(os.getenv("AGENT_LANES", default_lanes)),
+        processes=int(os.getenv("AGENT_PROCESSES", str(cpus))),
+        drain_timeout=float(os.getenv("AGENT_DRAIN_TIMEOUT_SEC", "300")),
+        consumer=consumer,
+        max_attempts=int(os.getenv("AGENT_MAX_ATTEMPTS", "3")),
+        claim_idle_sec=float(os.getenv("AGENT_CLAIM_IDLE_SEC", "60")),
+        retry_base_sec=float(os.getenv("AGENT_RETRY_BASE_SEC", "5")),
+        scheduler=scheduler_from_env(consumer),
+    )
@@ -0,0 +1,277 @@
+"""Recurring jobs: cron-style schedules that enqueue tasks onto the task queue.
+
+Every agent runs the scheduler loop, but only the holder of the Redis leader lease fires ticks. A
+schedule's next tick fires once `tick + jitter` has passed; jitter is derived from the schedule name
+and tick, so a new leader picks the same moment. Ticks missed while no leader was around are caught
+up, at most `catch_up` of them (the most recent ones). Tasks go through the backend's POST /tasks/batch
+with the idempotency key `schedule:{name}:{tick}`, so a tick fired twice around a leadership change
+still enqueues once.
+
+Schedules are read from AGENT_SCHEDULES_FILE (default: schedules.json next to this file), a list of:
+
+    {"name": "...", "cron": "m h dom mon dow" | "every_sec": N, "task": "type", "payload": {...},
+     "priority": "normal", "lane": null, "jitter_sec": 0, "catch_up": 1, "enabled": true}
+
+Payload strings `$tick`, `$tick-N` and `$tick+N` are replaced with the tick's unix time plus offset.
+Cron expressions are UTC and support `*`, `*/n`, `a-b`, `a-b/n` and comma lists; dow 0 or 7 is Sunday.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import requests
+from redis.asyncio import Redis
+
+LEASE_KEY = "trade:scheduler:leader"
+# schedule name -> last fired tick (unix seconds)
+LAST_KEY = "trade:scheduler:last"
+LEASE_SEC = 15
+TICK_SEC = 1.0
+ENQUEUE_TIMEOUT_SEC = 10
+DEFAULT_SCHEDULES_FILE = Path(__file__).with_name("schedules.json")
+
+# Take the lease if it is free, extend it if we hold it. ARGV = holder, lease ms.
+_LEASE_LUA = """
+local holder = redis.call('GET', KEYS[1])
+if holder == ARGV[1] then
+  redis.call('PEXPIRE', KEYS[1], ARGV[2])
+  return 1
+end
+if not holder then
+  redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+  return 1
+end
+return 0
+"""
+
+# Give the lease up on shutdown, only if we still hold it.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+_TICK_RE = re.compile(r"^\$tick(?:([+-])(\d+))?$")
+_CRON_RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _cron_field(spec: str, lo: int, hi: int) -> frozenset[int]:
+    values: set[int] = set()
+    for part in spec.split(","):
+        rng, _, step_s = part.partition("/")
+        step = int(step_s) if step_s else 1
+        if rng == "*":
+            start, end = lo, hi
+        elif "-" in rng:
+            a, b = rng.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = end = int(rng)
+            if step_s:
+                end = hi
+        if step <= 0 or start < lo or end > hi or start > end:
+            raise ValueError(f"cron field {spec!r} out of range {lo}-{hi}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class Cron:
+    def __init__(self, expr: str) -> None:
+        parts = expr.split()
+        if len(parts) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, dows = (
+            _cron_field(p, lo, hi) for p, (lo, hi) in zip(parts, _CRON_RANGES)
+        )
+        self.dows = frozenset(d % 7 for d in dows)
+        # Classic cron: when both day fields are restricted, either may match.
+        self._dom_any = parts[2] == "*"
+        self._dow_any = parts[4] == "*"
+
+    def _day_ok(self, dt: datetime) -> bool:
+        dom = dt.day in self.days
+        dow = (dt.isoweekday() % 7) in self.dows
+        if self._dom_any or self._dow_any:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, ts: int) -> int:
+        """First matching minute strictly after `ts` (unix seconds, UTC)."""
+        dt = datetime.fromtimestamp(ts - ts % 60, timezone.utc) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_ok(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return int(dt.timestamp())
+        raise ValueError(f"cron expression never matches: {self.expr!r}")
+
+
+@dataclass
+class Schedule:
+    name: str
+    task: str
+    cron: Cron | None = None
+    every_sec: int | None = None
+    payload: dict[str, Any] = field(default_factory=dict)
+    priority: str = "normal"
+    lane: str | None = None
+    jitter_sec: int = 0
+    catch_up: int = 1
+
+    @classmethod
+    def from_dict(cls, d: dict[str, Any]) -> "Schedule":
+        if ("cron" in d) == ("every_sec" in d):
+            raise ValueError(f"schedule {d.get('name')!r}: set exactly one of cron, every_sec")
+        every = int(d["every_sec"]) if "every_sec" in d else None
+        if every is not None and every <= 0:
+            raise ValueError(f"schedule {d['name']!r}: every_sec must be positive")
+        return cls(
+            name=d["name"],
+            task=d["task"],
+            cron=Cron(d["cron"]) if "cron" in d else None,
+            every_sec=every,
+            payload=d.get("payload") or {},
+            priority=d.get("priority", "normal"),
+            lane=d.get("lane"),
+            jitter_sec=int(d.get("jitter_sec", 0)),
+            catch_up=max(1, int(d.get("catch_up", 1))),
+        )
+
+    def next_after(self, ts: int) -> int:
+        if self.cron is not None:
+            return self.cron.next_after(ts)
+        return (ts // self.every_sec + 1) * self.every_sec
+
+    def jitter(self, tick: int) -> int:
+        if self.jitter_sec <= 0:
+            return 0
+        digest = hashlib.blake2b(f"{self.name}:{tick}".encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big") % (self.jitter_sec + 1)
+
+    def due_ticks(self, last: int, now: float) -> list[int]:
+        """Ticks after `last` whose fire time has passed, oldest first, capped to the last `catch_up`."""
+        due: list[int] = []
+        tick = self.next_after(last)
+        while tick + self.jitter(tick) <= now:
+            due.append(tick)
+            tick = self.next_after(tick)
+        return due[-self.catch_up :]
+
+
+def render_payload(payload: Any, tick: int) -> Any:
+    if isinstance(payload, dict):
+        return {k: render_payload(v, tick) for k, v in payload.items()}
+    if isinstance(payload, list):
+        return [render_payload(v, tick) for v in payload]
+    if isinstance(payload, str):
+        m = _TICK_RE.match(payload)
+        if m:
+            offset = int(m.group(2) or 0)
+            return tick - offset if m.group(1) == "-" else tick + offset
+    return payload
+
+
+def load_schedules(path: str | os.PathLike) -> list[Schedule]:
+    path = Path(path)
+    if not path.exists():
+        print(f"[scheduler] warning: schedules file {path} not found, no schedules loaded")
+        return []
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    schedules = [Schedule.from_dict(d) for d in raw if d.get("enabled", True)]
+    names = [s.name for s in schedules]
+    if len(names) != len(set(names)):
+        raise ValueError(f"{path}: duplicate schedule names")
+    return schedules
+
+
+class Scheduler:
+    def __init__(self, schedules: list[Schedule], holder: str, backend_url: str) -> None:
+        self.schedules = schedules
+        self.holder = holder
+        self.backend_url = backend_url.rstrip("/")
+        self.leader = False
+
+    def _enqueue(self, tasks: list[dict[str, Any]]) -> None:
+        resp = requests.post(f"{self.backend_url}/tasks/batch", json={"tasks": tasks}, timeout=ENQUEUE_TIMEOUT_SEC)
+        resp.raise_for_status()
+
+    async def tick(self, r: Redis, now: float | None = None) -> int:
+        """Fire due ticks of every schedule; returns the number of tasks submitted."""
+        now = time.time() if now is None else now
+        last = await r.hgetall(LAST_KEY)
+        fired = 0
+        for s in self.schedules:
+            if s.name not in last:
+                # New schedule: start with the next tick instead of replaying history.
+                await r.hsetnx(LAST_KEY, s.name, int(now))
+                continue
+            due = s.due_ticks(int(last[s.name]), now)
+            if not due:
+                continue
+            tasks = [
+                {
+                    "type": s.task,
+                    "payload": render_payload(s.payload, t),
+                    "priority": s.priority,
+                    "lane": s.lane,
+                    "idempotency_key": f"schedule:{s.name}:{t}",
+                }
+                for t in due
+            ]
+            try:
+                await asyncio.to_thread(self._enqueue, tasks)
+            except Exception as e:  # noqa: BLE001
+                # last stays put, so the ticks are retried (and caught up) on the next loop.
+                print(f"[scheduler] {s.name}: enqueue failed: {e}")
+                continue
+            await r.hset(LAST_KEY, s.name, due[-1])
+            fired += len(tasks)
+            print(f"[scheduler] {s.name}: enqueued {len(tasks)} run(s), last tick {due[-1]}")
+        return fired
+
+    async def run(self, r: Redis, stop: asyncio.Event) -> None:
+        if not self.schedules:
+            return
+        lease = r.register_script(_LEASE_LUA)
+        print(f"[scheduler] {len(self.schedules)} schedule(s): {', '.join(s.name for s in self.schedules)}")
+        try:
+            while not stop.is_set():
+                try:
+                    leader = bool(await lease(keys=[LEASE_KEY], args=[self.holder, LEASE_SEC * 1000]))
+                    if leader != self.leader:
+                        print(f"[scheduler] {'acquired' if leader else 'lost'} leader lease")
+                        self.leader = leader
+                    if leader:
+                        await self.tick(r)
+                except Exception as e:  # noqa: BLE001
+                    print(f"[scheduler] error: {e}")
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=TICK_SEC)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self.leader:
+                await r.register_script(_RELEASE_LUA)(keys=[LEASE_KEY], args=[self.holder])
+
+
+def scheduler_from_env(holder: str) -> Scheduler:
+    path = os.getenv("AGENT_SCHEDULES_FILE") or DEFAULT_SCHEDULES_FILE
+    schedules = [] if os.getenv("AGENT_SCHEDULER", "1") == "0" else load_schedules(path)
+    return Scheduler(schedules, holder, os.getenv("BACKEND_URL", "http://backend:8000"))
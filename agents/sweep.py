@@ -0,0 +1,368 @@
+"""Parameter sweeps over an alignment: `strategylab.alignment.propose` fans out, `.evaluate` backtests.
+
+propose (the coordinator) expands a search space over the alignment's freqtrade_overrides and
+freqai_overrides, resolves every candidate to a backtest config and hashes it. Configs already in the
+result cache (`trade:sweep:cache:{hash}`) are taken from there; the rest are enqueued through the
+backend's POST /tasks/batch as `strategylab.alignment.evaluate` tasks (batch lane), so every agent
+serving that lane picks up a share. The coordinator itself runs in the default lane: it mostly waits,
+and must not hold an interactive slot for the length of a sweep. Idempotency keys are
+`sweep:{sweep_id}:{hash}` and the sweep id is derived from the candidates, so a retried coordinator
+does not enqueue twice. While evaluations settle the coordinator publishes the current leaderboard as
+progress (GET /tasks/{id}/events).
+
+Early stopping is asynchronous successive halving: an evaluation backtests its pairs in `rungs`
+chunks and after each chunk records its score in the sweep's rung zset; once `min_peers` other
+candidates reached that rung, a candidate ranking below `stop_quantile` of them stops there. Only
+complete evaluations are cached.
+
+Space format (dotted paths into the overrides; values are a list or an inclusive min/max/step range):
+    {"freqtrade_overrides": {"backtest.params.fast": [10, 20, 30], "stoploss": {"min": -0.1, "max": -0.02, "step": 0.02}},
+     "freqai_overrides": {"model_training_parameters.n_estimators": [200, 800]}}
+It comes from the payload or from `sweep` in the alignment's freqtrade_overrides. The backtest engine
+only reads freqtrade-side settings, so candidates that differ only in FreqAI parameters share one
+evaluation (counted as `variants` on the leaderboard).
+"""
+
+import asyncio
+import copy
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import time
+from typing import Any
+
+import redis
+import requests
+from redis.asyncio import Redis
+
+import backtest
+import signal_eval
+from market_backfill import TF_SECONDS
+from runtime import TERMINAL_STATUSES, report_progress
+from task_queue import task_key
+
+EVALUATE_TASK = "strategylab.alignment.evaluate"
+CACHE_PREFIX = "trade:sweep:cache:"
+RUNG_PREFIX = "trade:sweep:rung:"
+CACHE_TTL_SEC = 7 * 86400
+RUNG_TTL_SEC = 7 * 86400
+SECTIONS = ("freqtrade_overrides", "freqai_overrides")
+METRICS = ("sharpe", "sortino", "total_return", "cagr", "max_drawdown")
+DEFAULT_LOOKBACK_SEC = 90 * 86400
+POLL_SEC = 1.0
+ENQUEUE_CHUNK = 5000
+ENQUEUE_TIMEOUT_SEC = 30
+
+SWEEP_DEFAULTS: dict[str, Any] = {
+    "metric": "sharpe",
+    "max_candidates": 200,
+    "seed": 0,
+    "rungs": 3,
+    "min_peers": 4,
+    "stop_quantile": 0.5,
+    "top": 10,
+    "timeout_sec": 6 * 3600,
+    "priority": "normal",
+}
+
+_sync_redis: redis.Redis | None = None
+
+
+def cache_key(config_hash: str) -> str:
+    return f"{CACHE_PREFIX}{config_hash}"
+
+
+def rung_key(sweep_id: str, rung: int) -> str:
+    return f"{RUNG_PREFIX}{sweep_id}:{rung}"
+
+
+def _hash(value: Any, size: int = 16) -> str:
+    raw = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode(), digest_size=size).hexdigest()
+
+
+def _deep_merge(base: dict, override: dict) -> dict:
+    out = copy.deepcopy(base)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _deep_merge(out[k], v)
+        else:
+            out[k] = copy.deepcopy(v)
+    return out
+
+
+def unflatten(flat: dict[str, Any]) -> dict[str, Any]:
+    out: dict[str, Any] = {}
+    for path, value in flat.items():
+        node = out
+        *parents, leaf = path.split(".")
+        for name in parents:
+            node = node.setdefault(name, {})
+        node[leaf] = value
+    return out
+
+
+def _values(path: str, spec: Any) -> list[Any]:
+    if isinstance(spec, list):
+        values = spec
+    elif isinstance(spec, dict) and {"min", "max", "step"} <= spec.keys():
+        lo, hi, step = spec["min"], spec["max"], spec["step"]
+        if step <= 0 or hi < lo:
+            raise ValueError(f"{path}: need step > 0 and max >= min")
+        n = int(math.floor((hi - lo) / step + 1e-9)) + 1
+        values = [lo + i * step for i in range(n)]
+        values = [int(v) if all(isinstance(x, int) for x in (lo, hi, step)) else round(v, 10) for v in values]
+    else:
+        raise ValueError(f"{path}: expected a list of values or a min/max/step range")
+    if not values:
+        raise ValueError(f"{path}: no values")
+    return values
+
+
+def expand(space: dict[str, Any], max_candidates: int, seed: int = 0) -> list[dict[str, dict[str, Any]]]:
+    """Candidates as flat {section: {path: value}}; the full grid, or a seeded sample of it if larger."""
+    unknown = set(space) - set(SECTIONS)
+    if unknown:
+        raise ValueError(f"space sections must be {' / '.join(SECTIONS)}, got: {', '.join(sorted(unknown))}")
+    dims = [(section, path, _values(path, spec)) for section in SECTIONS for path, spec in (space.get(section) or {}).items()]
+    total = math.prod(len(values) for _, _, values in dims)
+    if total <= max_candidates:
+        combos = itertools.product(*(values for _, _, values in dims))
+    else:
+        # Decode sampled grid indices (mixed radix), so huge grids are never materialized.
+        def combo(i: int) -> list[Any]:
+            picked = []
+            for _, _, values in reversed(dims):
+                i, j = divmod(i, len(values))
+                picked.append(values[j])
+            return picked[::-1]
+
+        combos = (combo(i) for i in sorted(random.Random(seed).sample(range(total), max_candidates)))
+    out = []
+    for combo_values in combos:
+        cand: dict[str, dict[str, Any]] = {section: {} for section in SECTIONS}
+        for (section, path, _), value in zip(dims, combo_values):
+            cand[section][path] = value
+        out.append(cand)
+    return out
+
+
+def plan(payload: dict[str, Any], ft: dict[str, Any]) -> tuple[dict[str, Any], dict[str, dict]]:
+    """(sweep settings, {config hash: {"config", "candidates"}}). Raises ValueError on bad input."""
+    settings = {**SWEEP_DEFAULTS, **{k: payload[k] for k in SWEEP_DEFAULTS if payload.get(k) is not None}}
+    if settings["metric"] not in METRICS:
+        raise ValueError(f"metric must be one of: {', '.join(METRICS)}")
+    if not 0 < float(settings["stop_quantile"]) < 1:
+        raise ValueError("stop_quantile must be between 0 and 1")
+    base = {k: v for k, v in payload.items() if k in backtest.CONFIG_KEYS}
+    # Day-aligned default, so the same sweep requested again that day maps to the same hashes.
+    base.setdefault("end", int(time.time()) // 86400 * 86400)
+    base.setdefault("start", int(base["end"]) - DEFAULT_LOOKBACK_SEC)
+
+    space = payload.get("space") or ft.get("sweep") or {}
+    ft = {k: v for k, v in ft.items() if k != "sweep"}
+    evaluations: dict[str, dict] = {}
+    for cand in expand(space, int(settings["max_candidates"]), int(settings["seed"])):
+        cand_ft = _deep_merge(ft, unflatten(cand["freqtrade_overrides"]))
+        config = backtest.resolve_config(base, cand_ft)
+        entry = evaluations.setdefault(_hash(config), {"config": config, "candidates": []})
+        entry["candidates"].append(cand)
+    return settings, evaluations
+
+
+def _score(port: dict[str, Any] | None, metric: str) -> float | None:
+    return None if port is None else port.get(metric)
+
+
+def _redis() -> redis.Redis:
+    global _sync_redis
+    if _sync_redis is None:
+        _sync_redis = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    return _sync_redis
+
+
+def evaluate(payload: dict[str, Any]) -> dict[str, Any]:
+    """Task `strategylab.alignment.evaluate`: one config of a sweep, stopping early if it falls behind.
+
+    payload: sweep_id, hash, config (resolved backtest config), metric, rungs, min_peers, stop_quantile.
+    """
+    r = _redis()
+    config_hash = payload["hash"]
+    cached = r.get(cache_key(config_hash))
+    if cached:
+        return {**json.loads(cached), "cached": True}
+
+    cfg, metric = payload["config"], payload["metric"]
+    tf_sec = TF_SECONDS[cfg["timeframe"]]
+    pairs = sorted(cfg["pairs"])
+    n = max(1, min(int(payload["rungs"]), len(pairs)))
+    chunks = [pairs[i * len(pairs) // n : (i + 1) * len(pairs) // n] for i in range(n)]
+
+    results: list[dict[str, Any]] = []
+    stopped = False
+    for rung, chunk in enumerate(chunks):
+        results += backtest.run_pairs(cfg, chunk)
+        port = backtest.portfolio(results, tf_sec)
+        score = _score(port, metric)
+        if rung == len(chunks) - 1:
+            break
+        key = rung_key(payload["sweep_id"], rung)
+        pipe = r.pipeline(transaction=True)
+        pipe.zadd(key, {config_hash: float("-inf") if score is None else score})
+        pipe.expire(key, RUNG_TTL_SEC)
+        pipe.zcard(key)
+        # Peers strictly worse; a candidate without a score has none.
+        pipe.zcount(key, "-inf", f"({score}" if score is not None else "(-inf")
+        _, _, count, below = pipe.execute()
+        peers = count - 1
+        if peers >= int(payload["min_peers"]) and below / peers < float(payload["stop_quantile"]):
+            stopped = True
+            break
+
+    summary = {
+        "ok": True,
+        "hash": config_hash,
+        "metric": metric,
+        "score": score,
+        "stopped": stopped,
+        "rung": rung,
+        "pairs_evaluated": sum(len(c) for c in chunks[: rung + 1]),
+        "stats": {k: v for k, v in (port or {}).items() if k != "curve"},
+        "errors": {x["pair"]: x["error"] for x in results if "error" in x},
+    }
+    if not stopped:
+        r.set(cache_key(config_hash), json.dumps(summary), ex=CACHE_TTL_SEC)
+    return summary
+
+
+def _enqueue(backend_url: str, tasks: list[dict[str, Any]]) -> list[str]:
+    ids: list[str] = []
+    for i in range(0, len(tasks), ENQUEUE_CHUNK):
+        resp = requests.post(f"{backend_url}/tasks/batch", json={"tasks": tasks[i : i + ENQUEUE_CHUNK]}, timeout=ENQUEUE_TIMEOUT_SEC)
+        resp.raise_for_status()
+        ids += [t["id"] for t in resp.json()["tasks"]]
+    return ids
+
+
+def leaderboard(rows: dict[str, dict[str, Any]], top: int) -> list[dict[str, Any]]:
+    """Complete evaluations first, then by score, best first."""
+    ranked = sorted(
+        rows.values(), key=lambda row: (not row["stopped"], -math.inf if row["score"] is None else row["score"]), reverse=True
+    )
+    return ranked[:top]
+
+
+def _load_alignment(alignment_id: str) -> tuple[dict, dict]:
+    conn = signal_eval._connect()
+    try:
+        return backtest.load_alignment(conn, alignment_id)
+    finally:
+        conn.close()
+
+
+async def propose(payload: dict[str, Any]) -> dict[str, Any]:
+    """Task `strategylab.alignment.propose`: sweep an alignment's overrides and rank the candidates.
+
+    payload: alignment_id, space?, backtest settings (pairs, start, end, timeframe, ...; end defaults to
+    the start of the current UTC day, start to 90 days before end) and sweep settings: metric="sharpe", max_candidates=200, seed=0, rungs=3,
+    min_peers=4, stop_quantile=0.5, top=10, timeout_sec=21600, priority="normal".
+    """
+    alignment_id = payload.get("alignment_id")
+    if not alignment_id:
+        return {"ok": False, "error": "alignment_id required"}
+    try:
+        ft, _ = await asyncio.to_thread(_load_alignment, alignment_id)
+        settings, evaluations = plan(payload, ft)
+    except (ValueError, LookupError) as e:
+        return {"ok": False, "error": str(e)}
+
+    hashes = sorted(evaluations)
+    sweep_id = _hash({"alignment_id": alignment_id, "hashes": hashes, **settings}, size=8)
+    rows: dict[str, dict[str, Any]] = {}
+
+    def add(result: dict[str, Any], *, cached: bool) -> None:
+        config_hash = result["hash"]
+        candidates = evaluations[config_hash]["candidates"]
+        rows[config_hash] = {
+            "hash": config_hash,
+            "score": result.get("score"),
+            "stopped": result.get("stopped", False),
+            "rung": result.get("rung"),
+            "cached": cached,
+            "overrides": candidates[0],
+            "variants": len(candidates),
+            "stats": result.get("stats") or {},
+        }
+
+    r = Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    try:
+        for config_hash, raw in zip(hashes, await r.mget([cache_key(h) for h in hashes]) if hashes else []):
+            if raw:
+                add(json.loads(raw), cached=True)
+        misses = [h for h in hashes if h not in rows]
+        tasks = [
+            {
+                "type": EVALUATE_TASK,
+                "payload": {
+                    "sweep_id": sweep_id,
+                    "hash": h,
+                    "config": evaluations[h]["config"],
+                    **{k: settings[k] for k in ("metric", "rungs", "min_peers", "stop_quantile")},
+                },
+                "priority": settings["priority"],
+                "idempotency_key": f"sweep:{sweep_id}:{h}",
+            }
+            for h in misses
+        ]
+        backend_url = os.getenv("BACKEND_URL", "http://backend:8000").rstrip("/")
+        pending = dict(zip(await asyncio.to_thread(_enqueue, backend_url, tasks), misses)) if tasks else {}
+        failed: dict[str, str] = {}
+        deadline = time.monotonic() + float(settings["timeout_sec"])
+        top = int(settings["top"])
+        reported = -1
+
+        while True:
+            settled = len(rows) + len(failed)
+            if settled != reported:
+                reported = settled
+                report_progress(
+                    100 * settled / max(1, len(hashes)),
+                    f"{settled}/{len(hashes)} evaluated, {sum(row['stopped'] for row in rows.values())} stopped early",
+                    {"sweep_id": sweep_id, "leaderboard": leaderboard(rows, top)},
+                )
+            if not pending or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(POLL_SEC)
+            pipe = r.pipeline(transaction=False)
+            for task_id in pending:
+                pipe.hmget(task_key(task_id), "status", "result", "last_error")
+            for (task_id, config_hash), (status, result, error) in zip(list(pending.items()), await pipe.execute()):
+                if status not in TERMINAL_STATUSES:
+                    continue
+                del pending[task_id]
+                parsed = json.loads(result) if result else {}
+                if status == "done" and parsed.get("ok"):
+                    add(parsed, cached=bool(parsed.get("cached")))
+                else:
+                    failed[config_hash] = parsed.get("error") or error or status
+    finally:
+        await r.aclose()
+
+    board = leaderboard(rows, top)
+    return {
+        "ok": True,
+        "sweep_id": sweep_id,
+        "alignment_id": alignment_id,
+        "metric": settings["metric"],
+        "candidates": sum(len(e["candidates"]) for e in evaluations.values()),
+        "evaluations": len(hashes),
+        "cached": sum(row["cached"] for row in rows.values()),
+        "stopped": sum(row["stopped"] for row in rows.values()),
+        "failed": failed,
+        "timed_out": bool(pending),
+        "leaderboard": board,
+        "best": board[0] if board and not board[0]["stopped"] else None,
+    }
@@ -0,0 +1,265 @@
+"""Consumer side of the Redis Streams task queue (producer: backend/app/services/task_queue.py).
+
+Every (lane, priority) pair is its own stream. Entries only carry task ids; state is in the
+`trade:tasks:{id}` hash. Delivery is at-least-once:
+- an entry stays in the group's pending list until the task settles, then it is acked and deleted;
+- entries of a consumer that stopped heartbeating for `claim_idle_sec` are taken over via XAUTOCLAIM;
+- a task that raised is retried with exponential backoff through a delayed zset, and after
+  `max_attempts` starts it is moved to the dead-letter stream.
+
+Status changes go through one script that also moves the task between the backend's sorted-set
+indexes (`trade:tasks:idx:*`), which back GET /tasks and retention, and appends a status event to
+the task's event stream (`trade:tasks:events:{id}`, served as SSE by the backend).
+"""
+
+import random
+import time
+from datetime import datetime, timezone
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+TASK_KEY_PREFIX = "trade:tasks:"
+TASK_STREAM_PREFIX = "trade:tasks:stream:"
+TASK_GROUP = "agents"
+DEAD_LETTER_STREAM = "trade:tasks:dead"
+DELAYED_KEY = "trade:tasks:delayed"
+LEGACY_QUEUE_KEY = "trade:tasks:queue"
+INDEX_PREFIX = "trade:tasks:idx:"
+EVENTS_PREFIX = "trade:tasks:events:"
+EVENTS_MAXLEN = 200
+# Event streams of settled tasks linger this long for late subscribers.
+EVENTS_TTL_MS = 3600 * 1000
+
+LANES = ("interactive", "default", "batch")
+PRIORITIES = ("high", "normal", "low")
+
+DEAD_LETTER_MAXLEN = 10_000
+PROMOTE_BATCH = 500
+# Consumers with nothing pending and idle this long are removed from the group.
+CONSUMER_IDLE_MS = 24 * 3600 * 1000
+
+# set_status() swaps the task between status indexes (scored by created_ms), for settled tasks adds
+# it to the finished index of its status, and appends a status event. A hash that no longer exists is left alone. Keys are
+# derived in-script, so this assumes a single Redis node.
+_LIB = """
+local IDX, EVENTS, EVENTS_MAXLEN, EVENTS_TTL_MS = '%s', '%s', '%d', %d
+local TERMINAL = {done = true, error = true, dead = true}
+
+local function set_status(key, task_id, status, finished_ms, fields)
+  local task_type = redis.call('HGET', key, 'type')
+  if not task_type then return 0 end
+  local old = redis.call('HGET', key, 'status')
+  local created = redis.call('HGET', key, 'created_ms') or 0
+  if old and old ~= status then
+    redis.call('ZREM', IDX .. 'status:' .. old, task_id)
+    redis.call('ZREM', IDX .. 'status_type:' .. old .. ':' .. task_type, task_id)
+  end
+  redis.call('ZADD', IDX .. 'status:' .. status, created, task_id)
+  redis.call('ZADD', IDX .. 'status_type:' .. status .. ':' .. task_type, created, task_id)
+  if finished_ms ~= '' then
+    redis.call('ZADD', IDX .. 'finished:' .. status, finished_ms, task_id)
+  end
+  redis.call('HSET', key, 'status', status, unpack(fields))
+  local events = EVENTS .. task_id
+  redis.call('XADD', events, 'MAXLEN', '~', EVENTS_MAXLEN, '*', 'event', 'status', 'status', status)
+  if TERMINAL[status] then
+    redis.call('PEXPIRE', events, EVENTS_TTL_MS)
+  end
+  return 1
+end
+""" % (INDEX_PREFIX, EVENTS_PREFIX, EVENTS_MAXLEN, EVENTS_TTL_MS)
+
+# KEYS[1] = task hash. ARGV = task id, status, finished ms or '', then field/value pairs.
+_STATUS_LUA = _LIB + """
+local fields = {}
+for i = 4, #ARGV do fields[#fields + 1] = ARGV[i] end
+return set_status(KEYS[1], ARGV[1], ARGV[2], ARGV[3], fields)
+"""
+
+# KEYS = delayed zset. ARGV = now, batch size, task hash prefix, fallback stream.
+# ZREM and XADD in one script, so with many agents each due retry is re-queued exactly once, onto the
+# stream recorded on its hash.
+_PROMOTE_LUA = _LIB + """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, task_id in ipairs(due) do
+  local key = ARGV[3] .. task_id
+  local stream = redis.call('HGET', key, 'stream') or ARGV[4]
+  redis.call('ZREM', KEYS[1], task_id)
+  if set_status(key, task_id, 'queued', '', {}) == 1 then
+    redis.call('XADD', stream, '*', 'id', task_id)
+  end
+end
+return #due
+"""
+
+Entry = tuple[str, str, str]  # stream, entry id, task id
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def task_key(task_id: str) -> str:
+    return f"{TASK_KEY_PREFIX}{task_id}"
+
+
+def events_key(task_id: str) -> str:
+    return f"{EVENTS_PREFIX}{task_id}"
+
+
+def stream_key(lane: str, priority: str) -> str:
+    return f"{TASK_STREAM_PREFIX}{lane}:{priority}"
+
+
+class TaskQueue:
+    def __init__(
+        self,
+        r: Redis,
+        consumer: str,
+        streams: list[str],
+        *,
+        max_attempts: int = 3,
+        claim_idle_sec: float = 60.0,
+        retry_base_sec: float = 5.0,
+        retry_max_sec: float = 300.0,
+    ) -> None:
+        self.r = r
+        self.consumer = consumer
+        self.streams = streams
+        self.max_attempts = max_attempts
+        self.claim_idle_ms = int(claim_idle_sec * 1000)
+        self.retry_base_sec = retry_base_sec
+        self.retry_max_sec = retry_max_sec
+        self._claim_cursors = {stream: "0-0" for stream in streams}
+        self._promote = r.register_script(_PROMOTE_LUA)
+        self._status = r.register_script(_STATUS_LUA)
+
+    async def setup(self) -> None:
+        for stream in self.streams:
+            try:
+                await self.r.xgroup_create(stream, TASK_GROUP, id="0", mkstream=True)
+            except ResponseError as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        # Tasks enqueued onto the old list before the upgrade.
+        moved = 0
+        fallback = stream_key("default", "normal")
+        while task_id := await self.r.lpop(LEGACY_QUEUE_KEY):
+            await self.r.xadd(fallback, {"id": task_id})
+            moved += 1
+        if moved:
+            print(f"[agent] moved {moved} task(s) from {LEGACY_QUEUE_KEY} to {fallback}")
+
+    async def read(self, streams: list[str], count: int, block_ms: int | None = None) -> list[Entry]:
+        resp = await self.r.xreadgroup(
+            TASK_GROUP, self.consumer, {stream: ">" for stream in streams}, count=count, block=block_ms
+        )
+        return [(stream, entry_id, fields.get("id", "")) for stream, entries in resp or [] for entry_id, fields in entries]
+
+    async def claim_stale(self, stream: str, count: int) -> list[Entry]:
+        """Take over entries whose consumer has not touched them for `claim_idle_sec`."""
+        next_id, entries, deleted = await self.r.xautoclaim(
+            stream, TASK_GROUP, self.consumer, self.claim_idle_ms, start_id=self._claim_cursors[stream], count=count
+        )
+        self._claim_cursors[stream] = next_id
+        if deleted:
+            await self.r.xack(stream, TASK_GROUP, *deleted)
+        return [(stream, entry_id, fields.get("id", "")) for entry_id, fields in entries if fields]
+
+    async def touch(self, entries: list[tuple[str, str]]) -> None:
+        """Heartbeat: reset the idle time of entries still held so nobody reclaims them."""
+        by_stream: dict[str, list[str]] = {}
+        for stream, entry_id in entries:
+            by_stream.setdefault(stream, []).append(entry_id)
+        for stream, ids in by_stream.items():
+            await self.r.xclaim(stream, TASK_GROUP, self.consumer, 0, ids, justid=True)
+
+    @staticmethod
+    def _status_args(task_id: str, status: str, fields: dict, finished: bool) -> list:
+        args: list = [task_id, status, int(time.time() * 1000) if finished else ""]
+        for name, value in fields.items():
+            args += [name, value]
+        return args
+
+    def queue_status(self, pipe: Pipeline, task_id: str, status: str, fields: dict, *, finished: bool = False) -> None:
+        # Queued as EVALSHA; the pipeline loads registered scripts Redis lacks.
+        pipe.scripts.add(self._status)
+        pipe.evalsha(self._status.sha, 1, task_key(task_id), *self._status_args(task_id, status, fields, finished))
+
+    async def set_status(self, task_id: str, status: str, fields: dict, *, finished: bool = False) -> None:
+        await self._status(keys=[task_key(task_id)], args=self._status_args(task_id, status, fields, finished))
+
+    async def settle(self, stream: str, entry_id: str, task_id: str, status: str, fields: dict) -> None:
+        """Record a final status and release the stream entry in one transaction."""
+        pipe = self.r.pipeline(transaction=True)
+        self.queue_status(pipe, task_id, status, fields, finished=True)
+        pipe.xack(stream, TASK_GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+
+    async def ack(self, stream: str, entry_id: str) -> None:
+        pipe = self.r.pipeline(transaction=True)
+        pipe.xack(stream, TASK_GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max_sec, self.retry_base_sec * 2 ** max(0, attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def fail(self, stream: str, entry_id: str, task: dict, attempts: int, error: str) -> str:
+        """Schedule a retry, or dead-letter the task once it used up its attempts. Returns the new status."""
+        task_id = task["id"]
+        pipe = self.r.pipeline(transaction=True)
+        if attempts >= self.max_attempts:
+            status = "dead"
+            pipe.xadd(
+                DEAD_LETTER_STREAM,
+                {
+                    "id": task_id,
+                    "type": task.get("type", ""),
+                    "lane": task.get("lane", ""),
+                    "attempts": attempts,
+                    "error": error,
+                    "failed_at": _now(),
+                },
+                maxlen=DEAD_LETTER_MAXLEN,
+                approximate=True,
+            )
+            self.queue_status(pipe, task_id, status, {"last_error": error, "finished_at": _now()}, finished=True)
+        else:
+            status = "retrying"
+            due = time.time() + self.backoff(attempts)
+            pipe.zadd(DELAYED_KEY, {task_id: due})
+            self.queue_status(
+                pipe,
+                task_id,
+                status,
+                {"last_error": error, "next_attempt_at": datetime.fromtimestamp(due, timezone.utc).isoformat()},
+            )
+        pipe.xack(stream, TASK_GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        await pipe.execute()
+        return status
+
+    async def promote_due(self, now: float | None = None) -> int:
+        """Move retries whose backoff has elapsed back onto their streams."""
+        now = time.time() if now is None else now
+        total = 0
+        while True:
+            n = int(
+                await self._promote(
+                    keys=[DELAYED_KEY], args=[now, PROMOTE_BATCH, TASK_KEY_PREFIX, stream_key("default", "normal")]
+                )
+            )
+            total += n
+            if n < PROMOTE_BATCH:
+                return total
+
+    async def prune_consumers(self) -> None:
+        for stream in self.streams:
+            for c in await self.r.xinfo_consumers(stream, TASK_GROUP):
+                if c["name"] != self.consumer and not c["pending"] and c["idle"] > CONSUMER_IDLE_MS:
+                    await self.r.xgroup_delconsumer(stream, TASK_GROUP, c["name"])
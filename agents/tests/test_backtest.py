@@ -0,0 +1,99 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import backtest
+from backtest import CONFIG_KEYS, _covered_until, positions, simulate, stats
+
+
+def _candles(close: list[float], **overrides: list[float]) -> dict[str, np.ndarray]:
+    c = {"ts": np.arange(len(close), dtype=np.int64) * 60, "close": np.asarray(close, dtype=np.float64)}
+    for name in ("open", "high", "low"):
+        c[name] = np.asarray(overrides.get(name, close), dtype=np.float64)
+    return c
+
+
+def test_positions_sma_cross_both_directions() -> None:
+    c = _candles([1, 2, 3, 4, 3, 2, 1, 2])
+    pos = positions(c, {"rule": "sma_cross", "direction": "both", "params": {"fast": 2, "slow": 3}}, tf_sec=60)
+    # no signal until the slow average exists, then long on the way up and short on the way down
+    assert pos.tolist() == [0, 0, 1, 1, 1, -1, -1, -1]
+    long_only = positions(c, {"rule": "sma_cross", "params": {"fast": 2, "slow": 3}}, tf_sec=60)
+    assert long_only.tolist() == [0, 0, 1, 1, 1, 0, 0, 0]
+
+
+def test_simulate_stop_fills_at_stop_or_gapped_open() -> None:
+    close = [10, 11, 12, 11, 9, 10]
+    target = np.array([1, 1, 1, 1, 1, 0])
+    sim = simulate(_candles(close, low=[10, 11, 12, 8, 9, 10], open=[10, 11, 12, 11.5, 9, 10]), target, fee_bps=0, slippage_bps=0, stoploss=-0.05)
+    # the stop at 9.5 is hit inside bar 3; the trade is flat from there even though the target stays long
+    assert sim["position"].tolist() == [1, 1, 1, 0, 0, 0]
+    assert sim["ret"][3] == pytest.approx(9.5 / 12 - 1)
+    assert sim["trade_pnl"] == pytest.approx([-0.05])
+    assert sim["trade_bars"].tolist() == [3]
+
+    # bar 3 opens below the stop: filled at the open
+    gapped = simulate(_candles(close, low=[10, 11, 12, 8, 9, 10], open=[10, 11, 12, 9, 9, 10]), target, fee_bps=0, slippage_bps=0, stoploss=-0.05)
+    assert gapped["ret"][3] == pytest.approx(9 / 12 - 1)
+    assert gapped["trade_pnl"] == pytest.approx([-0.1])
+
+
+def test_simulate_flip_charges_both_legs() -> None:
+    sim = simulate(_candles([10, 11, 12, 11, 9, 10]), np.array([0, 1, 1, -1, -1, 0]), fee_bps=10, slippage_bps=0, stoploss=None)
+    cost = 0.001
+    assert sim["ret"] == pytest.approx([0, -cost, 12 / 11 - 1, (11 / 12 - 1) - 2 * cost, -(9 / 11 - 1), -(10 / 9 - 1) - cost])
+    assert sim["fees"].sum() == pytest.approx(4 * cost)
+    assert sim["trade_pnl"] == pytest.approx([11 / 11 - 1 - 2 * cost, -(10 / 11 - 1) - 2 * cost])
+    assert sim["trade_bars"].tolist() == [2, 2]
+    assert sim["equity"][-1] == pytest.approx(np.prod(1 + sim["ret"]))
+
+
+def test_stats() -> None:
+    ret = np.array([0.1, -0.05, 0.02, 0.0])
+    sim = {
+        "trade_pnl": np.array([0.1, -0.05]),
+        "trade_bars": np.array([1, 3]),
+        "position": np.array([1, 1, 0, 0]),
+        "fees": np.array([0.001, 0.0, 0.001, 0.0]),
+    }
+    out = stats(ret, 86400, sim)
+    assert out["bars"] == 4
+    assert out["total_return"] == pytest.approx(1.1 * 0.95 * 1.02 - 1, abs=1e-6)
+    assert out["max_drawdown"] == pytest.approx(-0.05)
+    assert out["sharpe"] > 0 and out["sortino"] > out["sharpe"]
+    assert (out["trades"], out["win_rate"], out["profit_factor"], out["exposure"]) == (2, 0.5, 2.0, 0.5)
+    assert out["avg_bars_held"] == 2.0 and out["fees"] == 0.002
+    assert stats(np.zeros(3), 60)["sharpe"] is None
+    assert stats(np.empty(0), 60) == {"bars": 0}
+
+
+def test_mirror_covers_only_the_gap_free_prefix() -> None:
+    ts = np.array([0, 60, 120, 240, 300], dtype=np.int64)
+    assert _covered_until(ts, 0, 360, 60) == 180
+    assert _covered_until(ts[:3], 0, 1000, 60) == 180
+    assert _covered_until(ts, 0, 150, 60) == 120
+    assert _covered_until(ts[1:], 0, 360, 60) == 0
+
+
+def _crash_on(job: dict) -> dict:
+    # The first job for pair "b" kills its pool process; the marker file makes the rerun succeed.
+    marker = Path(job["exchange"])
+    if job["pair"] == "b" and not marker.exists():
+        marker.touch()
+        os._exit(1)
+    return {"pair": job["pair"], "pid": os.getpid()}
+
+
+def test_run_pairs_replaces_a_broken_pool(monkeypatch, tmp_path) -> None:
+    monkeypatch.setenv("AGENT_BACKTEST_PROCESSES", "1")
+    monkeypatch.setattr(backtest, "_pool", None)
+    monkeypatch.setattr(backtest, "backtest_pair", _crash_on)
+    cfg = {**dict.fromkeys(CONFIG_KEYS), "exchange": str(tmp_path / "crashed"), "pairs": ["a", "b", "c"]}
+    try:
+        results = backtest.run_pairs(cfg)
+        assert sorted(r["pair"] for r in results) == ["a", "b", "c"]
+        assert backtest.run_pairs(cfg, ["d"])[0]["pid"] == results[-1]["pid"]
+    finally:
+        backtest._pool.shutdown(wait=True)
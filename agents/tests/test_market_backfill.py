@@ -0,0 +1,131 @@
+import asyncio
+import dataclasses
+import time
+
+import fakeredis
+
+import market_backfill
+from market_backfill import COVERAGE_KEY, Backfill, RateBudget, Series, resume_from, stored_coverage
+
+H = 3_600_000
+
+
+def test_resume_from_continues_only_inside_the_covered_range() -> None:
+    assert resume_from(None, 10 * H, 20 * H) == (10 * H, 10 * H)
+    assert resume_from(f"{5 * H}:{12 * H}", 10 * H, 20 * H) == (5 * H, 12 * H)
+    # covered past the requested end: nothing left to fetch
+    assert resume_from(f"{5 * H}:{30 * H}", 10 * H, 20 * H) == (5 * H, 20 * H)
+    # start outside the covered range: a fresh origin
+    assert resume_from(f"{12 * H}:{15 * H}", 10 * H, 20 * H) == (10 * H, 10 * H)
+
+
+def test_stored_bars_count_only_when_gap_free_from_start() -> None:
+    start = 36_000
+    assert stored_coverage(start, start + 3 * 3600, 4, start * 1000, H) == f"{start * 1000}:{start * 1000 + 4 * H}"
+    assert stored_coverage(None, None, 0, start * 1000, H) is None
+    # a recent bar from another writer with the history still missing
+    assert stored_coverage(start + 9 * 3600, start + 9 * 3600, 1, start * 1000, H) is None
+    assert stored_coverage(start, start + 3 * 3600, 3, start * 1000, H) is None
+
+
+def test_series_windows_are_page_sized_and_clamped() -> None:
+    s = Series("BTC/USDT", "BTCUSDT", "1h", 0, 25 * H, resume_ms=2 * H)
+    assert s.windows(10) == [(2 * H, 12 * H), (12 * H, 22 * H), (22 * H, 25 * H)]
+    s.resume_ms = s.end_ms
+    assert s.windows(10) == []
+
+
+def test_rate_budget_spends_the_burst_then_paces() -> None:
+    async def run() -> list[int]:
+        budget = RateBudget(20.0, 2)
+        served: list[int] = []
+
+        async def take(i: int) -> None:
+            await budget.acquire()
+            served.append(i)
+
+        started = time.monotonic()
+        await take(0)
+        await take(1)
+        assert time.monotonic() - started < 0.04
+        tasks = [asyncio.create_task(take(i)) for i in range(2, 5)]
+        await asyncio.gather(*tasks)
+        # three more tokens at 20/s
+        assert time.monotonic() - started >= 0.14
+        return served
+
+    assert asyncio.run(run()) == [0, 1, 2, 3, 4]
+
+
+class _Cursor:
+    def __init__(self, conn: "_Conn") -> None:
+        self.conn = conn
+
+    def __enter__(self) -> "_Cursor":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        return None
+
+    def execute(self, sql: str, params: tuple) -> None:
+        self.conn.queries.append(params)
+
+    def fetchone(self) -> tuple:
+        return self.conn.stored
+
+
+class _Conn:
+    def __init__(self, stored: tuple = (None, None, 0)) -> None:
+        self.stored = stored
+        self.queries: list[tuple] = []
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self)
+
+
+def test_writer_checkpoints_after_commit_and_in_order(monkeypatch) -> None:
+    events: list[tuple[str, int]] = []
+
+    async def get(exchange, budget, symbol, tf, start_ms, end_ms):
+        # later windows answer first
+        await asyncio.sleep((30 * H - start_ms) / H * 0.002)
+        return [(ts, 1.0, 1.0, 1.0, 1.0, 1.0) for ts in range(start_ms, end_ms, H)]
+
+    def upsert(self, batch) -> None:
+        events.append(("upsert", max(row[0] for _, rows in batch for row in rows)))
+
+    monkeypatch.setattr(market_backfill, "_get", get)
+    monkeypatch.setattr(market_backfill, "LOOKAHEAD", 3)
+    monkeypatch.setattr(market_backfill, "UPSERT_ROWS", 1)
+    monkeypatch.setattr(market_backfill, "report_progress", lambda *a, **k: None)
+    monkeypatch.setattr(Backfill, "_upsert", upsert)
+    monkeypatch.setitem(market_backfill.EXCHANGES, "binance", dataclasses.replace(market_backfill.EXCHANGES["binance"], page=4))
+
+    async def run() -> None:
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        hset = r.hset
+
+        async def recording_hset(key, mapping):
+            events.append(("checkpoint", int(mapping["binance:BTCUSDT:1h"].split(":")[1])))
+            return await hset(key, mapping=mapping)
+
+        r.hset = recording_hset
+        conn = _Conn(stored=(0, 3 * 3600, 4))
+        s = Series("BTC/USDT", "BTCUSDT", "1h", 0, 30 * H)
+        backfill = Backfill(r, conn, "binance", [s], rate=1000)
+        await backfill.run()
+
+        assert conn.queries and (s.origin_ms, s.resume_ms) == (0, 4 * H)
+        assert await r.hget(COVERAGE_KEY, "binance:BTCUSDT:1h") == f"0:{30 * H}"
+        assert s.rows == 26
+
+    asyncio.run(run())
+    checkpoints = [v for kind, v in events if kind == "checkpoint"]
+    assert checkpoints == sorted(checkpoints) and checkpoints[-1] == 30 * H
+    # every checkpoint follows the commit of the bars below it
+    upserted = 0
+    for kind, value in events:
+        if kind == "upsert":
+            upserted = max(upserted, value)
+        else:
+            assert value <= upserted + H
@@ -0,0 +1,125 @@
+import asyncio
+import os
+from pathlib import Path
+
+import fakeredis
+
+from runtime import Worker
+from task_queue import DEAD_LETTER_STREAM, DELAYED_KEY, TASK_GROUP, TaskQueue, stream_key, task_key
+
+STREAM = stream_key("default", "normal")
+
+
+async def _queue(r, consumer: str, **kwargs) -> TaskQueue:
+    q = TaskQueue(r, consumer, [STREAM], **kwargs)
+    await q.setup()
+    return q
+
+
+async def _enqueue(r, task_id: str, task_type: str = "t") -> None:
+    await r.hset(
+        task_key(task_id),
+        mapping={"id": task_id, "type": task_type, "status": "queued", "created_ms": 1, "stream": STREAM, "lane": "default"},
+    )
+    await r.xadd(STREAM, {"id": task_id})
+
+
+def _worker(**kwargs) -> Worker:
+    return Worker("redis://unused", lanes={"default": 2}, processes=1, **kwargs)
+
+
+def test_stale_entries_are_claimed_unless_touched() -> None:
+    async def run() -> None:
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        a = await _queue(r, "a", claim_idle_sec=0.05)
+        b = await _queue(r, "b", claim_idle_sec=0.05)
+        await _enqueue(r, "t1")
+        ((stream, entry_id, task_id),) = await a.read([STREAM], 10)
+
+        await asyncio.sleep(0.1)
+        await a.touch([(stream, entry_id)])
+        assert await b.claim_stale(STREAM, 10) == []
+
+        await asyncio.sleep(0.1)
+        assert await b.claim_stale(STREAM, 10) == [(STREAM, entry_id, "t1")]
+
+    asyncio.run(run())
+
+
+def test_raising_handler_is_retried_then_dead_lettered() -> None:
+    async def run() -> None:
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        q = await _queue(r, "a", max_attempts=2, retry_base_sec=0.01)
+        worker = _worker(max_attempts=2)
+
+        @worker.handler("t")
+        async def boom(payload: dict) -> dict:
+            raise RuntimeError("boom")
+
+        await _enqueue(r, "t1")
+        for expected in ("retrying", "dead"):
+            ((stream, entry_id, task_id),) = await q.read([STREAM], 10)
+            await worker.process(q, stream, entry_id, task_id)
+            task = await r.hgetall(task_key("t1"))
+            assert task["status"] == expected and task["last_error"] == "RuntimeError: boom"
+            assert (await r.xpending(STREAM, TASK_GROUP))["pending"] == 0
+            if expected == "retrying":
+                assert await r.zscore(DELAYED_KEY, "t1") is not None
+                assert await q.promote_due(now=1e12) == 1
+                assert (await r.hgetall(task_key("t1")))["status"] == "queued"
+
+        (dead,) = await r.xrange(DEAD_LETTER_STREAM)
+        assert dead[1]["id"] == "t1" and dead[1]["attempts"] == "2"
+        assert await r.xlen(STREAM) == 0
+
+    asyncio.run(run())
+
+
+def test_drain_keeps_heartbeating_in_flight_tasks() -> None:
+    async def run() -> None:
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        q = await _queue(r, "a", claim_idle_sec=0.3)
+        other = await _queue(r, "b", claim_idle_sec=0.3)
+        worker = _worker(claim_idle_sec=0.3)
+
+        @worker.handler("t")
+        async def slow(payload: dict) -> dict:
+            await asyncio.sleep(0.8)
+            return {"ok": True}
+
+        await _enqueue(r, "t1")
+        worker._accept(await q.read([STREAM], 10))
+        worker.start(q)
+        draining = asyncio.create_task(worker.drain(q))
+        claimed = []
+        for _ in range(6):
+            await asyncio.sleep(0.12)
+            claimed += await other.claim_stale(STREAM, 10)
+        await draining
+
+        assert claimed == []
+        assert (await r.hgetall(task_key("t1")))["status"] == "done"
+
+    asyncio.run(run())
+
+
+def _crash_once(payload: dict) -> dict:
+    marker = Path(payload["marker"])
+    if not marker.exists():
+        marker.touch()
+        os._exit(1)
+    return {"ok": True, "pid": os.getpid()}
+
+
+def test_broken_process_pool_is_replaced(tmp_path) -> None:
+    async def run() -> None:
+        worker = _worker()
+        worker.register("t", _crash_once, cpu=True)
+        try:
+            first = await worker.execute("t", {"marker": str(tmp_path / "crashed")})
+            again = await worker.execute("t", {"marker": str(tmp_path / "crashed")})
+        finally:
+            worker._pool.shutdown(wait=True)
+        assert first["ok"] and again["pid"] == first["pid"]
+
+    asyncio.run(run())
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from scheduler import DEFAULT_SCHEDULES_FILE, Cron, Schedule, load_schedules, render_payload
+
+
+def _ts(*args: int) -> int:
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+def test_cron_parsing() -> None:
+    cron = Cron("*/15 9-17/4 1,15 * 7")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == {9, 13, 17}
+    assert cron.days == {1, 15}
+    assert cron.months == set(range(1, 13))
+    assert cron.dows == {0}
+    assert Cron("5/20 * * * *").minutes == {5, 25, 45}
+
+    for expr in ("* * * *", "60 * * * *", "* * 0 * *", "5-1 * * * *", "*/0 * * * *", "x * * * *"):
+        with pytest.raises(ValueError):
+            Cron(expr)
+
+
+def test_cron_next_after() -> None:
+    assert Cron("*/15 * * * *").next_after(_ts(2026, 1, 1, 10, 15)) == _ts(2026, 1, 1, 10, 30)
+    assert Cron("*/15 * * * *").next_after(_ts(2026, 1, 1, 10, 14, 59)) == _ts(2026, 1, 1, 10, 15)
+    assert Cron("30 23 31 12 *").next_after(_ts(2026, 6, 1)) == _ts(2026, 12, 31, 23, 30)
+    # Feb 29th: the next leap year
+    assert Cron("0 0 29 2 *").next_after(_ts(2026, 3, 1)) == _ts(2028, 2, 29)
+    # both day fields restricted: either matches (2026-01-05 is a Monday)
+    assert Cron("0 12 10 * 1").next_after(_ts(2026, 1, 1)) == _ts(2026, 1, 5, 12)
+    # only dow restricted: it alone decides
+    assert Cron("0 12 * * 1").next_after(_ts(2026, 1, 5, 12)) == _ts(2026, 1, 12, 12)
+    with pytest.raises(ValueError):
+        Cron("0 0 31 2 *").next_after(_ts(2026, 1, 1))
+
+
+def test_due_ticks_catch_up_and_jitter() -> None:
+    hourly = Schedule.from_dict({"name": "h", "task": "ping", "cron": "0 * * * *", "catch_up": 2})
+    last = _ts(2026, 1, 1, 0)
+    assert hourly.due_ticks(last, _ts(2026, 1, 1, 0, 59)) == []
+    assert hourly.due_ticks(last, _ts(2026, 1, 1, 1)) == [_ts(2026, 1, 1, 1)]
+    # five ticks missed: only the two most recent fire
+    assert hourly.due_ticks(last, _ts(2026, 1, 1, 5, 30)) == [_ts(2026, 1, 1, 4), _ts(2026, 1, 1, 5)]
+
+    jittered = Schedule.from_dict({"name": "j", "task": "ping", "every_sec": 60, "jitter_sec": 30})
+    tick = 6000
+    delay = jittered.jitter(tick)
+    assert 0 <= delay <= 30 and delay == jittered.jitter(tick)
+    assert jittered.due_ticks(tick - 60, tick + delay - 1) == []
+    assert jittered.due_ticks(tick - 60, tick + delay) == [tick]
+
+    with pytest.raises(ValueError):
+        Schedule.from_dict({"name": "x", "task": "ping", "cron": "* * * * *", "every_sec": 60})
+    assert render_payload({"start": "$tick-60", "end": ["$tick", "$tick+5"], "k": "$ticks"}, 100) == {
+        "start": 40,
+        "end": [100, 105],
+        "k": "$ticks",
+    }
+
+
+def test_missing_schedules_file_warns(tmp_path, capsys) -> None:
+    assert load_schedules(tmp_path / "schedules.json") == []
+    assert "not found" in capsys.readouterr().out
+
+
+def test_daily_evaluation_covers_a_whole_day_whose_horizon_has_passed() -> None:
+    (daily,) = [s for s in load_schedules(DEFAULT_SCHEDULES_FILE) if s.name == "signals-evaluate-daily"]
+    tick = daily.next_after(_ts(2026, 3, 9, 12))
+    payload = render_payload(daily.payload, tick)
+    assert (payload["start"], payload["end"]) == (_ts(2026, 3, 8), _ts(2026, 3, 9))
+    assert payload["end"] + payload["horizon_sec"] <= tick
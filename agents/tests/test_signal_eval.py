@@ -0,0 +1,68 @@
+import numpy as np
+
+from signal_eval import SIGNAL_COLUMNS, asof_prices, evaluate
+
+H = 3600
+
+
+def _candles(first: int, closes: list[float], tf: int = H) -> tuple[np.ndarray, np.ndarray]:
+    return np.arange(first, first + len(closes) * tf, tf, dtype=np.int64), np.asarray(closes, dtype=np.float64)
+
+
+def _signals(*rows: tuple) -> dict[str, np.ndarray]:
+    return {name: np.asarray(col, dtype=object) for name, col in zip(SIGNAL_COLUMNS, zip(*rows))}
+
+
+def test_asof_takes_the_last_closed_candle_within_tolerance() -> None:
+    candles = {"A": _candles(0, [1.0, 2.0, 3.0])}
+    at = np.array([H - 1, H, 2 * H + 10, 3 * H, 5 * H, 5 * H + 1])
+    out = asof_prices(candles, np.zeros(at.size, dtype=np.int64), ["A"], at, H, 2 * H)
+    # the candle opened at 0 closes at H; the last one closes at 3H and is usable until 5H
+    assert np.array_equal(out, [np.nan, 1.0, 2.0, 3.0, 3.0, np.nan], equal_nan=True)
+
+
+def test_asof_never_falls_back_into_another_pair() -> None:
+    # B starts late and C has no candles: their queries must not pick up A's or B's closes
+    candles = {"A": _candles(0, [1.0, 2.0]), "B": _candles(10 * H, [7.0])}
+    codes = np.array([0, 1, 1, 2])
+    at = np.array([2 * H, 2 * H, 11 * H, 11 * H])
+    out = asof_prices(candles, codes, ["A", "B", "C"], at, H, 100 * H)
+    assert np.array_equal(out, [2.0, np.nan, 7.0, np.nan], equal_nan=True)
+
+
+def test_hit_rate_and_pnl_are_net_of_fees() -> None:
+    # closes rise 100 -> 110 over the day; candles cover 48h so the 24h exits exist
+    candles = {"BTC/USDT": _candles(-H, list(np.linspace(100.0, 110.0, 25)) + [110.0] * 24)}
+    signals = _signals(
+        ("p", "BTC/USDT", 0, "buy", 0.9, None),
+        ("p", "BTC/USDT", 0, "sell", 0.3, None),
+        ("p", "BTC/USDT", 0, "hold", 0.5, None),
+        ("q", "ETH/USDT", 0, "buy", 0.9, None),
+    )
+    report = evaluate(signals, candles, timeframe="1h", horizon_sec=24 * H, fee_bps=10)
+    assert (report["signals"], report["priced"]) == (4, 3)
+    p = report["providers"]["p"]
+    assert p["signals"] == 2 and p["hit_rate"] == 0.5
+    # +10% and -10%, minus 2 x 10 bps each
+    assert np.isclose(p["pnl"], -0.004) and np.isclose(p["pairs"]["BTC/USDT"]["avg_pnl"], -0.002)
+    assert report["providers"]["q"]["signals"] == 0 and report["providers"]["q"]["hit_rate"] is None
+
+
+def test_calibration_bins_group_by_confidence() -> None:
+    candles = {"X": _candles(-H, [100.0, 101.0, 102.0])}
+    rows = [("p", "X", 0, "buy", c, None) for c in (0.05, 0.91, 0.95, 1.0)] + [("p", "X", 0, "sell", 0.92, None)]
+    report = evaluate(_signals(*rows), candles, timeframe="1h", horizon_sec=H)
+    calibration = report["providers"]["p"]["calibration"]
+    assert [c["bin"] for c in calibration] == [[0.0, 0.1], [0.9, 1.0]]
+    assert [c["signals"] for c in calibration] == [1, 4]
+    assert np.isclose(calibration[1]["avg_confidence"], (0.91 + 0.95 + 1.0 + 0.92) / 4)
+    assert calibration[1]["hit_rate"] == 0.75
+    assert np.isclose(report["providers"]["p"]["brier"], np.mean([0.95**2, 0.09**2, 0.05**2, 0.0, 0.92**2]))
+
+
+def test_mape_scores_the_24h_prediction_whatever_the_horizon() -> None:
+    candles = {"X": _candles(-H, [100.0, 105.0] + [105.0] * 22 + [120.0, 120.0])}
+    report = evaluate(_signals(("p", "X", 0, "buy", None, 120.0)), candles, timeframe="1h", horizon_sec=H)
+    p = report["providers"]["p"]
+    assert p["predictions"] == 1 and p["mape"] == 0.0
+    assert np.isclose(p["pnl"], 0.05)
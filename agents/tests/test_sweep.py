@@ -0,0 +1,134 @@
+import pytest
+
+import backtest
+import sweep
+from sweep import expand, leaderboard, plan
+
+
+class _Redis:
+    """The slice of redis.Redis that `sweep.evaluate` uses."""
+
+    def __init__(self) -> None:
+        self.kv: dict[str, str] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+
+    def get(self, key):
+        return self.kv.get(key)
+
+    def set(self, key, value, ex=None):
+        self.kv[key] = value
+
+    def pipeline(self, transaction=True):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, r: _Redis) -> None:
+        self.r = r
+        self.results: list = []
+
+    def zadd(self, key, mapping):
+        self.r.zsets.setdefault(key, {}).update(mapping)
+        self.results.append(len(mapping))
+
+    def expire(self, key, ttl):
+        self.results.append(True)
+
+    def zcard(self, key):
+        self.results.append(len(self.r.zsets.get(key, {})))
+
+    def zcount(self, key, lo, hi):
+        assert lo == "-inf" and hi.startswith("(")
+        bound = float(hi[1:])
+        self.results.append(sum(score < bound for score in self.r.zsets.get(key, {}).values()))
+
+    def execute(self):
+        return self.results
+
+
+def test_expand_full_grid_and_seeded_sample() -> None:
+    space = {
+        "freqtrade_overrides": {"backtest.params.fast": [10, 20], "stoploss": {"min": -0.1, "max": -0.06, "step": 0.02}},
+        "freqai_overrides": {"model_training_parameters.n_estimators": [200, 800]},
+    }
+    grid = expand(space, 100)
+    assert len(grid) == 12
+    assert grid[0] == {
+        "freqtrade_overrides": {"backtest.params.fast": 10, "stoploss": -0.1},
+        "freqai_overrides": {"model_training_parameters.n_estimators": 200},
+    }
+    assert sorted({c["freqtrade_overrides"]["stoploss"] for c in grid}) == [-0.1, -0.08, -0.06]
+
+    sample = expand(space, 5, seed=7)
+    assert len(sample) == 5
+    assert all(c in grid for c in sample)
+    assert len({str(c) for c in sample}) == 5
+    assert sample == expand(space, 5, seed=7)
+
+    assert expand({"freqtrade_overrides": {"n": {"min": 1, "max": 3, "step": 1}}}, 10) == [
+        {"freqtrade_overrides": {"n": n}, "freqai_overrides": {}} for n in (1, 2, 3)
+    ]
+    with pytest.raises(ValueError):
+        expand({"strategy": {"x": [1]}}, 10)
+    with pytest.raises(ValueError):
+        expand({"freqtrade_overrides": {"x": {"min": 2, "max": 1, "step": 1}}}, 10)
+
+
+def test_plan_shares_evaluations_between_freqai_variants() -> None:
+    ft = {"exchange": {"pair_whitelist": ["BTC/USDT:USDT", "ETH/USDT"]}, "backtest": {"rule": "sma_cross", "params": {"slow": 50}}}
+    payload = {
+        "start": 1_000,
+        "end": 2_000,
+        "metric": "sortino",
+        "space": {
+            "freqtrade_overrides": {"backtest.params.fast": [10, 20]},
+            "freqai_overrides": {"model_training_parameters.n_estimators": [200, 800]},
+        },
+    }
+    settings, evaluations = plan(payload, ft)
+    assert settings["metric"] == "sortino" and settings["rungs"] == sweep.SWEEP_DEFAULTS["rungs"]
+    assert len(evaluations) == 2
+    configs = sorted((e["config"] for e in evaluations.values()), key=lambda c: c["strategy"]["params"]["fast"])
+    assert [c["strategy"]["params"] for c in configs] == [{"slow": 50, "fast": 10}, {"slow": 50, "fast": 20}]
+    assert configs[0]["pairs"] == ["BTC/USDT", "ETH/USDT"] and (configs[0]["start"], configs[0]["end"]) == (1_000, 2_000)
+    assert all(len(e["candidates"]) == 2 for e in evaluations.values())
+    # same input, same hashes
+    assert plan(payload, ft)[1].keys() == evaluations.keys()
+
+    with pytest.raises(ValueError):
+        plan({**payload, "metric": "profit"}, ft)
+
+
+def test_leaderboard_ranks_complete_evaluations_first() -> None:
+    rows = {
+        "a": {"hash": "a", "score": 2.0, "stopped": True},
+        "b": {"hash": "b", "score": 0.5, "stopped": False},
+        "c": {"hash": "c", "score": None, "stopped": False},
+        "d": {"hash": "d", "score": 1.5, "stopped": False},
+    }
+    assert [row["hash"] for row in leaderboard(rows, 3)] == ["d", "b", "c"]
+
+
+def test_evaluate_stops_below_quantile_once_peers_reached_the_rung(monkeypatch) -> None:
+    r = _Redis()
+    monkeypatch.setattr(sweep, "_redis", lambda: r)
+    score = {"value": 0.0}
+    monkeypatch.setattr(backtest, "run_pairs", lambda cfg, pairs: [{"pair": p} for p in pairs])
+    monkeypatch.setattr(backtest, "portfolio", lambda results, tf_sec: {"sharpe": score["value"], "curve": []})
+    config = {"timeframe": "1h", "pairs": ["A", "B", "C", "D"]}
+
+    def run(config_hash: str, value: float) -> dict:
+        score["value"] = value
+        payload = {"sweep_id": "s", "hash": config_hash, "config": config, "metric": "sharpe", "rungs": 2, "min_peers": 2, "stop_quantile": 0.5}
+        return sweep.evaluate(payload)
+
+    # too few peers at the first rung: both run to the end and are cached
+    assert not run("h1", 1.0)["stopped"]
+    assert not run("h2", 0.5)["stopped"]
+    # worse than both peers: stops after the first of two pair chunks
+    low = run("h3", 0.1)
+    assert low["stopped"] and low["rung"] == 0 and low["pairs_evaluated"] == 2
+    assert sweep.cache_key("h3") not in r.kv
+    # better than half of its peers: continues
+    assert not run("h4", 0.7)["stopped"]
+    assert run("h1", 0.0)["cached"]
@@ -0,0 +1,46 @@
+"""create partitioned signal_events table
+
+Revision ID: 20260101_01
+Revises: 20251217_01
+Create Date: 2026-01-01
+
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20260101_01"
+down_revision = "20251217_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Declarative range partitioning is not expressible through op.create_table; monthly partitions
+    # are created on demand by the history writer (app/services/signal_history.py).
+    op.execute(
+        """
+        CREATE TABLE signal_events (
+            provider_id VARCHAR NOT NULL,
+            pair VARCHAR NOT NULL,
+            ts TIMESTAMPTZ NOT NULL,
+            stream_id VARCHAR NOT NULL,
+            received_at TIMESTAMPTZ NOT NULL,
+            direction VARCHAR NOT NULL,
+            confidence DOUBLE PRECISION,
+            predicted_price_24h DOUBLE PRECISION,
+            ai_stop_loss DOUBLE PRECISION,
+            position_size DOUBLE PRECISION,
+            ttl_sec INTEGER NOT NULL,
+            metadata JSON,
+            CONSTRAINT pk_signal_events PRIMARY KEY (provider_id, pair, ts, stream_id)
+        ) PARTITION BY RANGE (ts)
+        """
+    )
+    op.execute("CREATE INDEX ix_signal_events_provider_ts ON signal_events (provider_id, ts)")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE signal_events")
@@ -0,0 +1,45 @@
+"""create task_archive table
+
+Revision ID: 20260201_01
+Revises: 20260101_01
+Create Date: 2026-02-01
+
+"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "20260201_01"
+down_revision = "20260101_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "task_archive",
+        sa.Column("id", sa.String(), primary_key=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("lane", sa.String(), nullable=True),
+        sa.Column("priority", sa.String(), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("payload", sa.JSON(), nullable=True),
+        sa.Column("result", sa.JSON(), nullable=True),
+        sa.Column("last_error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_task_archive_type_created", "task_archive", ["type", "created_at"])
+    op.create_index("ix_task_archive_status_created", "task_archive", ["status", "created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_task_archive_status_created", table_name="task_archive")
+    op.drop_index("ix_task_archive_type_created", table_name="task_archive")
+    op.drop_table("task_archive")
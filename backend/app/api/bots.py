@@ -9,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.db import get_db
 from app.models.neuro import NeuroProvider, ProviderBinding
 from app.schemas.neuro import AttachProviderRequest
+from app.services.binding_cache import publish_invalidation
 
 router = APIRouter(prefix="/bots", tags=["bots"])
 
@@ -41,6 +42,7 @@ async def attach_provider(bot_id: str, req: AttachProviderRequest, session: Asyn
 
     await session.commit()
     await session.refresh(binding)
+    await publish_invalidation(bot_id)
     return {
         "binding_id": binding.binding_id,
         "bot_id": binding.bot_id,
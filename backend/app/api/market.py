@@ -4,21 +4,21 @@ from typing import Any
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, Query
-from time import time
+from time import perf_counter, time
 from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
 
 from app.core.db import get_db
 from app.schemas.market import AggregateSeriesOut, CandleOut, CandleSeriesOut, Exchange
-from app.services import market_clients
-from app.services.market_clients import SYMBOL_MAP, align_and_average, fetch_candles, resolve_symbol
+from app.services import correlation, market_clients, screener, volume_profile
+from app.services.instrument_registry import get_registry
+from app.services.market_clients import TF_SECONDS, align_and_average, fetch_candles, pair_on_exchange, resolve_symbol
 from app.services.market_store import get_cached, load_from_db, set_cached, upsert_candles
 
 router = APIRouter(prefix="/market", tags=["market"])
 
 DEFAULT_LIMIT = 200
 MAX_LIMIT = 200000
-TF_SECONDS = {"1s": 1, "5s": 5, "1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200, "4h": 14400, "1d": 86400}
 
 
 @router.get("/pairs")
@@ -26,8 +26,10 @@ async def list_pairs(
     persist: bool = Query(default=False, description="Persist fetched candles to Postgres (for backtest/trading). View mode should keep this false."),
     session: AsyncSession = Depends(get_db),
 ) -> list[dict[str, Any]]:
+    registry = get_registry()
     pairs: list[dict[str, Any]] = []
-    for norm, per_ex in market_clients.SYMBOL_MAP.items():
+    for norm in market_clients.SYMBOL_MAP:
+        per_ex = registry.exchanges(norm)
         base_ex = next(iter(per_ex))
         symbol = market_clients.resolve_symbol(norm, base_ex)
         # Pull last price from 1m candle so UI updates frequently.
@@ -108,6 +110,156 @@ async def list_pairs(
     return pairs
 
 
+@router.get("/screener")
+async def screen_pairs(
+    q: str | None = Query(default=None, description="substring of the normalized pair"),
+    exchange: Exchange | None = Query(default=None),
+    kind: str | None = Query(default=None, pattern="^(spot|perp)$"),
+    quote: str | None = Query(default=None, description="quote asset, e.g. USDT"),
+    min_volume: float | None = Query(default=None, description="min 24h quote volume"),
+    min_change: float | None = Query(default=None, description="min 24h change, %"),
+    max_change: float | None = Query(default=None, description="max 24h change, %"),
+    min_range: float | None = Query(default=None, description="min 24h high-low range, % of last"),
+    max_range: float | None = Query(default=None, description="max 24h high-low range, % of last"),
+    sort: str = Query(default="volume24hQuote"),
+    order: str = Query(default="desc", pattern="^(asc|desc)$"),
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=5000),
+) -> dict[str, Any]:
+    if sort not in screener.NUMERIC_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"unsupported sort column {sort}")
+
+    table = screener.get_table()
+    if not len(table):
+        # Cold start before the background refresher has filled the table.
+        try:
+            await screener.refresh()
+        except httpx.HTTPError:
+            pass
+
+    started = perf_counter()
+    total, items = table.query(
+        q=q,
+        exchange=exchange,
+        kind=kind,
+        quote=quote,
+        ranges={
+            "volume24hQuote": (min_volume, None),
+            "change24hPct": (min_change, max_change),
+            "range24hPct": (min_range, max_range),
+        },
+        sort=sort,
+        desc=order == "desc",
+        offset=offset,
+        limit=limit,
+    )
+    return {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "items": items,
+        "took_ms": round((perf_counter() - started) * 1000, 3),
+    }
+
+
+@router.get("/correlation")
+async def get_correlation(
+    exchange: Exchange = Query(default="binance"),
+    pairs: str | None = Query(default=None, description="comma-separated pairs; defaults to the featured set"),
+    timeframe: str = Query(default="1h"),
+    window: int = Query(default=500, ge=10, le=1000, description="number of returns (bars) in the window"),
+    include_cov: bool = Query(default=False),
+    session: AsyncSession = Depends(get_db),
+) -> dict[str, Any]:
+    timeframe = timeframe.lower()
+    if timeframe not in market_clients.SUPPORTED_TF or timeframe in {"1s", "5s"}:
+        raise HTTPException(status_code=400, detail="unsupported timeframe")
+
+    if pairs:
+        pair_list = list(dict.fromkeys(p.strip() for p in pairs.split(",") if p.strip()))
+    else:
+        pair_list = [p for p in market_clients.SYMBOL_MAP if pair_on_exchange(p, exchange)]
+    if len(pair_list) < 2:
+        raise HTTPException(status_code=400, detail="at least two pairs required")
+    if len(pair_list) > 500:
+        raise HTTPException(status_code=400, detail="too many pairs (max 500)")
+
+    return await correlation.correlation(
+        session,
+        exchange=exchange,
+        pairs=pair_list,
+        timeframe=timeframe,
+        window=window,
+        include_cov=include_cov,
+    )
+
+
+@router.get("/volume-profile")
+async def get_volume_profile(
+    pair: str,
+    exchange: Exchange = Query(default="binance"),
+    start: int | None = Query(default=None, description="range start, ms; defaults to end - 1h"),
+    end: int | None = Query(default=None, description="range end, ms; defaults to now"),
+    step: float | None = Query(default=None, gt=0, description="price level width; derived from price when omitted"),
+) -> dict[str, Any]:
+    # Trade-level data (with aggressor side) is only collected for Binance.
+    if exchange != "binance":
+        raise HTTPException(status_code=400, detail="volume profile is only supported for binance")
+    end_ms = end or market_clients.now_ts_ms()
+    start_ms = start if start is not None else end_ms - 3_600_000
+    if start_ms >= end_ms:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end_ms - start_ms > 7 * 86_400_000:
+        raise HTTPException(status_code=400, detail="range too large (max 7d)")
+
+    symbol = resolve_symbol(pair, exchange)
+    started = perf_counter()
+    try:
+        out = await volume_profile.volume_profile(symbol, start_ms, end_ms, step)
+    except httpx.HTTPStatusError as exc:
+        raise HTTPException(status_code=502, detail=f"exchange error: {exc.response.status_code}") from exc
+    return {
+        "exchange": exchange,
+        "pair": pair,
+        **out,
+        "took_ms": round((perf_counter() - started) * 1000, 3),
+    }
+
+
+@router.get("/instruments")
+async def search_instruments(
+    q: str = Query(default="", description="prefix or substring of a normalized pair / native symbol"),
+    exchange: Exchange | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=1000),
+) -> dict[str, Any]:
+    registry = get_registry()
+    hits = registry.search(q, limit=limit, exchange=exchange)
+    return {
+        "total": len(registry),
+        "items": [{"pair": p, "symbols": registry.exchanges(p), "kinds": registry.kinds(p)} for p in hits],
+    }
+
+
+@router.get("/instruments/resolve")
+async def resolve_instrument(
+    exchange: Exchange,
+    pair: str | None = Query(default=None, description="normalized pair, e.g. BTC/USDT"),
+    symbol: str | None = Query(default=None, description="exchange native symbol, e.g. BTCUSDT"),
+) -> dict[str, Any]:
+    registry = get_registry()
+    if pair:
+        native = registry.native(pair, exchange)
+        if native is None:
+            raise HTTPException(status_code=404, detail=f"pair {pair} not on {exchange}")
+        return {"exchange": exchange, "pair": pair, "symbol": native}
+    if symbol:
+        normalized = registry.normalized(symbol, exchange)
+        if normalized is None:
+            raise HTTPException(status_code=404, detail=f"symbol {symbol} not on {exchange}")
+        return {"exchange": exchange, "pair": normalized, "symbol": symbol}
+    raise HTTPException(status_code=400, detail="pair or symbol is required")
+
+
 @router.get("/candles", response_model=CandleSeriesOut)
 async def get_candles(
     exchange: Exchange,
@@ -121,7 +273,7 @@ async def get_candles(
     if timeframe not in market_clients.SUPPORTED_TF:
         raise HTTPException(status_code=400, detail="unsupported timeframe")
 
-    if pair in SYMBOL_MAP and exchange not in SYMBOL_MAP[pair]:
+    if not pair_on_exchange(pair, exchange):
         raise HTTPException(status_code=400, detail=f"pair {pair} not on {exchange}")
 
     cached = await get_cached(exchange, pair, timeframe)
@@ -173,7 +325,7 @@ async def get_candles_aggregate(
     for ex in ex_list:
         if ex not in market_clients.FETCHERS:
             raise HTTPException(status_code=400, detail=f"unsupported exchange {ex}")
-        if pair in SYMBOL_MAP and ex not in SYMBOL_MAP[pair]:
+        if not pair_on_exchange(pair, ex):
             failures.append(f"{ex}:pair-not-supported")
             continue
         cached = await get_cached(ex, pair, timeframe)
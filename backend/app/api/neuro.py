@@ -9,6 +9,7 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.db import get_db
+from app.core.redis import get_redis
 from app.models.neuro import NeuroProvider
 from app.schemas.neuro import (
     NeuroProviderCreate,
@@ -16,6 +17,7 @@ from app.schemas.neuro import (
     NeuroProviderUpdate,
     ProviderHealth,
 )
+from app.services import consensus
 
 router = APIRouter(prefix="/neuro", tags=["neuro"])
 
@@ -99,8 +101,76 @@ MODULES: list[dict[str, Any]] = [
         "signal_schema_version": "th.signal.v1",
         "status": "deprecated",
     },
+    {
+        "module_type": "consensus",
+        "title": "Consensus",
+        "description": "Virtual provider: weighted consensus of member providers, updated on every member signal",
+        "version": "0.1.0",
+        "vendor": None,
+        "capabilities": {
+            "supports_streaming": True,
+            "supports_batch_pull": True,
+            "supports_training": False,
+            "supports_datasets": False,
+            "supports_featuresets": False,
+            "supports_backtest_signals": False,
+            "supports_multi_exchange": True,
+            "supports_short": True,
+            "supports_position_sizing": False,
+            "supports_ai_stoploss": False,
+        },
+        "provider_config_schema": {
+            "type": "object",
+            "properties": {
+                "connector": {"type": "string", "enum": ["internal"]},
+                "connector_config": {
+                    "type": "object",
+                    "properties": {
+                        "members": {
+                            "type": "object",
+                            "description": "member provider_id -> positive weight",
+                            "additionalProperties": {"type": "number", "exclusiveMinimum": 0},
+                        },
+                    },
+                    "required": ["members"],
+                },
+            },
+            "required": ["connector", "connector_config"],
+        },
+        "signal_schema_version": "th.signal.v1",
+        "status": "active",
+    },
 ]
 
+
+async def _consensus_members(session: AsyncSession, p: NeuroProviderCreate | NeuroProviderUpdate) -> dict[str, float]:
+    if p.module_type != consensus.MODULE_TYPE:
+        return {}
+    try:
+        members = consensus.parse_members(p.connector_config, p.provider_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await session.execute(
+        select(NeuroProvider.provider_id, NeuroProvider.module_type).where(NeuroProvider.provider_id.in_(members))
+    )
+    found = dict(result.all())
+    missing = sorted(members.keys() - found.keys())
+    if missing:
+        raise HTTPException(status_code=400, detail=f"unknown member providers: {', '.join(missing)}")
+    if any(module_type == consensus.MODULE_TYPE for module_type in found.values()):
+        raise HTTPException(status_code=400, detail="consensus providers cannot be nested")
+    return members
+
+
+def _stored_members(provider: NeuroProvider) -> dict[str, float]:
+    if provider.module_type != consensus.MODULE_TYPE:
+        return {}
+    try:
+        return consensus.parse_members(provider.connector_config or {})
+    except ValueError:
+        return {}
+
+
 @router.get("/modules")
 async def list_modules() -> list[dict[str, Any]]:
     return MODULES
@@ -117,6 +187,7 @@ async def list_providers(session: AsyncSession = Depends(get_db)) -> list[dict[s
 async def create_provider(p: NeuroProviderCreate, session: AsyncSession = Depends(get_db)) -> dict[str, Any]:
     if p.module_type not in {m["module_type"] for m in MODULES}:
         raise HTTPException(status_code=400, detail="unknown module_type")
+    members = await _consensus_members(session, p)
 
     provider = NeuroProvider(
         provider_id=p.provider_id,
@@ -137,6 +208,7 @@ async def create_provider(p: NeuroProviderCreate, session: AsyncSession = Depend
         await session.rollback()
         raise HTTPException(status_code=409, detail="provider_id already exists")
 
+    await consensus.sync_members(get_redis(), provider.provider_id, {}, members)
     await session.refresh(provider)
     return NeuroProviderOut.model_validate(provider, from_attributes=True).model_dump()
 
@@ -160,6 +232,8 @@ async def update_provider(provider_id: str, p: NeuroProviderUpdate, session: Asy
 
     if p.module_type not in {m["module_type"] for m in MODULES}:
         raise HTTPException(status_code=400, detail="unknown module_type")
+    members = await _consensus_members(session, p)
+    previous = _stored_members(provider)
 
     provider.name = p.name
     provider.module_type = p.module_type
@@ -171,6 +245,7 @@ async def update_provider(provider_id: str, p: NeuroProviderUpdate, session: Asy
     provider.updated_at = datetime.now(timezone.utc)
 
     await session.commit()
+    await consensus.sync_members(get_redis(), provider_id, previous, members)
     await session.refresh(provider)
     return NeuroProviderOut.model_validate(provider, from_attributes=True).model_dump()
 
@@ -180,8 +255,11 @@ async def delete_provider(provider_id: str, session: AsyncSession = Depends(get_
     provider = await session.get(NeuroProvider, provider_id)
     if not provider:
         raise HTTPException(status_code=404, detail="provider not found")
+    previous = _stored_members(provider)
     await session.delete(provider)
     await session.commit()
+    if previous:
+        await consensus.sync_members(get_redis(), provider_id, previous, {})
     return {"deleted": True, "provider_id": provider_id}
 
 
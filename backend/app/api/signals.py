@@ -1,24 +1,30 @@
 from __future__ import annotations
 
+import asyncio
 import json
+from collections.abc import AsyncIterator
 from datetime import datetime, timezone
 from typing import Any
-from uuid import uuid4
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, Field
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from redis.asyncio.client import Pipeline
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.db import get_db
+from app.core.db import get_db, get_sessionmaker
 from app.core.redis import get_redis
-from app.models.neuro import NeuroProvider, ProviderBinding
+from app.services.binding_cache import get_binding_cache
+from app.services.consensus import queue_consensus
+from app.services.provider_health import IngestTally, get_write_behind, queue_ingest_metrics, record_errors
+from app.services.signal_delivery import Subscription, get_hub, replay
+from app.services.signal_history import MAX_PAGE, query_history
+from app.services.signal_store import LastBatch, execute_ingest, queue_envelope, read_last
 
 router = APIRouter(prefix="/signals", tags=["signals"])
 
-SIGNAL_LAST_PREFIX = "signal:last:"
-SIGNAL_PROVIDER_STREAM_PREFIX = "signals.provider."
-
 
 class CanonicalSignalPair(BaseModel):
     direction: str
@@ -29,69 +35,196 @@ class CanonicalSignalPair(BaseModel):
     metadata: dict[str, Any] | None = None
 
 
+# Bounds that every store can hold: unix seconds before year 10000, ttl_sec in a Postgres INTEGER.
+MAX_TIMESTAMP = 253_402_300_799
+MAX_TTL_SEC = 2**31 - 1
+
+
 class CanonicalSignalEnvelope(BaseModel):
     schema: str = Field(default="th.signal.v1")
     provider_id: str
-    timestamp: int
-    ttl_sec: int
+    timestamp: int = Field(ge=0, le=MAX_TIMESTAMP)
+    ttl_sec: int = Field(ge=0, le=MAX_TTL_SEC)
     signals: dict[str, CanonicalSignalPair]
 
 
+async def record_ingest_validation_error(request: Request, exc: RequestValidationError) -> Response:
+    """Count rejected envelopes against their provider (when the body names one), then answer as usual."""
+    if request.url.path == "/signals/ingest" and isinstance(exc.body, dict):
+        provider_id = exc.body.get("provider_id")
+        if isinstance(provider_id, str) and provider_id:
+            try:
+                await record_errors(provider_id)
+            except Exception:  # noqa: BLE001
+                pass
+    return await request_validation_exception_handler(request, exc)
+
+
+async def _queue_ingest(pipe: Pipeline, envelope: CanonicalSignalEnvelope, now: float) -> int:
+    data = envelope.model_dump()
+    written = queue_envelope(pipe, data)
+    await queue_consensus(pipe, data)
+    queue_ingest_metrics(pipe, envelope.provider_id, timestamp=envelope.timestamp, ttl_sec=envelope.ttl_sec, now=now)
+    return written
+
+
 @router.post("/ingest")
-async def ingest(envelope: CanonicalSignalEnvelope, session: AsyncSession = Depends(get_db)) -> dict[str, Any]:
+async def ingest(envelope: CanonicalSignalEnvelope) -> dict[str, Any]:
     redis = get_redis()
-    now = int(datetime.now(timezone.utc).timestamp())
-
-    # Store last signal per pair.
-    written = 0
-    for pair, signal in envelope.signals.items():
-        key = f"{SIGNAL_LAST_PREFIX}{envelope.provider_id}:{pair}"
-        payload = {
-            "signal_id": str(uuid4()),
-            "provider_id": envelope.provider_id,
-            "pair": pair,
-            "direction": signal.direction,
-            "confidence": signal.confidence,
-            "ts": envelope.timestamp,
-            "ttl_sec": envelope.ttl_sec,
-            "stale": now > (envelope.timestamp + envelope.ttl_sec),
-            "ai_stop_loss": signal.ai_stop_loss,
-            "position_size": signal.position_size,
-            "payload": {"metadata": signal.metadata or {}},
-        }
-        await redis.set(key, json.dumps(payload, ensure_ascii=False))
-        written += 1
-
-    # Update provider last_seen_ts in Postgres if exists.
-    provider = await session.get(NeuroProvider, envelope.provider_id)
-    if provider:
-        provider.health_status = "healthy"
-        provider.last_seen_ts = datetime.now(timezone.utc)
-        await session.commit()
-
-    # Optional: append to provider stream (best-effort)
-    try:
-        stream = f"{SIGNAL_PROVIDER_STREAM_PREFIX}{envelope.provider_id}"
-        await redis.xadd(stream, {"schema": envelope.schema, "payload": envelope.model_dump_json()}, maxlen=10_000)
-    except Exception:  # noqa: BLE001
-        pass
+    now = datetime.now(timezone.utc).timestamp()
+
+    # Last signal per pair, provider stream append and health counters in a single round trip.
+    pipe = redis.pipeline(transaction=False)
+    written = await _queue_ingest(pipe, envelope, now)
+    await execute_ingest(pipe)
+
+    # Provider last_seen_ts/health_status reach Postgres via the write-behind flusher.
+    get_write_behind().seen(envelope.provider_id)
 
     return {"ok": True, "written": written}
 
 
+NDJSON_BATCH = 2000
+NDJSON_MAX_LINE_BYTES = 1 << 20
+NDJSON_MAX_ERRORS = 100
+
+
+def _provider_of(line: bytes) -> str | None:
+    try:
+        provider_id = json.loads(line).get("provider_id")
+    except (ValueError, AttributeError):
+        return None
+    return provider_id if isinstance(provider_id, str) and provider_id else None
+
+
+class _NdjsonBatcher:
+    """Validates NDJSON lines into a Redis pipeline and sends it every NDJSON_BATCH envelopes.
+
+    Per-provider bookkeeping (hash TTLs, provider set, health counters) is summed over the batch and
+    queued once when it is sent, so an envelope costs four commands instead of eleven. At most one
+    batch is in flight: the next one is parsed while the previous executes, and reading the request
+    body pauses until it completes, so a fast client is throttled to Redis' pace.
+    """
+
+    def __init__(self) -> None:
+        self.redis = get_redis()
+        self.pipe = self.redis.pipeline(transaction=False)
+        self.queued = 0
+        self.last = LastBatch()
+        self.tally = IngestTally()
+        self.providers: set[str] = set()
+        self.inflight: asyncio.Task | None = None
+        self.accepted = self.written = self.rejected = 0
+        self.errors: list[dict[str, Any]] = []
+
+    def reject(self, line_no: int, error: str, provider_id: str | None) -> None:
+        self.rejected += 1
+        if len(self.errors) < NDJSON_MAX_ERRORS:
+            self.errors.append({"line": line_no, "error": error})
+        if provider_id:
+            self.tally.error(provider_id, datetime.now(timezone.utc).timestamp())
+
+    async def line(self, line_no: int, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            # Straight from bytes in pydantic-core: no intermediate json.loads / dict validation.
+            envelope = CanonicalSignalEnvelope.model_validate_json(line)
+        except ValidationError as e:
+            first = e.errors(include_url=False)[0]
+            loc = ".".join(str(p) for p in first["loc"])
+            self.reject(line_no, f"{loc}: {first['msg']}" if loc else first["msg"], _provider_of(line))
+            return
+        data = envelope.model_dump()
+        self.written += queue_envelope(self.pipe, data, self.last)
+        await queue_consensus(self.pipe, data)
+        now = datetime.now(timezone.utc).timestamp()
+        self.tally.add(envelope.provider_id, timestamp=envelope.timestamp, ttl_sec=envelope.ttl_sec, now=now)
+        self.providers.add(envelope.provider_id)
+        self.accepted += 1
+        self.queued += 1
+        if self.queued >= NDJSON_BATCH:
+            await self.send()
+
+    async def send(self) -> None:
+        self.last.queue(self.pipe)
+        self.tally.queue(self.pipe)
+        pipe, self.pipe = self.pipe, self.redis.pipeline(transaction=False)
+        self.queued = 0
+        await self.wait()
+        if len(pipe):
+            self.inflight = asyncio.create_task(execute_ingest(pipe))
+        write_behind = get_write_behind()
+        for provider_id in self.providers:
+            write_behind.seen(provider_id)
+        self.providers = set()
+
+    async def wait(self) -> None:
+        if self.inflight is not None:
+            inflight, self.inflight = self.inflight, None
+            await inflight
+
+
+@router.post("/ingest/ndjson")
+async def ingest_ndjson(request: Request) -> dict[str, Any]:
+    """Bulk ingest: one CanonicalSignalEnvelope per line, any mix of providers.
+
+    Valid lines are applied even when others fail; errors are reported per 1-based line number.
+    """
+    batcher = _NdjsonBatcher()
+    buffer = b""
+    line_no = 0
+    skipping = False
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            start = 0
+            while True:
+                end = buffer.find(b"\n", start)
+                if end < 0:
+                    break
+                line_no += 1
+                if skipping:
+                    skipping = False
+                elif end - start > NDJSON_MAX_LINE_BYTES:
+                    batcher.reject(line_no, f"line exceeds {NDJSON_MAX_LINE_BYTES} bytes", None)
+                else:
+                    await batcher.line(line_no, buffer[start:end])
+                start = end + 1
+            buffer = buffer[start:]
+            if len(buffer) > NDJSON_MAX_LINE_BYTES:
+                if not skipping:
+                    # Rejected before its newline arrives; it is counted when the newline (or the body end) does.
+                    batcher.reject(line_no + 1, f"line exceeds {NDJSON_MAX_LINE_BYTES} bytes", None)
+                    skipping = True
+                buffer = b""
+        if skipping:
+            line_no += 1
+        elif buffer:
+            line_no += 1
+            await batcher.line(line_no, buffer)
+        await batcher.send()
+    finally:
+        await batcher.wait()
+
+    return {
+        "ok": batcher.rejected == 0,
+        "lines": line_no,
+        "accepted": batcher.accepted,
+        "rejected": batcher.rejected,
+        "written": batcher.written,
+        "errors": batcher.errors,
+    }
+
+
 @router.get("/providers/{provider_id}/last")
 async def get_last_signals(provider_id: str, pairs: str | None = Query(default=None)) -> dict[str, Any]:
-    redis = get_redis()
     if not pairs:
         raise HTTPException(status_code=400, detail="pairs query param required")
 
     pair_list = [p.strip() for p in pairs.split(",") if p.strip()]
-    out: dict[str, Any] = {"provider_id": provider_id, "signals": {}}
-    for pair in pair_list:
-        key = f"{SIGNAL_LAST_PREFIX}{provider_id}:{pair}"
-        raw = await redis.get(key)
-        out["signals"][pair] = json.loads(raw) if raw else None
-    return out
+    signals = await read_last(get_redis(), provider_id, pair_list)
+    return {"provider_id": provider_id, "signals": signals}
 
 
 @router.get("/bots/{bot_id}/last")
@@ -99,19 +232,118 @@ async def get_last_signals_for_bot(bot_id: str, pairs: str | None = Query(defaul
     if not pairs:
         raise HTTPException(status_code=400, detail="pairs query param required")
 
-    binding = await session.scalar(select(ProviderBinding).where(ProviderBinding.bot_id == bot_id))
-    if not binding or not binding.provider_id:
+    provider_id = await get_binding_cache().provider_for(session, bot_id)
+    if not provider_id:
         return {"bot_id": bot_id, "provider_id": None, "signals": {}}
 
     pair_list = [p.strip() for p in pairs.split(",") if p.strip()]
-    redis = get_redis()
-    out: dict[str, Any] = {
-        "bot_id": bot_id,
-        "provider_id": binding.provider_id,
-        "signals": {},
-    }
-    for pair in pair_list:
-        key = f"{SIGNAL_LAST_PREFIX}{binding.provider_id}:{pair}"
-        raw = await redis.get(key)
-        out["signals"][pair] = json.loads(raw) if raw else None
-    return out
+    signals = await read_last(get_redis(), provider_id, pair_list)
+    return {"bot_id": bot_id, "provider_id": provider_id, "signals": signals}
+
+
+@router.get("/history")
+async def get_signal_history(
+    provider_id: str,
+    start: int = Query(description="unix seconds, inclusive"),
+    end: int = Query(description="unix seconds, exclusive"),
+    pair: str | None = Query(default=None),
+    limit: int = Query(default=500, ge=1, le=MAX_PAGE),
+    cursor: str | None = Query(default=None, description="next_cursor of the previous page"),
+    session: AsyncSession = Depends(get_db),
+) -> dict[str, Any]:
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    try:
+        page = await query_history(
+            session,
+            provider_id=provider_id,
+            pair=pair,
+            start=datetime.fromtimestamp(start, tz=timezone.utc),
+            end=datetime.fromtimestamp(end, tz=timezone.utc),
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+    return {"provider_id": provider_id, "pair": pair, **page}
+
+
+SSE_HEARTBEAT_SEC = 15.0
+
+
+def _pair_filter(pairs: str | None) -> set[str] | None:
+    if not pairs:
+        return None
+    return {p.strip() for p in pairs.split(",") if p.strip()} or None
+
+
+async def _bot_provider(bot_id: str) -> str | None:
+    # Own short-lived session: streaming handlers must not pin a pooled connection for their lifetime.
+    async with get_sessionmaker()() as session:
+        return await get_binding_cache().provider_for(session, bot_id)
+
+
+@router.get("/bots/{bot_id}/stream")
+async def stream_signals_for_bot(
+    bot_id: str,
+    request: Request,
+    pairs: str | None = Query(default=None, description="comma-separated pair filter"),
+    last_id: str | None = Query(default=None, description="resume after this stream id (or send Last-Event-ID)"),
+) -> StreamingResponse:
+    """Server-sent events with signal deltas for the bot's provider."""
+    provider_id = await _bot_provider(bot_id)
+    if not provider_id:
+        raise HTTPException(status_code=404, detail="bot has no enabled provider binding")
+
+    hub = get_hub()
+    sub = Subscription(bot_id, _pair_filter(pairs), last_id or request.headers.get("last-event-id"))
+
+    async def events() -> AsyncIterator[str]:
+        # Registered here, not in the handler: a client gone before the first chunk never runs the generator.
+        hub.add(sub)
+        try:
+            await replay(provider_id, sub)
+            yield "retry: 2000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=SSE_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if message is None:
+                    break
+                yield f"id: {message['id']}\nevent: signal\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+        finally:
+            hub.remove(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.websocket("/bots/{bot_id}/ws")
+async def ws_signals_for_bot(websocket: WebSocket, bot_id: str, pairs: str | None = None, last_id: str | None = None) -> None:
+    """WebSocket variant of the bot signal stream; messages are the same JSON objects as the SSE data."""
+    provider_id = await _bot_provider(bot_id)
+    if not provider_id:
+        await websocket.close(code=4404, reason="bot has no enabled provider binding")
+        return
+    await websocket.accept()
+
+    hub = get_hub()
+    sub = Subscription(bot_id, _pair_filter(pairs), last_id)
+    hub.add(sub)
+    try:
+        await replay(provider_id, sub)
+        while True:
+            message = await sub.queue.get()
+            if message is None:
+                await websocket.close(code=4008, reason="consumer too slow; reconnect with last id")
+                break
+            await websocket.send_json(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.remove(sub)
@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import json
 import re
 import subprocess
 import tempfile
@@ -20,6 +19,7 @@ from app.schemas.strategylab import (
     FreqAIModelVariantCreate,
     FreqAIModelVariantOut,
     FreqAIModelVariantUpdate,
+    StrategyAlignmentAgentRequest,
     StrategyAlignmentCreate,
     StrategyAlignmentOut,
     StrategyAlignmentUpdate,
@@ -27,13 +27,10 @@ from app.schemas.strategylab import (
     StrategyTemplateOut,
     StrategyTemplateUpdate,
 )
+from app.services.task_queue import enqueue
 
 router = APIRouter(prefix="/strategylab", tags=["strategylab"])
 
-QUEUE_KEY = "trade:tasks:queue"
-TASK_KEY_PREFIX = "trade:tasks:"
-
-
 _CLASS_RE = re.compile(r"^class\s+(?P<name>[A-Za-z_][A-Za-z0-9_]*)\s*\((?P<bases>[^)]*)\)\s*:", re.MULTILINE)
 
 
@@ -565,34 +562,21 @@ async def alignment_config_file(alignment_id: str, session: AsyncSession = Depen
 
 
 @router.post("/alignments/{alignment_id}/request-agent")
-async def request_agent_alignment(alignment_id: str, session: AsyncSession = Depends(get_db)) -> dict:
+async def request_agent_alignment(
+    alignment_id: str, p: StrategyAlignmentAgentRequest | None = None, session: AsyncSession = Depends(get_db)
+) -> dict:
     a = await session.get(StrategyAlignment, alignment_id)
     if not a:
         raise HTTPException(status_code=404, detail="alignment not found")
 
-    task_id = str(uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-
-    redis = get_redis()
-    key = f"{TASK_KEY_PREFIX}{task_id}"
-
     payload = {
         "alignment_id": alignment_id,
         "strategy_id": a.strategy_id,
         "model_id": a.model_id,
         "intent": "propose_alignment",
     }
+    if p is not None:
+        payload.update(p.model_dump(exclude_none=True))
+    task = await enqueue(get_redis(), "strategylab.alignment.propose", payload, priority="high")
 
-    await redis.hset(
-        key,
-        mapping={
-            "id": task_id,
-            "type": "strategylab.alignment.propose",
-            "payload": json.dumps(payload, ensure_ascii=False),
-            "status": "queued",
-            "created_at": now,
-        },
-    )
-    await redis.rpush(QUEUE_KEY, task_id)
-
-    return {"queued": True, "task_id": task_id}
+    return {"queued": True, "task_id": task["id"], "lane": task["lane"]}
@@ -1,61 +1,121 @@
 from __future__ import annotations
 
 import json
-from datetime import datetime, timezone
-from uuid import uuid4
+from collections.abc import AsyncIterator
+from typing import Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.db import get_db
 from app.core.redis import get_redis
+from app.models.tasks import TaskArchive
+from app.services.task_queue import (
+    MAX_BATCH,
+    MAX_PAGE,
+    TERMINAL_STATUSES,
+    enqueue,
+    enqueue_many,
+    event_message,
+    events_key,
+    list_tasks,
+    plan,
+    task_key,
+)
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
-QUEUE_KEY = "trade:tasks:queue"
-TASK_KEY_PREFIX = "trade:tasks:"
+SSE_HEARTBEAT_SEC = 15.0
 
 
 class EnqueueTaskRequest(BaseModel):
     type: str = Field(min_length=1)
     payload: dict = Field(default_factory=dict)
+    priority: Literal["high", "normal", "low"] = "normal"
+    # Defaults to the lane the task type is routed to.
+    lane: str | None = None
+    # Repeating a key (within settings.task_idempotency_ttl_sec) returns the earlier task instead.
+    idempotency_key: str | None = Field(default=None, min_length=1, max_length=200)
 
 
 class EnqueueTaskResponse(BaseModel):
     id: str
     status: str
+    lane: str
+    priority: str
+    route: str
+    duplicate: bool = False
+
+
+class EnqueueBatchRequest(BaseModel):
+    tasks: list[EnqueueTaskRequest] = Field(min_length=1, max_length=MAX_BATCH)
+
+
+class EnqueueBatchResponse(BaseModel):
+    tasks: list[EnqueueTaskResponse]
+    created: int
+    duplicates: int
 
 
 @router.post("", response_model=EnqueueTaskResponse)
 async def enqueue_task(req: EnqueueTaskRequest) -> EnqueueTaskResponse:
-    task_id = str(uuid4())
-    now = datetime.now(timezone.utc).isoformat()
-
-    redis = get_redis()
-    key = f"{TASK_KEY_PREFIX}{task_id}"
-
-    await redis.hset(
-        key,
-        mapping={
-            "id": task_id,
-            "type": req.type,
-            "payload": json.dumps(req.payload, ensure_ascii=False),
-            "status": "queued",
-            "created_at": now,
-        },
+    try:
+        task = await enqueue(
+            get_redis(), req.type, req.payload, priority=req.priority, lane=req.lane, idempotency=req.idempotency_key
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    return EnqueueTaskResponse(status="queued", **task)
+
+
+@router.post("/batch", response_model=EnqueueBatchResponse)
+async def enqueue_tasks(req: EnqueueBatchRequest) -> EnqueueBatchResponse:
+    """Enqueue many tasks in pipelined chunks; `tasks` in the response follow the request order.
+
+    Every spec is validated before anything is written, so a 400 means nothing was enqueued.
+    """
+    planned = []
+    for i, spec in enumerate(req.tasks):
+        try:
+            planned.append(
+                plan(spec.type, spec.payload, priority=spec.priority, lane=spec.lane, idempotency=spec.idempotency_key)
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"tasks[{i}]: {e}") from e
+    written = await enqueue_many(get_redis(), planned)
+    duplicates = sum(t["duplicate"] for t in written)
+    return EnqueueBatchResponse(
+        tasks=[EnqueueTaskResponse(status="queued", **t) for t in written],
+        created=len(written) - duplicates,
+        duplicates=duplicates,
     )
-    await redis.rpush(QUEUE_KEY, task_id)
 
-    return EnqueueTaskResponse(id=task_id, status="queued")
 
+@router.get("")
+async def get_tasks(
+    status: str | None = None,
+    type: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE),
+    cursor: str | None = None,
+) -> dict:
+    """Tasks still in Redis, newest first. Pass `next_cursor` back as `cursor` for the next page."""
+    try:
+        return await list_tasks(get_redis(), status=status, task_type=type, limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"invalid cursor: {e}") from e
 
-@router.get("/{task_id}")
-async def get_task(task_id: str) -> dict:
-    redis = get_redis()
-    key = f"{TASK_KEY_PREFIX}{task_id}"
 
-    data = await redis.hgetall(key)
+@router.get("/{task_id}")
+async def get_task(task_id: str, session: AsyncSession = Depends(get_db)) -> dict:
+    data = await get_redis().hgetall(task_key(task_id))
     if not data:
-        return {"id": task_id, "status": "not_found"}
+        archived = await session.get(TaskArchive, task_id)
+        if archived is None:
+            return {"id": task_id, "status": "not_found"}
+        out = {c.name: getattr(archived, c.name) for c in TaskArchive.__table__.columns}
+        return {**out, "archived": True}
 
     payload_raw = data.get("payload")
     if payload_raw:
@@ -64,11 +124,57 @@ async def get_task(task_id: str) -> dict:
         except Exception:  # noqa: BLE001
             data["payload"] = payload_raw
 
-    result_raw = data.get("result")
-    if result_raw:
-        try:
-            data["result"] = json.loads(result_raw)
-        except Exception:  # noqa: BLE001
-            data["result"] = result_raw
+    for field in ("result", "progress"):
+        raw = data.get(field)
+        if raw:
+            try:
+                data[field] = json.loads(raw)
+            except Exception:  # noqa: BLE001
+                data[field] = raw
 
     return data
+
+
+@router.get("/{task_id}/events")
+async def stream_task_events(
+    task_id: str,
+    request: Request,
+    last_id: str | None = Query(default=None, description="resume after this event id (or send Last-Event-ID)"),
+) -> StreamingResponse:
+    """Server-sent status and progress events of one task, from the start (or `last_id`).
+
+    The stream ends after the event carrying a terminal status (done, error, dead).
+    """
+    redis = get_redis()
+    if not await redis.exists(task_key(task_id)):
+        raise HTTPException(status_code=404, detail="task not found (or already archived)")
+    key = events_key(task_id)
+    cursor = last_id or request.headers.get("last-event-id") or "0"
+
+    async def events() -> AsyncIterator[str]:
+        nonlocal cursor
+        yield "retry: 2000\n\n"
+        while True:
+            # Event streams expire an hour after the task settles; fall back to the hash then.
+            if not await redis.exists(key):
+                status = await redis.hget(task_key(task_id), "status")
+                if status is None or status in TERMINAL_STATUSES:
+                    final = {"task_id": task_id, "event": "status", "status": status or "not_found"}
+                    yield f"event: status\ndata: {json.dumps(final)}\n\n"
+                    return
+            resp = await redis.xread({key: cursor}, count=100, block=int(SSE_HEARTBEAT_SEC * 1000))
+            if not resp:
+                yield ": ping\n\n"
+                continue
+            for entry_id, fields in resp[0][1]:
+                cursor = entry_id
+                message = event_message(task_id, entry_id, fields)
+                yield f"id: {entry_id}\nevent: {message.get('event', 'status')}\ndata: {json.dumps(message, ensure_ascii=False)}\n\n"
+                if message.get("event") == "status" and message.get("status") in TERMINAL_STATUSES:
+                    return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
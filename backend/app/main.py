@@ -1,6 +1,36 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.exceptions import RequestValidationError
 
 from app.api.router import api_router
+from app.api.signals import record_ingest_validation_error
+from app.services import binding_cache, consensus, instrument_registry, provider_health, screener, signal_delivery, signal_history, signal_store, task_queue
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    background = [
+        asyncio.create_task(instrument_registry.run_refresh_loop()),
+        asyncio.create_task(screener.run_refresh_loop()),
+        asyncio.create_task(provider_health.run_flush_loop()),
+        asyncio.create_task(binding_cache.run_invalidation_listener()),
+        asyncio.create_task(signal_delivery.run_delivery_loop()),
+        asyncio.create_task(signal_history.run_history_writer()),
+        asyncio.create_task(signal_store.run_sweeper()),
+        asyncio.create_task(consensus.run_expiry_loop()),
+        asyncio.create_task(task_queue.run_retention_loop()),
+    ]
+    try:
+        yield
+    finally:
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
 
-app = FastAPI(title="TRADE_SYSTEM Backend")
+app = FastAPI(title="TRADE_SYSTEM Backend", lifespan=lifespan)
 app.include_router(api_router)
+app.add_exception_handler(RequestValidationError, record_ingest_validation_error)
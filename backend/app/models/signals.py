@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from datetime import datetime
+
+from sqlalchemy import JSON, DateTime, Float, Index, Integer, PrimaryKeyConstraint, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.base import Base
+
+
+class SignalEvent(Base):
+    """One pair signal from a provider envelope. Range-partitioned by `ts` (monthly partitions)."""
+
+    __tablename__ = "signal_events"
+    __table_args__ = (
+        PrimaryKeyConstraint("provider_id", "pair", "ts", "stream_id", name="pk_signal_events"),
+        Index("ix_signal_events_provider_ts", "provider_id", "ts"),
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+
+    provider_id: Mapped[str] = mapped_column(String, nullable=False)
+    pair: Mapped[str] = mapped_column(String, nullable=False)
+    ts: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # Redis stream entry id the signal was drained from; makes re-drains idempotent.
+    stream_id: Mapped[str] = mapped_column(String, nullable=False)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    direction: Mapped[str] = mapped_column(String, nullable=False)
+    confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
+    predicted_price_24h: Mapped[float | None] = mapped_column(Float, nullable=True)
+    ai_stop_loss: Mapped[float | None] = mapped_column(Float, nullable=True)
+    position_size: Mapped[float | None] = mapped_column(Float, nullable=True)
+    ttl_sec: Mapped[int] = mapped_column(Integer, nullable=False)
+    meta: Mapped[dict | None] = mapped_column("metadata", JSON, nullable=True)
@@ -82,3 +82,16 @@ class StrategyAlignmentOut(StrategyAlignmentBase):
     alignment_id: str
     created_at: datetime | None = None
     updated_at: datetime | None = None
+
+
+class StrategyAlignmentAgentRequest(BaseModel):
+    """Optional sweep settings for POST /alignments/{id}/request-agent (see agents/sweep.py)."""
+
+    # {"freqtrade_overrides": {"dotted.path": [values] | {"min", "max", "step"}}, "freqai_overrides": {...}}
+    space: dict[str, dict[str, Any]] | None = None
+    pairs: list[str] | None = None
+    start: int | None = None
+    end: int | None = None
+    timeframe: str | None = None
+    metric: str | None = None
+    max_candidates: int | None = Field(default=None, ge=1, le=5000)
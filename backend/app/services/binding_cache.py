@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.neuro import ProviderBinding
+
+logger = logging.getLogger(__name__)
+
+BINDINGS_CHANNEL = "signals.bindings.invalidate"
+# Published instead of a bot id when every entry should be dropped.
+INVALIDATE_ALL = "*"
+
+
+class BindingCache:
+    """In-process bot -> provider_id cache; a disabled binding counts as no binding in both directions.
+
+    Entries are dropped when attach_provider publishes on BINDINGS_CHANNEL; the TTL only bounds
+    staleness if a pub/sub message is missed (e.g. during a reconnect).
+    """
+
+    def __init__(self, ttl_sec: float) -> None:
+        self.ttl_sec = ttl_sec
+        self._by_bot: dict[str, tuple[str | None, float]] = {}
+        self._bots_by_provider: dict[str, tuple[list[str], float]] = {}
+
+    async def provider_for(self, session: AsyncSession, bot_id: str) -> str | None:
+        """Provider of the bot's enabled binding, None if it has none."""
+        hit = self._by_bot.get(bot_id)
+        if hit is not None and time.monotonic() - hit[1] < self.ttl_sec:
+            return hit[0]
+        provider_id = await session.scalar(
+            select(ProviderBinding.provider_id).where(ProviderBinding.bot_id == bot_id, ProviderBinding.enabled.is_(True))
+        )
+        self._by_bot[bot_id] = (provider_id, time.monotonic())
+        return provider_id
+
+    async def bots_for(self, session: AsyncSession, provider_id: str) -> list[str]:
+        """Enabled bots bound to `provider_id` (reverse lookup used for push delivery)."""
+        hit = self._bots_by_provider.get(provider_id)
+        if hit is not None and time.monotonic() - hit[1] < self.ttl_sec:
+            return hit[0]
+        rows = await session.scalars(
+            select(ProviderBinding.bot_id).where(
+                ProviderBinding.provider_id == provider_id, ProviderBinding.enabled.is_(True)
+            )
+        )
+        bots = list(rows)
+        self._bots_by_provider[provider_id] = (bots, time.monotonic())
+        return bots
+
+    def prime(self, bot_id: str, provider_id: str | None) -> None:
+        """Seed an entry without a DB round trip (warm-up, benchmarks)."""
+        self._by_bot[bot_id] = (provider_id, time.monotonic())
+
+    def invalidate(self, bot_id: str | None = None) -> None:
+        # A rebind moves a bot between providers, so any change drops the whole reverse map.
+        self._bots_by_provider.clear()
+        if bot_id is None or bot_id == INVALIDATE_ALL:
+            self._by_bot.clear()
+        else:
+            self._by_bot.pop(bot_id, None)
+
+
+_cache: BindingCache | None = None
+
+
+def get_binding_cache() -> BindingCache:
+    global _cache
+    if _cache is None:
+        _cache = BindingCache(settings.binding_cache_ttl_sec)
+    return _cache
+
+
+async def publish_invalidation(bot_id: str) -> None:
+    get_binding_cache().invalidate(bot_id)
+    await get_redis().publish(BINDINGS_CHANNEL, bot_id)
+
+
+async def run_invalidation_listener() -> None:
+    cache = get_binding_cache()
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(BINDINGS_CHANNEL)
+            # Anything published while we were not subscribed is unknown: start clean.
+            cache.invalidate()
+            try:
+                async for message in pubsub.listen():
+                    cache.invalidate(message.get("data"))
+            finally:
+                await pubsub.aclose()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # noqa: BLE001
+            logger.warning("binding invalidation listener error: %s", e)
+            await asyncio.sleep(1)
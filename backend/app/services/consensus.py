@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.services.signal_store import (
+    SIGNAL_EXPIRY_KEY,
+    SIGNAL_LAST_PREFIX,
+    SIGNAL_PROVIDER_STREAM_PREFIX,
+    SIGNAL_PROVIDERS_KEY,
+    STREAM_MAXLEN,
+)
+
+logger = logging.getLogger(__name__)
+
+MODULE_TYPE = "consensus"
+
+# member provider id -> hash {consensus provider id: weight}; read inside the ingest script.
+MEMBERS_PREFIX = "signals.consensus.members:"
+# consensus provider id -> hash of running per-pair sums ("s\x1f{pair}") and the contribution each
+# member currently has in them ("c\x1f{pair}\x1f{member}").
+STATE_PREFIX = "signals.consensus.state:"
+# Contribution expiry index: member "{consensus}\x1f{pair}\x1f{member}", score = ts + ttl_sec of that vote.
+EXPIRY_KEY = "signals.consensus.expiry"
+SWEEP_BATCH = 500
+# |score| below this reads as "flat".
+FLAT_BAND = 0.2
+
+DIRECTION_SCORES = {"buy": 1.0, "long": 1.0, "sell": -1.0, "short": -1.0}
+
+_SEP = "\x1f"
+
+# Shared by the ingest and expiry scripts. fold() swaps one member's vote for a pair: subtract its
+# previous contribution from the running sums, add the new one, and rewrite the consensus provider's
+# last signal for that pair. The aggregate also keeps each member's (ts, exp), so the signal's ts and
+# ttl follow the votes still counted after one is retracted or replaced (O(members of the pair)).
+# Keys are derived in-script, so this assumes a single Redis node.
+_LIB = """
+local SEP, STATE, LAST, EXPIRY, STREAM, PROVIDERS = '{sep}', '{state}', '{last}', '{expiry}', '{stream}', '{providers}'
+local LAST_EXPIRY, GRACE = '{last_expiry}', {grace}
+local FLAT, MAXLEN = {flat}, '{maxlen}'
+
+local function fold(cid, pair, member, vote)
+  local state = STATE .. cid
+  local cfield = 'c' .. SEP .. pair .. SEP .. member
+  local sfield = 's' .. SEP .. pair
+  local raw = redis.call('HGET', state, sfield)
+  local a = raw and cjson.decode(raw) or {{n = 0, w = 0, ws = 0, ws2 = 0, wc = 0, wt = 0, ts = 0, exp = 0}}
+  local old = redis.call('HGET', state, cfield)
+  if old then
+    old = cjson.decode(old)
+    a.n = a.n - 1
+    a.w = a.w - old.w
+    a.ws = a.ws - old.w * old.s
+    a.ws2 = a.ws2 - old.w * old.s * old.s
+    a.wc = a.wc - old.w * old.c
+    a.wt = a.wt - old.w * old.ts
+  end
+  if vote then
+    a.n = a.n + 1
+    a.w = a.w + vote.w
+    a.ws = a.ws + vote.w * vote.s
+    a.ws2 = a.ws2 + vote.w * vote.s * vote.s
+    a.wc = a.wc + vote.w * vote.c
+    a.wt = a.wt + vote.w * vote.ts
+    redis.call('HSET', state, cfield, cjson.encode(vote))
+    redis.call('ZADD', EXPIRY, vote.exp, cid .. SEP .. pair .. SEP .. member)
+  else
+    redis.call('HDEL', state, cfield)
+  end
+  a.v = a.v or {{}}
+  a.v[member] = vote and {{vote.ts, vote.exp}} or nil
+  if next(a.v) ~= nil then
+    a.ts, a.exp = 0, 0
+    for _, te in pairs(a.v) do
+      a.ts = math.max(a.ts, te[1])
+      a.exp = math.max(a.exp, te[2])
+    end
+  end
+
+  if a.n <= 0 or a.w <= 0 then
+    redis.call('HDEL', state, sfield)
+    redis.call('HDEL', LAST .. cid, pair)
+    redis.call('ZREM', LAST_EXPIRY, cid .. SEP .. pair)
+    return nil
+  end
+  redis.call('HSET', state, sfield, cjson.encode(a))
+
+  local score = a.ws / a.w
+  local direction = 'flat'
+  if score > FLAT then direction = 'buy' elseif score < -FLAT then direction = 'sell' end
+  local metadata = {{
+    score = score,
+    dispersion = math.sqrt(math.max(0, a.ws2 / a.w - score * score)),
+    members = a.n,
+    weight = a.w,
+    mean_ts = a.wt / a.w,
+  }}
+  local out = {{
+    signal_id = cid .. ':' .. pair .. ':' .. a.ts,
+    provider_id = cid,
+    pair = pair,
+    direction = direction,
+    confidence = a.wc / a.w,
+    ts = a.ts,
+    ttl_sec = a.exp - a.ts,
+    payload = {{metadata = metadata}},
+  }}
+  redis.call('HSET', LAST .. cid, pair, cjson.encode(out))
+  -- Same expiry index as member providers' last signals, so the sweeper drops it once due.
+  redis.call('ZADD', LAST_EXPIRY, a.exp + GRACE, cid .. SEP .. pair)
+  return {{direction = direction, confidence = out.confidence, metadata = metadata, ts = a.ts, ttl = out.ttl_sec}}
+end
+
+local function emit(cid, signals, ts, ttl)
+  if next(signals) == nil then return end
+  local envelope = {{schema = 'th.signal.v1', provider_id = cid, timestamp = ts, ttl_sec = ttl, signals = signals}}
+  redis.call('SADD', PROVIDERS, cid)
+  redis.call('XADD', STREAM .. cid, 'MAXLEN', '~', MAXLEN, '*', 'schema', 'th.signal.v1', 'payload', cjson.encode(envelope))
+end
+""".format(
+    sep=_SEP,
+    state=STATE_PREFIX,
+    last=SIGNAL_LAST_PREFIX,
+    expiry=EXPIRY_KEY,
+    last_expiry=SIGNAL_EXPIRY_KEY,
+    grace=settings.signal_last_grace_sec,
+    stream=SIGNAL_PROVIDER_STREAM_PREFIX,
+    providers=SIGNAL_PROVIDERS_KEY,
+    flat=FLAT_BAND,
+    maxlen=STREAM_MAXLEN,
+)
+
+# KEYS[1] = members hash of the ingesting provider.
+# ARGV = provider_id, ts, ttl_sec, then (pair, score, confidence) per signal.
+_INGEST_LUA = _LIB + """
+local consensus = redis.call('HGETALL', KEYS[1])
+if #consensus == 0 then return 0 end
+local member, ts, ttl = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+for i = 1, #consensus, 2 do
+  local cid, weight = consensus[i], tonumber(consensus[i + 1])
+  local signals, out_ttl = {}, 0
+  for j = 4, #ARGV, 3 do
+    local vote = {w = weight, s = tonumber(ARGV[j + 1]), c = tonumber(ARGV[j + 2]), ts = ts, exp = ts + ttl}
+    local out = fold(cid, ARGV[j], member, vote)
+    if out then
+      signals[ARGV[j]] = {direction = out.direction, confidence = out.confidence, metadata = out.metadata}
+      out_ttl = math.max(out_ttl, out.ts + out.ttl - ts)
+    end
+  end
+  emit(cid, signals, ts, out_ttl)
+end
+return #consensus / 2
+"""
+
+# KEYS[1] = expiry index. ARGV = now, batch size.
+_EXPIRE_LUA = _LIB + """
+local now = tonumber(ARGV[1])
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[2]))
+local touched, ttls = {}, {}
+for _, item in ipairs(due) do
+  local first = string.find(item, SEP, 1, true)
+  local last = first
+  while true do
+    local nxt = string.find(item, SEP, last + 1, true)
+    if not nxt then break end
+    last = nxt
+  end
+  local cid, pair, member = string.sub(item, 1, first - 1), string.sub(item, first + 1, last - 1), string.sub(item, last + 1)
+  local vote = redis.call('HGET', STATE .. cid, 'c' .. SEP .. pair .. SEP .. member)
+  -- Only retract the vote that expired; a newer one from the same member has a later expiry.
+  if vote and cjson.decode(vote).exp <= now then
+    local out = fold(cid, pair, member, nil)
+    touched[cid] = touched[cid] or {}
+    if out then
+      touched[cid][pair] = {direction = out.direction, confidence = out.confidence, metadata = out.metadata}
+      ttls[cid] = math.max(ttls[cid] or 0, out.ts + out.ttl - now)
+    end
+  end
+end
+if #due > 0 then
+  redis.call('ZREM', KEYS[1], unpack(due))
+end
+for cid, signals in pairs(touched) do
+  emit(cid, signals, math.floor(now), ttls[cid] or 0)
+end
+return #due
+"""
+
+
+def parse_members(config: dict[str, Any], consensus_id: str | None = None) -> dict[str, float]:
+    """`connector_config.members`: {provider_id: weight} with positive weights."""
+    members = config.get("members")
+    if not isinstance(members, dict) or not members:
+        raise ValueError("connector_config.members must be a non-empty {provider_id: weight} object")
+    out: dict[str, float] = {}
+    for provider_id, weight in members.items():
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool) or weight <= 0:
+            raise ValueError(f"weight for {provider_id!r} must be a positive number")
+        if provider_id == consensus_id:
+            raise ValueError("a consensus provider cannot be its own member")
+        out[provider_id] = float(weight)
+    return out
+
+
+def _vote_args(envelope: dict[str, Any]) -> list[Any]:
+    args: list[Any] = [envelope["provider_id"], envelope["timestamp"], envelope["ttl_sec"]]
+    for pair, signal in envelope["signals"].items():
+        confidence = signal.get("confidence")
+        args += [pair, DIRECTION_SCORES.get(str(signal["direction"]).lower(), 0.0), 1.0 if confidence is None else confidence]
+    return args
+
+
+_ingest_script: AsyncScript | None = None
+
+
+async def queue_consensus(pipe: Pipeline, envelope: dict[str, Any]) -> None:
+    """Fold the envelope into every consensus the provider is a member of (a no-op server-side otherwise)."""
+    global _ingest_script
+    if not envelope["signals"]:
+        return
+    if _ingest_script is None:
+        _ingest_script = get_redis().register_script(_INGEST_LUA)
+    # On a pipeline this only queues the EVALSHA; the pipeline loads the script if Redis lacks it.
+    await _ingest_script(keys=[f"{MEMBERS_PREFIX}{envelope['provider_id']}"], args=_vote_args(envelope), client=pipe)
+
+
+async def sync_members(redis: Redis, consensus_id: str, old: dict[str, float], new: dict[str, float]) -> None:
+    """Point member providers at the consensus. On any change the aggregates restart from the next votes."""
+    if old == new:
+        return
+    pipe = redis.pipeline(transaction=True)
+    for provider_id in old.keys() - new.keys():
+        pipe.hdel(f"{MEMBERS_PREFIX}{provider_id}", consensus_id)
+    for provider_id, weight in new.items():
+        pipe.hset(f"{MEMBERS_PREFIX}{provider_id}", consensus_id, weight)
+    # Orphaned expiry entries are skipped by the sweep (no matching vote) and age out.
+    pipe.delete(f"{STATE_PREFIX}{consensus_id}", f"{SIGNAL_LAST_PREFIX}{consensus_id}")
+    await pipe.execute()
+
+
+async def expire_votes(redis: Redis, now: float | None = None) -> int:
+    now = time.time() if now is None else now
+    script = redis.register_script(_EXPIRE_LUA)
+    expired = 0
+    while True:
+        n = int(await script(keys=[EXPIRY_KEY], args=[now, SWEEP_BATCH]))
+        expired += n
+        if n < SWEEP_BATCH:
+            return expired
+
+
+async def run_expiry_loop(interval_sec: float | None = None) -> None:
+    """Retract member votes once they pass their ttl, so stale providers stop counting."""
+    interval = interval_sec or settings.signal_sweep_sec
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await expire_votes(get_redis())
+        except Exception as e:  # noqa: BLE001
+            logger.warning("consensus expiry error: %s", e)
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import asyncio
+import weakref
+from collections import OrderedDict
+from typing import Any
+
+import httpx
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.market import CandleOut
+from app.services.market_clients import TF_SECONDS, fetch_candles, now_ts_ms, resolve_symbol
+from app.services.market_store import get_cached_raw_many, load_closes_from_db, set_cached
+
+# A pair needs at least this share of bars in the window, otherwise it is dropped from the matrix.
+MIN_COVERAGE = 0.9
+FETCH_CONCURRENCY = 8
+MAX_STATES = 64
+# Bars re-read besides the new ones on an incremental update, to pick up bars filled in late; older
+# late fills wait for the periodic full rebuild.
+REFILL_BARS = 8
+
+
+class RollingMoments:
+    """Running pairwise-complete moments over the last `window` return rows.
+
+    Every pair (i, j) keeps its own count and sums over the rows where both returns exist, so a gap in
+    one series only shortens the samples of its own pairs. New bars are applied as rank-k updates (add
+    new rows, subtract evicted ones), so a bar close costs O(k * N^2) instead of recomputing
+    O(window * N^2).
+    """
+
+    def __init__(self, pairs: list[str], rows: np.ndarray, last_ts: int) -> None:
+        self.pairs = pairs
+        self.last_ts = last_ts
+        self.updates = 0
+        self._rows = rows.copy()
+        n = rows.shape[1]
+        # _n[i, j]: rows where both exist; _s[i, j] / _q[i, j]: sum of x_i / x_i^2 over them; _c: sum of x_i * x_j.
+        self._n, self._s, self._q, self._c = (np.zeros((n, n)) for _ in range(4))
+        self._apply(rows, 1.0)
+
+    @property
+    def window(self) -> int:
+        return int(self._rows.shape[0])
+
+    @property
+    def count(self) -> int:
+        """Smallest pairwise sample."""
+        return int(self._n.min()) if self._n.size else 0
+
+    def _apply(self, rows: np.ndarray, sign: float) -> None:
+        if not rows.shape[0]:
+            return
+        present = np.isfinite(rows)
+        x = np.where(present, rows, 0.0)
+        m = present.astype(np.float64)
+        self._n += sign * (m.T @ m)
+        self._s += sign * (x.T @ m)
+        self._q += sign * ((x * x).T @ m)
+        self._c += sign * (x.T @ x)
+
+    def push(self, rows: np.ndarray, k: int, last_ts: int) -> None:
+        """Advance the window by `k` bars.
+
+        `rows` are the newest rows of the advanced window, the last `k` of them new. The ones before
+        re-read bars already buffered; those that differ (a bar filled in late) replace the old values.
+        """
+        m = int(rows.shape[0]) - k
+        old = self._rows[self.window - m :]
+        new = rows[:m]
+        changed = ~((old == new) | (np.isnan(old) & np.isnan(new))).all(axis=1)
+        self._apply(np.concatenate([self._rows[:k], old[changed]]), -1.0)
+        self._apply(np.concatenate([new[changed], rows[m:]]), 1.0)
+
+        self._rows = np.concatenate([self._rows[k:], rows[m:]])
+        self._rows[self.window - rows.shape[0] :] = rows
+        self.last_ts = last_ts
+        self.updates += k + int(changed.sum())
+
+    def cov(self) -> np.ndarray:
+        n = self._n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = (self._c - self._s * self._s.T / n) / (n - 1)
+        out[n < 2] = np.nan
+        return out
+
+    def corr(self, cov: np.ndarray | None = None) -> np.ndarray:
+        cov = self.cov() if cov is None else cov
+        n = self._n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Each pair is scaled by the variances over its own common rows, as in a pairwise Pearson.
+            var = np.clip((self._q - self._s * self._s / n) / (n - 1), 0.0, None)
+            out = cov / np.sqrt(var * var.T)
+        np.fill_diagonal(out, 1.0)
+        return np.clip(out, -1.0, 1.0)
+
+
+def aligned_closes(
+    series: dict[str, tuple[np.ndarray, np.ndarray]], pairs: list[str], *, end_ts: int, tf_ms: int, window: int
+) -> np.ndarray:
+    """Closes on a fixed bar grid of `window` + 1 bars ending at `end_ts` [window + 1 x N]; missing bars are NaN."""
+    grid = end_ts - tf_ms * np.arange(window, -1, -1, dtype=np.int64)
+    closes = np.full((grid.shape[0], len(pairs)), np.nan)
+    for i, pair in enumerate(pairs):
+        ts, close = series.get(pair, (np.empty(0, dtype=np.int64), np.empty(0)))
+        if ts.size:
+            idx = np.clip(np.searchsorted(ts, grid), 0, ts.size - 1)
+            hit = ts[idx] == grid
+            closes[hit, i] = close[idx[hit]]
+    return closes
+
+
+def log_returns(closes: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.diff(np.log(closes), axis=0)
+
+
+def returns_matrix(
+    series: dict[str, tuple[np.ndarray, np.ndarray]],
+    pairs: list[str],
+    *,
+    end_ts: int,
+    tf_ms: int,
+    window: int,
+) -> tuple[list[str], list[str], np.ndarray]:
+    """Align closes on a fixed bar grid ending at `end_ts` and return (kept, dropped, log returns [window x N])."""
+    closes = aligned_closes(series, pairs, end_ts=end_ts, tf_ms=tf_ms, window=window)
+    keep = np.isfinite(closes).mean(axis=0) >= MIN_COVERAGE
+    kept = [p for p, k in zip(pairs, keep) if k]
+    dropped = [p for p, k in zip(pairs, keep) if not k]
+    if not kept:
+        return kept, dropped, np.empty((window, 0))
+    return kept, dropped, log_returns(closes[:, keep])
+
+
+def _closed(ts: np.ndarray, close: np.ndarray, end_ts: int) -> tuple[np.ndarray, np.ndarray]:
+    keep = ts <= end_ts
+    return ts[keep], close[keep]
+
+
+async def load_closes(
+    session: AsyncSession | None,
+    *,
+    exchange: str,
+    pairs: list[str],
+    timeframe: str,
+    since_ts: int,
+    end_ts: int,
+    min_bars: int,
+) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """Closed-bar close series per pair: Redis cache first, then Postgres, then the exchange."""
+    out: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    cached = await get_cached_raw_many(exchange, pairs, timeframe)
+    for pair, rows in cached.items():
+        ts = np.fromiter((r["ts"] for r in rows), dtype=np.int64, count=len(rows))
+        close = np.fromiter((r["close"] for r in rows), dtype=np.float64, count=len(rows))
+        ts, close = _closed(ts, close, end_ts)
+        if int((ts >= since_ts).sum()) >= min_bars:
+            out[pair] = (ts, close)
+
+    missing = [p for p in pairs if p not in out]
+    if missing and session is not None:
+        symbols = {resolve_symbol(p, exchange): p for p in missing}
+        stored = await load_closes_from_db(
+            session, exchange=exchange, symbols=list(symbols), timeframe=timeframe, since_ts=since_ts
+        )
+        for symbol, (ts_list, close_list) in stored.items():
+            ts, close = _closed(np.asarray(ts_list, dtype=np.int64), np.asarray(close_list, dtype=np.float64), end_ts)
+            if ts.size >= min_bars:
+                out[symbols[symbol]] = (ts, close)
+
+    missing = [p for p in pairs if p not in out]
+    sem = asyncio.Semaphore(FETCH_CONCURRENCY)
+    # Bars in (since_ts, end_ts], plus the still-open bar and one spare.
+    limit = (end_ts - since_ts) // (TF_SECONDS[timeframe] * 1000) + 2
+
+    async def _fetch(pair: str) -> None:
+        async with sem:
+            try:
+                raw = await fetch_candles(exchange, pair, timeframe, limit=limit)
+            except (httpx.HTTPError, ValueError):
+                return
+        rows = [CandleOut(ts=c.ts, open=c.open, high=c.high, low=c.low, close=c.close, volume=c.volume) for c in raw]
+        if rows:
+            await set_cached(exchange, pair, timeframe, rows)
+            ts = np.fromiter((c.ts for c in rows), dtype=np.int64, count=len(rows))
+            close = np.fromiter((c.close for c in rows), dtype=np.float64, count=len(rows))
+            out[pair] = _closed(ts, close, end_ts)
+
+    await asyncio.gather(*(_fetch(p) for p in missing))
+    return out
+
+
+_states: OrderedDict[tuple, RollingMoments] = OrderedDict()
+_memo: OrderedDict[tuple, dict[str, Any]] = OrderedDict()
+# One lock per key while a request is computing it: the shared RollingMoments must advance once per bar.
+_locks: weakref.WeakValueDictionary[tuple, asyncio.Lock] = weakref.WeakValueDictionary()
+
+
+def _remember(store: OrderedDict, key: tuple, value: Any) -> None:
+    store[key] = value
+    store.move_to_end(key)
+    while len(store) > MAX_STATES:
+        store.popitem(last=False)
+
+
+async def correlation(
+    session: AsyncSession | None,
+    *,
+    exchange: str,
+    pairs: list[str],
+    timeframe: str,
+    window: int,
+    include_cov: bool = False,
+) -> dict[str, Any]:
+    tf_ms = TF_SECONDS[timeframe] * 1000
+    # Only closed bars take part, so results are stable (and memoized) until the next bar closes.
+    end_ts = (now_ts_ms() // tf_ms) * tf_ms - tf_ms
+    key = (exchange, timeframe, tuple(pairs), window)
+
+    memo = _memo.get(key)
+    if memo is not None and memo["as_of"] == end_ts and (memo.get("cov") is not None or not include_cov):
+        return memo
+
+    lock = _locks.get(key)
+    if lock is None:
+        lock = _locks[key] = asyncio.Lock()
+    async with lock:
+        # A concurrent request may have brought the state up to date while this one waited.
+        memo = _memo.get(key)
+        if memo is not None and memo["as_of"] == end_ts and (memo.get("cov") is not None or not include_cov):
+            return memo
+        return await _compute(session, key, end_ts=end_ts, tf_ms=tf_ms, include_cov=include_cov)
+
+
+async def _compute(
+    session: AsyncSession | None, key: tuple, *, end_ts: int, tf_ms: int, include_cov: bool
+) -> dict[str, Any]:
+    exchange, timeframe, pair_key, window = key
+    pairs = list(pair_key)
+    state = _states.get(key)
+    k = (end_ts - state.last_ts) // tf_ms if state is not None else -1
+    # Periodically rebuild from scratch so floating-point drift of the running sums stays bounded.
+    if state is not None and k >= 0 and state.updates + k < state.window:
+        # Re-read only the new bars plus a short tail that may have been filled in late; the pair set
+        # stays as chosen at the last rebuild.
+        tail = min(state.window, k + REFILL_BARS)
+        series = await load_closes(
+            session,
+            exchange=exchange,
+            pairs=state.pairs,
+            timeframe=timeframe,
+            since_ts=end_ts - tail * tf_ms,
+            end_ts=end_ts,
+            min_bars=int((tail + 1) * MIN_COVERAGE),
+        )
+        state.push(log_returns(aligned_closes(series, state.pairs, end_ts=end_ts, tf_ms=tf_ms, window=tail)), k, end_ts)
+        _states.move_to_end(key)
+        kept = state.pairs
+        dropped = [p for p in pairs if p not in kept]
+    else:
+        series = await load_closes(
+            session,
+            exchange=exchange,
+            pairs=pairs,
+            timeframe=timeframe,
+            since_ts=end_ts - window * tf_ms,
+            end_ts=end_ts,
+            min_bars=int((window + 1) * MIN_COVERAGE),
+        )
+        kept, dropped, rets = returns_matrix(series, pairs, end_ts=end_ts, tf_ms=tf_ms, window=window)
+        state = RollingMoments(kept, rets, end_ts)
+        _remember(_states, key, state)
+    cov = state.cov()
+    corr = state.corr(cov)
+
+    result: dict[str, Any] = {
+        "exchange": exchange,
+        "timeframe": timeframe,
+        "window": window,
+        "as_of": end_ts,
+        "bars": state.count,
+        "pairs": kept,
+        "dropped": dropped,
+        "corr": np.where(np.isfinite(corr), corr, None).tolist(),
+        "cov": np.where(np.isfinite(cov), cov, None).tolist() if include_cov else None,
+    }
+    _remember(_memo, key, result)
+    return result
@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from collections.abc import Iterable
+from itertools import islice
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILENAME = "instruments.json"
+SNAPSHOT_VERSION = 1
+
+# Exchange-specific asset codes -> the codes we use in normalized pairs.
+ASSET_ALIASES = {"XBT": "BTC", "XDG": "DOGE"}
+
+
+def _asset(code: str) -> str:
+    code = (code or "").upper()
+    return ASSET_ALIASES.get(code, code)
+
+
+class Instrument:
+    __slots__ = ("exchange", "symbol", "pair", "base", "quote", "kind", "status")
+
+    def __init__(self, exchange: str, symbol: str, base: str, quote: str, kind: str = "spot", status: str = "trading") -> None:
+        self.exchange = exchange
+        self.symbol = symbol
+        self.base = _asset(base)
+        self.quote = _asset(quote)
+        self.pair = f"{self.base}/{self.quote}"
+        self.kind = kind
+        self.status = status
+
+    def as_row(self) -> list[str]:
+        return [self.exchange, self.symbol, self.base, self.quote, self.kind, self.status]
+
+
+class InstrumentRegistry:
+    """Immutable, indexed view over exchange instruments.
+
+    Lookups are dict-based in both directions; refreshes build a new registry and swap it in.
+    """
+
+    def __init__(self, instruments: Iterable[Instrument], aliases: dict[str, dict[str, str]] | None = None) -> None:
+        self._by_pair: dict[str, dict[str, str]] = {}
+        self._by_native: dict[tuple[str, str], str] = {}
+        self._by_key: dict[tuple[str, str], Instrument] = {}
+        self._native_any: dict[str, str] = {}
+        self._kinds: dict[str, set[str]] = {}
+        self._instruments: list[Instrument] = []
+
+        for inst in instruments:
+            self._instruments.append(inst)
+            self._by_pair.setdefault(inst.pair, {})[inst.exchange] = inst.symbol
+            self._by_native[(inst.exchange, inst.symbol)] = inst.pair
+            self._by_key[(inst.exchange, inst.symbol)] = inst
+            self._native_any.setdefault(inst.symbol.upper(), inst.pair)
+            self._kinds.setdefault(inst.pair, set()).add(inst.kind)
+
+        # Hand-maintained aliases (e.g. BTC/USDT served by coinbase BTC-USD) win for forward lookups,
+        # but never shadow the exchange's own naming for reverse lookups.
+        for pair, per_ex in (aliases or {}).items():
+            self._by_pair.setdefault(pair, {}).update(per_ex)
+            for exchange, symbol in per_ex.items():
+                self._by_native.setdefault((exchange, symbol), pair)
+                self._native_any.setdefault(symbol.upper(), pair)
+
+        self._sorted_pairs = sorted(self._by_pair)
+        self._haystack = [f"{p} {p.replace('/', '')}" for p in self._sorted_pairs]
+
+    def __len__(self) -> int:
+        return len(self._by_pair)
+
+    def __contains__(self, pair: object) -> bool:
+        return pair in self._by_pair
+
+    def pairs(self) -> list[str]:
+        return list(self._sorted_pairs)
+
+    def instruments(self) -> list[Instrument]:
+        return list(self._instruments)
+
+    def instrument(self, symbol: str, exchange: str) -> Instrument | None:
+        return self._by_key.get((exchange, symbol))
+
+    def exchanges(self, pair: str) -> dict[str, str]:
+        return dict(self._by_pair.get(pair) or {})
+
+    def kinds(self, pair: str) -> list[str]:
+        return sorted(self._kinds.get(pair) or ())
+
+    def native(self, pair: str, exchange: str) -> str | None:
+        per_ex = self._by_pair.get(pair)
+        if not per_ex:
+            return None
+        return per_ex.get(exchange)
+
+    def normalized(self, symbol: str, exchange: str | None = None) -> str | None:
+        """Pair for a native symbol on `exchange`; without an exchange, the first listing under that symbol."""
+        if exchange is not None:
+            return self._by_native.get((exchange, symbol)) or self._by_native.get((exchange, symbol.upper()))
+        return self._native_any.get(symbol.upper())
+
+    def search(self, query: str, limit: int = 50, exchange: str | None = None) -> list[str]:
+        """Prefix matches first (binary search over sorted pairs), then substring matches."""
+        q = (query or "").strip().upper()
+        if not q:
+            candidates = (p for p in self._sorted_pairs if exchange is None or exchange in self._by_pair[p])
+            return list(islice(candidates, limit))
+
+        out: list[str] = []
+        seen: set[str] = set()
+
+        def _take(pair: str) -> bool:
+            if pair in seen or (exchange is not None and exchange not in self._by_pair[pair]):
+                return False
+            seen.add(pair)
+            out.append(pair)
+            return len(out) >= limit
+
+        start = bisect.bisect_left(self._sorted_pairs, q)
+        for pair in self._sorted_pairs[start:]:
+            if not pair.startswith(q):
+                break
+            if _take(pair):
+                return out
+
+        for pair, hay in zip(self._sorted_pairs, self._haystack):
+            if q in hay and _take(pair):
+                break
+        return out
+
+    def to_snapshot(self) -> dict[str, Any]:
+        return {"version": SNAPSHOT_VERSION, "instruments": [i.as_row() for i in self._instruments]}
+
+    @staticmethod
+    def instruments_from_snapshot(data: dict[str, Any]) -> list[Instrument]:
+        if data.get("version") != SNAPSHOT_VERSION:
+            return []
+        return [Instrument(*row) for row in data.get("instruments") or []]
+
+
+_registry: InstrumentRegistry | None = None
+
+
+def _aliases() -> dict[str, dict[str, str]]:
+    from app.services.market_clients import SYMBOL_MAP
+
+    return SYMBOL_MAP
+
+
+def snapshot_path() -> Path:
+    return Path(settings.data_dir) / SNAPSHOT_FILENAME
+
+
+def _read_snapshot(path: Path) -> list[Instrument]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return []
+    return InstrumentRegistry.instruments_from_snapshot(data)
+
+
+def _write_snapshot(path: Path, data: dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def get_registry() -> InstrumentRegistry:
+    global _registry
+    if _registry is None:
+        _registry = InstrumentRegistry(_read_snapshot(snapshot_path()), aliases=_aliases())
+    return _registry
+
+
+def set_registry(registry: InstrumentRegistry) -> None:
+    global _registry
+    _registry = registry
+
+
+async def _load_binance(client: httpx.AsyncClient) -> list[Instrument]:
+    res = await client.get("https://api.binance.com/api/v3/exchangeInfo")
+    res.raise_for_status()
+    return [
+        Instrument("binance", s["symbol"], s["baseAsset"], s["quoteAsset"], "spot", str(s.get("status", "")).lower())
+        for s in res.json().get("symbols", [])
+        if s.get("status") == "TRADING"
+    ]
+
+
+async def _load_okx(client: httpx.AsyncClient) -> list[Instrument]:
+    res = await client.get("https://www.okx.com/api/v5/public/instruments", params={"instType": "SPOT"})
+    res.raise_for_status()
+    return [
+        Instrument("okx", s["instId"], s["baseCcy"], s["quoteCcy"], "spot", s.get("state", ""))
+        for s in res.json().get("data", [])
+        if s.get("state") == "live"
+    ]
+
+
+async def _load_bybit(client: httpx.AsyncClient) -> list[Instrument]:
+    # fetch_bybit reads linear klines, so the registry tracks linear perps for bybit.
+    out: list[Instrument] = []
+    cursor = ""
+    for _ in range(20):
+        params = {"category": "linear", "limit": "1000"}
+        if cursor:
+            params["cursor"] = cursor
+        res = await client.get("https://api.bybit.com/v5/market/instruments-info", params=params)
+        res.raise_for_status()
+        result = res.json().get("result") or {}
+        for s in result.get("list", []):
+            if s.get("status") == "Trading":
+                out.append(Instrument("bybit", s["symbol"], s["baseCoin"], s["quoteCoin"], "perp", "trading"))
+        cursor = result.get("nextPageCursor") or ""
+        if not cursor:
+            break
+    return out
+
+
+async def _load_kraken(client: httpx.AsyncClient) -> list[Instrument]:
+    res = await client.get("https://api.kraken.com/0/public/AssetPairs")
+    res.raise_for_status()
+    out: list[Instrument] = []
+    for info in (res.json().get("result") or {}).values():
+        wsname = info.get("wsname") or ""
+        if "/" not in wsname or not info.get("altname"):
+            continue
+        base, quote = wsname.split("/", 1)
+        out.append(Instrument("kraken", info["altname"], base, quote, "spot", info.get("status", "online")))
+    return out
+
+
+async def _load_coinbase(client: httpx.AsyncClient) -> list[Instrument]:
+    res = await client.get("https://api.exchange.coinbase.com/products")
+    res.raise_for_status()
+    return [
+        Instrument("coinbase", p["id"], p["base_currency"], p["quote_currency"], "spot", p.get("status", ""))
+        for p in res.json()
+        if p.get("status") == "online"
+    ]
+
+
+LOADERS = {
+    "binance": _load_binance,
+    "okx": _load_okx,
+    "bybit": _load_bybit,
+    "kraken": _load_kraken,
+    "coinbase": _load_coinbase,
+}
+
+
+async def refresh_registry() -> InstrumentRegistry:
+    """Reload instrument metadata from all exchanges and swap in a new registry.
+
+    Exchanges that fail keep their previously known instruments.
+    """
+    current = get_registry()
+    headers = {"User-Agent": "TRADE_SYSTEM/1.0 (instruments)"}
+    async with httpx.AsyncClient(timeout=20, headers=headers) as client:
+        results = await asyncio.gather(*(fn(client) for fn in LOADERS.values()), return_exceptions=True)
+
+    instruments: list[Instrument] = []
+    for exchange, res in zip(LOADERS, results):
+        if isinstance(res, BaseException):
+            logger.warning("instrument refresh failed for %s: %s", exchange, res)
+            instruments.extend(i for i in current.instruments() if i.exchange == exchange)
+        else:
+            instruments.extend(res)
+
+    registry = InstrumentRegistry(instruments, aliases=_aliases())
+    set_registry(registry)
+    await asyncio.to_thread(_write_snapshot, snapshot_path(), registry.to_snapshot())
+    return registry
+
+
+async def run_refresh_loop(interval_sec: int | None = None) -> None:
+    interval = interval_sec or settings.instrument_refresh_sec
+    # A recent snapshot is good enough to serve from; don't hit every exchange on each restart.
+    try:
+        age = time.time() - snapshot_path().stat().st_mtime
+    except OSError:
+        age = interval
+    await asyncio.sleep(max(0.0, interval - age))
+    while True:
+        try:
+            registry = await refresh_registry()
+            logger.info("instrument registry refreshed: %d pairs", len(registry))
+        except Exception as e:  # noqa: BLE001
+            logger.warning("instrument registry refresh error: %s", e)
+        await asyncio.sleep(interval)
@@ -7,72 +7,128 @@ from typing import Literal
 
 import httpx
 
+from app.services.instrument_registry import get_registry
+from app.services.tick_store import bars, get_tick_store, symbol_lock, ticks_from_binance
+
 Exchange = Literal["binance", "okx", "bybit", "kraken", "coinbase"]
 
 # Normalized timeframe identifiers we support.
 # Note: sub-minute candles are only supported for Binance via trade aggregation.
 SUPPORTED_TF = {"1s", "5s", "1m", "5m", "15m", "30m", "1h", "2h", "4h", "1d"}
+TF_SECONDS = {"1s": 1, "5s": 5, "1m": 60, "5m": 300, "15m": 900, "30m": 1800, "1h": 3600, "2h": 7200, "4h": 14400, "1d": 86400}
+
+
+# Upper bound on aggTrades pages pulled per request; the tick store keeps whatever was fetched,
+# so a long backlog is caught up over several calls.
+MAX_TICK_PAGES = 25
+AGG_TRADES_PAGE = 1000
 
 
-async def _fetch_binance_agg_trades(symbol: str, start_ms: int, end_ms: int) -> list[dict]:
+async def _fetch_binance_agg_trades(
+    symbol: str,
+    start_ms: int | None = None,
+    end_ms: int | None = None,
+    from_id: int | None = None,
+) -> list[dict]:
     url = "https://api.binance.com/api/v3/aggTrades"
-    params = {
-        "symbol": symbol,
-        "startTime": str(start_ms),
-        "endTime": str(end_ms),
-        "limit": "1000",
-    }
+    params = {"symbol": symbol, "limit": str(AGG_TRADES_PAGE)}
+    if from_id is not None:
+        params["fromId"] = str(from_id)
+    else:
+        params["startTime"] = str(start_ms)
+        params["endTime"] = str(end_ms)
     async with httpx.AsyncClient(timeout=10) as client:
         res = await client.get(url, params=params)
         res.raise_for_status()
         return res.json()
 
 
+async def sync_binance_ticks(symbol: str, start_ms: int, end_ms: int) -> bool:
+    """Make the local tick store for `symbol` cover [start_ms, end_ms].
+
+    History older than the first stored trade is paged backwards by trade id, id gaps between
+    stored segments inside the window are filled forward, and the newest end continues from the
+    last stored id (or, when the store is empty or stale, from the first hour from `start_ms` on
+    that has trades). All three share the MAX_TICK_PAGES budget; returns False when it ran out
+    before the window was covered.
+    """
+    store = get_tick_store()
+    async with symbol_lock("binance", symbol):
+        pages = MAX_TICK_PAGES
+        filled = False
+        complete = True
+
+        async def pull(**kwargs) -> list[dict]:
+            nonlocal pages, complete
+            if not pages:
+                complete = False
+                return []
+            pages -= 1
+            batch = await _fetch_binance_agg_trades(symbol, **kwargs)
+            if batch:
+                await asyncio.to_thread(store.append, "binance", symbol, ticks_from_binance(batch))
+            return batch
+
+        first = store.first("binance", symbol)
+        while first is not None and first[1] > start_ms and first[0] > 0:
+            if not await pull(from_id=max(first[0] - AGG_TRADES_PAGE, 0)):
+                break
+            filled = True
+            first = store.first("binance", symbol)
+
+        for after_id, before_id in store.gaps("binance", symbol, start_ms, end_ms):
+            next_id = after_id + 1
+            while next_id < before_id:
+                batch = await pull(from_id=next_id)
+                if not batch:
+                    break
+                filled = True
+                next_id = int(batch[-1]["a"]) + 1
+
+        last = store.last("binance", symbol)
+        window = start_ms
+        while complete:
+            if last is not None and last[1] >= start_ms:
+                if last[1] >= end_ms:
+                    break
+                batch = await pull(from_id=last[0] + 1)
+                if not batch:
+                    break
+                last = store.last("binance", symbol)
+                # A short page by id means there are no newer trades yet.
+                if len(batch) < AGG_TRADES_PAGE:
+                    break
+            else:
+                if window > end_ms:
+                    break
+                # Binance caps startTime/endTime windows at one hour; hours without trades are stepped over
+                # until one has some, and from there paging continues by id.
+                batch = await pull(start_ms=window, end_ms=min(end_ms, window + 3_600_000 - 1))
+                window += 3_600_000
+                if batch:
+                    last = store.last("binance", symbol)
+
+        if filled:
+            await asyncio.to_thread(store.compact, "binance", symbol)
+        return complete
+
+
 async def fetch_binance_subminute(pair: str, tf: str, limit: int = 200) -> list[Candle]:
     interval_ms = 1000 if tf == "1s" else 5000
     # Keep this bounded: aggregating trades is heavier than klines.
     limit = max(1, min(limit, 5000))
     end_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000)
-    start_ms = end_ms - limit * interval_ms
-
-    trades: list[dict] = []
-    cursor = start_ms
-    # Hard cap pages to avoid long loops.
-    for _ in range(25):
-        batch = await _fetch_binance_agg_trades(pair, cursor, end_ms)
-        if not batch:
-            break
-        trades.extend(batch)
-        last_ts = int(batch[-1]["T"])
-        cursor = last_ts + 1
-        if len(batch) < 1000 or cursor >= end_ms:
-            break
-
-    buckets: dict[int, dict[str, float]] = {}
-    for t in trades:
-        ts = int(t["T"])  # ms
-        price = float(t["p"])
-        qty = float(t["q"])  # base qty
-        bucket_ts = (ts // interval_ms) * interval_ms
-        b = buckets.get(bucket_ts)
-        if b is None:
-            buckets[bucket_ts] = {
-                "open": price,
-                "high": price,
-                "low": price,
-                "close": price,
-                "volume": qty,
-            }
-        else:
-            b["high"] = max(b["high"], price)
-            b["low"] = min(b["low"], price)
-            b["close"] = price
-            b["volume"] += qty
-
-    out: list[Candle] = []
-    for ts in sorted(buckets.keys()):
-        b = buckets[ts]
-        out.append(Candle(ts, b["open"], b["high"], b["low"], b["close"], b["volume"]))
+    start_ms = (end_ms - limit * interval_ms) // interval_ms * interval_ms
+
+    await sync_binance_ticks(pair, start_ms, end_ms)
+    ticks = await asyncio.to_thread(get_tick_store().read, "binance", pair, start_ms, end_ms + 1)
+    b = bars(ticks, interval_ms)
+    out = [
+        Candle(ts, o, h, lo, c, v)
+        for ts, o, h, lo, c, v in zip(
+            b["ts"].tolist(), b["open"].tolist(), b["high"].tolist(), b["low"].tolist(), b["close"].tolist(), b["volume"].tolist()
+        )
+    ]
     return out[-limit:]
 
 
@@ -137,7 +193,8 @@ def _tf_coinbase(tf: str) -> str:
     return out
 
 
-# Normalized symbol -> per exchange symbol map (minimal demo set)
+# Normalized symbol -> per exchange symbol map. This is the featured set shown in /market/pairs and
+# the alias overlay for the instrument registry; everything else comes from exchange metadata.
 SYMBOL_MAP = {
     # majors
     "BTC/USDT": {
@@ -259,12 +316,19 @@ PAIR_KINDS: dict[str, list[str]] = {pair: ["perp", "spot"] for pair in SYMBOL_MA
 
 
 def resolve_symbol(normalized: str, exchange: Exchange) -> str:
-    if normalized in SYMBOL_MAP and exchange in SYMBOL_MAP[normalized]:
-        return SYMBOL_MAP[normalized][exchange]
+    native = get_registry().native(normalized, exchange)
+    if native:
+        return native
     # fallback: if user already passed exchange native symbol
     return normalized.replace("/", "")
 
 
+def pair_on_exchange(normalized: str, exchange: str) -> bool:
+    """False only for known pairs that the exchange does not list; unknown input is passed through."""
+    registry = get_registry()
+    return normalized not in registry or registry.native(normalized, exchange) is not None
+
+
 async def fetch_binance(pair: str, tf: str, limit: int = 200) -> list[Candle]:
     if tf in {"1s", "5s"}:
         return await fetch_binance_subminute(pair, tf, limit=limit)
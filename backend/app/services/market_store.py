@@ -50,6 +50,16 @@ async def get_cached(exchange: str, pair: str, timeframe: str) -> list[CandleOut
     return _candles_from_cache(raw)
 
 
+async def get_cached_raw_many(exchange: str, pairs: list[str], timeframe: str) -> dict[str, list[dict]]:
+    """Fetch cached series for many pairs in one MGET, skipping pydantic validation (hot analytics path)."""
+    if not pairs:
+        return {}
+    redis = get_redis()
+    keys = [CACHE_KEY_FMT.format(exchange=exchange, pair=p, tf=timeframe) for p in pairs]
+    raws = await redis.mget(keys)
+    return {p: json.loads(raw) for p, raw in zip(pairs, raws) if raw}
+
+
 async def set_cached(exchange: str, pair: str, timeframe: str, candles: list[CandleOut]) -> None:
     redis = get_redis()
     await redis.set(
@@ -100,6 +110,36 @@ async def upsert_candles(
     await session.commit()
 
 
+async def load_closes_from_db(
+    session: AsyncSession,
+    *,
+    exchange: str,
+    symbols: list[str],
+    timeframe: str,
+    since_ts: int,
+) -> dict[str, tuple[list[int], list[float]]]:
+    """Load (ts_ms, close) columns for many symbols with a single query."""
+    if not symbols:
+        return {}
+    stmt = (
+        select(MarketCandle.symbol, MarketCandle.ts, MarketCandle.close)
+        .where(
+            MarketCandle.exchange == exchange,
+            MarketCandle.symbol.in_(symbols),
+            MarketCandle.timeframe == timeframe,
+            MarketCandle.ts >= _dt_from_ts(since_ts),
+        )
+        .order_by(MarketCandle.symbol, MarketCandle.ts)
+    )
+    res = await session.execute(stmt)
+    out: dict[str, tuple[list[int], list[float]]] = {}
+    for symbol, ts, close in res.all():
+        ts_list, close_list = out.setdefault(symbol, ([], []))
+        ts_list.append(_ts_ms(ts))
+        close_list.append(close)
+    return out
+
+
 async def load_from_db(
     session: AsyncSession,
     *,
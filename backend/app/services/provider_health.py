@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import bindparam, func, update
+
+from app.core.config import settings
+from app.core.db import get_sessionmaker
+from app.core.redis import get_redis
+from app.models.neuro import NeuroProvider
+from app.services.signal_store import SIGNAL_PROVIDERS_KEY
+
+logger = logging.getLogger(__name__)
+
+# Sliding window of time-bucketed counters in Redis: WINDOW_SEC / BUCKET_SEC hashes per provider,
+# each expiring on its own, so memory is O(1) per provider and counts are shared by all instances.
+METRICS_KEY_FMT = "signals.metrics:{provider_id}:{bucket}"
+BUCKET_SEC = 10
+WINDOW_SEC = 300
+BUCKETS = WINDOW_SEC // BUCKET_SEC
+
+DEGRADED_STALE_RATE = 0.5
+DEGRADED_ERROR_SHARE = 0.2
+
+
+def _metrics_key(provider_id: str, bucket: int) -> str:
+    return METRICS_KEY_FMT.format(provider_id=provider_id, bucket=bucket)
+
+
+def queue_ingest_metrics(pipe: Pipeline, provider_id: str, *, timestamp: int, ttl_sec: int, now: float) -> None:
+    """Count one accepted envelope: arrival latency against its `timestamp` and staleness on arrival."""
+    key = _metrics_key(provider_id, int(now // BUCKET_SEC))
+    pipe.hincrby(key, "envelopes", 1)
+    pipe.hincrbyfloat(key, "latency_ms_sum", max(0.0, (now - timestamp) * 1000))
+    if now > timestamp + ttl_sec:
+        pipe.hincrby(key, "stale", 1)
+    pipe.expire(key, WINDOW_SEC + BUCKET_SEC)
+
+
+def queue_error_metric(pipe: Pipeline, provider_id: str, now: float, count: int = 1) -> None:
+    key = _metrics_key(provider_id, int(now // BUCKET_SEC))
+    pipe.hincrby(key, "errors", count)
+    pipe.expire(key, WINDOW_SEC + BUCKET_SEC)
+
+
+class IngestTally:
+    """Ingest counters of many envelopes, summed per (provider, bucket) and queued as one set of increments."""
+
+    def __init__(self) -> None:
+        self.counts: dict[tuple[str, int], dict[str, float]] = {}
+
+    def _bucket(self, provider_id: str, now: float) -> dict[str, float]:
+        return self.counts.setdefault((provider_id, int(now // BUCKET_SEC)), {})
+
+    def add(self, provider_id: str, *, timestamp: int, ttl_sec: int, now: float) -> None:
+        counts = self._bucket(provider_id, now)
+        counts["envelopes"] = counts.get("envelopes", 0) + 1
+        counts["latency_ms_sum"] = counts.get("latency_ms_sum", 0.0) + max(0.0, (now - timestamp) * 1000)
+        if now > timestamp + ttl_sec:
+            counts["stale"] = counts.get("stale", 0) + 1
+
+    def error(self, provider_id: str, now: float, count: int = 1) -> None:
+        counts = self._bucket(provider_id, now)
+        counts["errors"] = counts.get("errors", 0) + count
+
+    def queue(self, pipe: Pipeline) -> None:
+        for (provider_id, bucket), counts in self.counts.items():
+            key = _metrics_key(provider_id, bucket)
+            for field, value in counts.items():
+                if field == "latency_ms_sum":
+                    pipe.hincrbyfloat(key, field, value)
+                else:
+                    pipe.hincrby(key, field, int(value))
+            pipe.expire(key, WINDOW_SEC + BUCKET_SEC)
+        self.counts = {}
+
+
+async def record_errors(provider_id: str, count: int = 1) -> None:
+    pipe = get_redis().pipeline(transaction=False)
+    queue_error_metric(pipe, provider_id, datetime.now(timezone.utc).timestamp(), count)
+    await pipe.execute()
+
+
+def health_from_window(envelopes: int, errors: int, stale: int) -> str:
+    if envelopes == 0:
+        return "down" if errors else "stale"
+    if errors / (envelopes + errors) > DEGRADED_ERROR_SHARE or stale / envelopes > DEGRADED_STALE_RATE:
+        return "degraded"
+    return "healthy"
+
+
+async def read_window(redis: Redis, provider_ids: list[str], now: float) -> dict[str, dict[str, Any]]:
+    """Aggregate the last WINDOW_SEC of buckets for each provider with one pipelined round trip."""
+    if not provider_ids:
+        return {}
+    current = int(now // BUCKET_SEC)
+    pipe = redis.pipeline(transaction=False)
+    for pid in provider_ids:
+        for bucket in range(current - BUCKETS + 1, current + 1):
+            pipe.hgetall(_metrics_key(pid, bucket))
+    raw = await pipe.execute()
+
+    out: dict[str, dict[str, Any]] = {}
+    for i, pid in enumerate(provider_ids):
+        envelopes = errors = stale = 0
+        latency_sum = 0.0
+        for h in raw[i * BUCKETS : (i + 1) * BUCKETS]:
+            envelopes += int(h.get("envelopes", 0))
+            errors += int(h.get("errors", 0))
+            stale += int(h.get("stale", 0))
+            latency_sum += float(h.get("latency_ms_sum", 0.0))
+        out[pid] = {
+            "errors_5m": errors,
+            "latency_ms_avg": latency_sum / envelopes if envelopes else None,
+            "stale_rate_5m": stale / envelopes if envelopes else 0.0,
+            "health_status": health_from_window(envelopes, errors, stale),
+        }
+    return out
+
+
+class ProviderWriteBehind:
+    """Coalesces provider liveness updates in memory and writes them to Postgres in one batch.
+
+    Ingest only touches a dict; the flush loop issues at most one bulk UPDATE per interval, carrying
+    the rolling-window metrics for every provider along with any new last_seen_ts.
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[str, datetime] = {}
+
+    def seen(self, provider_id: str, ts: datetime | None = None) -> None:
+        self._pending[provider_id] = ts or datetime.now(timezone.utc)
+
+    async def flush(self) -> int:
+        redis = get_redis()
+        pending, self._pending = self._pending, {}
+        try:
+            provider_ids = sorted(set(await redis.smembers(SIGNAL_PROVIDERS_KEY)) | set(pending))
+            if not provider_ids:
+                return 0
+            window = await read_window(redis, provider_ids, datetime.now(timezone.utc).timestamp())
+            rows = [{"pid": pid, "seen_ts": pending.get(pid), **window[pid]} for pid in provider_ids]
+
+            sessionmaker = get_sessionmaker()
+            async with sessionmaker() as session:
+                # One executemany UPDATE; unknown provider ids simply match no row.
+                table = NeuroProvider.__table__
+                stmt = (
+                    update(table)
+                    .where(table.c.provider_id == bindparam("pid"))
+                    .values(
+                        health_status=bindparam("health_status"),
+                        last_seen_ts=func.coalesce(bindparam("seen_ts", type_=table.c.last_seen_ts.type), table.c.last_seen_ts),
+                        errors_5m=bindparam("errors_5m"),
+                        latency_ms_avg=bindparam("latency_ms_avg"),
+                        stale_rate_5m=bindparam("stale_rate_5m"),
+                    )
+                )
+                await session.execute(stmt, rows)
+                await session.commit()
+            return len(rows)
+        except Exception:
+            # Keep newer updates that arrived meanwhile, retry the rest next time.
+            for pid, ts in pending.items():
+                self._pending.setdefault(pid, ts)
+            raise
+
+
+_write_behind: ProviderWriteBehind | None = None
+
+
+def get_write_behind() -> ProviderWriteBehind:
+    global _write_behind
+    if _write_behind is None:
+        _write_behind = ProviderWriteBehind()
+    return _write_behind
+
+
+async def run_flush_loop(interval_sec: float | None = None) -> None:
+    interval = interval_sec or settings.provider_flush_sec
+    write_behind = get_write_behind()
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await write_behind.flush()
+            except Exception as e:  # noqa: BLE001
+                logger.warning("provider write-behind flush error: %s", e)
+    finally:
+        # Last flush on shutdown so the final interval isn't lost.
+        try:
+            await write_behind.flush()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("provider write-behind final flush error: %s", e)
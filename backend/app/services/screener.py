@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from app.services.instrument_registry import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Numeric columns kept per (exchange, instrument) row. Keys are the public (camelCase) field names.
+NUMERIC_COLUMNS = (
+    "last",
+    "change24hPct",
+    "volume24hQuote",
+    "high24h",
+    "low24h",
+    "range24hPct",
+    "trades24h",
+    "updatedAt",
+)
+KINDS = ("spot", "perp")
+# Rows not refreshed for this many refresh intervals (delisted, or their exchange keeps failing) are dropped.
+STALE_REFRESHES = 5
+
+
+class ScreenerTable:
+    """Columnar in-memory table of per-instrument stats.
+
+    One row per (exchange, pair). Rows are appended on first sight and updated in place afterwards,
+    so a refresh only touches the rows present in the latest ticker batch; prune() drops the ones that
+    stopped coming.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._n = 0
+        self._rows: dict[tuple[str, str], int] = {}
+        self._pair = np.empty(capacity, dtype=object)
+        self._symbol = np.empty(capacity, dtype=object)
+        self._exchange = np.empty(capacity, dtype=object)
+        self._quote = np.empty(capacity, dtype=object)
+        self._kind = np.zeros(capacity, dtype=np.int8)
+        self._num = {c: np.full(capacity, np.nan) for c in NUMERIC_COLUMNS}
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _grow(self, needed: int) -> None:
+        cap = len(self._pair)
+        if needed <= cap:
+            return
+        new_cap = max(needed, cap * 2)
+        for name in ("_pair", "_symbol", "_exchange", "_quote"):
+            arr = np.empty(new_cap, dtype=object)
+            arr[:cap] = getattr(self, name)
+            setattr(self, name, arr)
+        kind = np.zeros(new_cap, dtype=np.int8)
+        kind[:cap] = self._kind
+        self._kind = kind
+        for c, arr in self._num.items():
+            grown = np.full(new_cap, np.nan)
+            grown[:cap] = arr
+            self._num[c] = grown
+
+    def upsert(self, exchange: str, rows: list[tuple[str, str, str, str, dict[str, float]]]) -> int:
+        """Apply a ticker batch: rows of (pair, symbol, quote, kind, values)."""
+        if not rows:
+            return 0
+        idx = np.empty(len(rows), dtype=np.int64)
+        for i, (pair, symbol, quote, kind, _) in enumerate(rows):
+            key = (exchange, pair)
+            row = self._rows.get(key)
+            if row is None:
+                self._grow(self._n + 1)
+                row = self._n
+                self._n += 1
+                self._rows[key] = row
+                self._pair[row] = pair
+                self._symbol[row] = symbol
+                self._exchange[row] = exchange
+                self._quote[row] = quote
+                self._kind[row] = KINDS.index(kind) if kind in KINDS else 0
+            idx[i] = row
+
+        for c in NUMERIC_COLUMNS:
+            values = np.fromiter((r[4].get(c, np.nan) for r in rows), dtype=np.float64, count=len(rows))
+            self._num[c][idx] = values
+        return len(rows)
+
+    def prune(self, older_than_ms: float) -> int:
+        """Drop rows last updated before `older_than_ms` and compact the rest; returns how many were dropped."""
+        n = self._n
+        keep = ~(self._num["updatedAt"][:n] < older_than_ms)
+        kept = np.flatnonzero(keep)
+        dropped = n - int(kept.size)
+        if not dropped:
+            return 0
+        for name in ("_pair", "_symbol", "_exchange", "_quote", "_kind"):
+            arr = getattr(self, name)
+            arr[: kept.size] = arr[kept]
+            if arr.dtype == object:
+                arr[kept.size : n] = None
+        for arr in self._num.values():
+            arr[: kept.size] = arr[kept]
+            arr[kept.size : n] = np.nan
+        self._n = int(kept.size)
+        self._rows = {(self._exchange[i], self._pair[i]): i for i in range(self._n)}
+        return dropped
+
+    def query(
+        self,
+        *,
+        q: str | None = None,
+        exchange: str | None = None,
+        kind: str | None = None,
+        quote: str | None = None,
+        ranges: dict[str, tuple[float | None, float | None]] | None = None,
+        sort: str = "volume24hQuote",
+        desc: bool = True,
+        offset: int = 0,
+        limit: int = 100,
+    ) -> tuple[int, list[dict[str, Any]]]:
+        n = self._n
+        mask = np.ones(n, dtype=bool)
+        if exchange:
+            mask &= self._exchange[:n] == exchange
+        if kind:
+            mask &= self._kind[:n] == (KINDS.index(kind) if kind in KINDS else -1)
+        if quote:
+            mask &= self._quote[:n] == quote.upper()
+        if q:
+            needle = q.strip().upper()
+            mask &= np.char.find(self._pair[:n].astype(str), needle) >= 0
+        for col, (lo, hi) in (ranges or {}).items():
+            values = self._num[col][:n]
+            if lo is not None:
+                mask &= values >= lo
+            if hi is not None:
+                mask &= values <= hi
+
+        hits = np.flatnonzero(mask)
+        total = int(hits.size)
+        if total == 0 or offset >= total:
+            return total, []
+
+        # NaNs sort last in both directions.
+        keys = self._num[sort][hits]
+        keys = np.where(np.isnan(keys), np.inf, -keys if desc else keys)
+        end = min(offset + limit, total)
+        if end < total:
+            # Top-N: partial partition is O(n), then sort only the requested window.
+            part = np.argpartition(keys, end - 1)[:end]
+            order = part[np.argsort(keys[part], kind="stable")]
+        else:
+            order = np.argsort(keys, kind="stable")
+        page = hits[order[offset:end]]
+        return total, [self._row(int(i)) for i in page]
+
+    def _row(self, i: int) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "pair": self._pair[i],
+            "exchange": self._exchange[i],
+            "symbol": self._symbol[i],
+            "kind": KINDS[self._kind[i]],
+        }
+        for c in NUMERIC_COLUMNS:
+            v = float(self._num[c][i])
+            out[c] = None if np.isnan(v) else v
+        return out
+
+
+def _f(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _stats(last: float, open_: float, high: float, low: float, quote_volume: float, trades: float = float("nan")) -> dict[str, float]:
+    return {
+        "last": last,
+        "change24hPct": (last - open_) / open_ * 100 if open_ else float("nan"),
+        "volume24hQuote": quote_volume,
+        "high24h": high,
+        "low24h": low,
+        # Intraday range as a cheap volatility proxy that every exchange ticker can provide.
+        "range24hPct": (high - low) / last * 100 if last else float("nan"),
+        "trades24h": trades,
+        "updatedAt": time.time() * 1000,
+    }
+
+
+async def _tickers_binance(client: httpx.AsyncClient) -> list[tuple[str, dict[str, float]]]:
+    res = await client.get("https://api.binance.com/api/v3/ticker/24hr")
+    res.raise_for_status()
+    return [
+        (
+            t["symbol"],
+            _stats(_f(t["lastPrice"]), _f(t["openPrice"]), _f(t["highPrice"]), _f(t["lowPrice"]), _f(t["quoteVolume"]), _f(t.get("count"))),
+        )
+        for t in res.json()
+    ]
+
+
+async def _tickers_okx(client: httpx.AsyncClient) -> list[tuple[str, dict[str, float]]]:
+    res = await client.get("https://www.okx.com/api/v5/market/tickers", params={"instType": "SPOT"})
+    res.raise_for_status()
+    return [
+        (t["instId"], _stats(_f(t["last"]), _f(t["open24h"]), _f(t["high24h"]), _f(t["low24h"]), _f(t["volCcy24h"])))
+        for t in res.json().get("data", [])
+    ]
+
+
+async def _tickers_bybit(client: httpx.AsyncClient) -> list[tuple[str, dict[str, float]]]:
+    res = await client.get("https://api.bybit.com/v5/market/tickers", params={"category": "linear"})
+    res.raise_for_status()
+    return [
+        (t["symbol"], _stats(_f(t["lastPrice"]), _f(t["prevPrice24h"]), _f(t["highPrice24h"]), _f(t["lowPrice24h"]), _f(t["turnover24h"])))
+        for t in (res.json().get("result") or {}).get("list", [])
+    ]
+
+
+# Exchanges with a single "all tickers" endpoint. Others would need one request per pair.
+TICKER_SOURCES = {
+    "binance": _tickers_binance,
+    "okx": _tickers_okx,
+    "bybit": _tickers_bybit,
+}
+
+_table: ScreenerTable | None = None
+
+
+def get_table() -> ScreenerTable:
+    global _table
+    if _table is None:
+        _table = ScreenerTable()
+    return _table
+
+
+async def refresh() -> int:
+    registry = get_registry()
+    table = get_table()
+    headers = {"User-Agent": "TRADE_SYSTEM/1.0 (screener)"}
+    async with httpx.AsyncClient(timeout=15, headers=headers) as client:
+        results = await asyncio.gather(*(fn(client) for fn in TICKER_SOURCES.values()), return_exceptions=True)
+
+    updated = 0
+    for exchange, res in zip(TICKER_SOURCES, results):
+        if isinstance(res, BaseException):
+            logger.warning("screener refresh failed for %s: %s", exchange, res)
+            continue
+        rows = []
+        for symbol, values in res:
+            # Tickers the exchange's listing does not know yet are still shown under their usual pair.
+            pair = registry.normalized(symbol, exchange) or registry.normalized(symbol)
+            if not pair:
+                continue
+            inst = registry.instrument(symbol, exchange)
+            quote = inst.quote if inst else pair.rsplit("/", 1)[-1]
+            kind = inst.kind if inst else ("perp" if exchange == "bybit" else "spot")
+            rows.append((pair, symbol, quote, kind, values))
+        updated += table.upsert(exchange, rows)
+    dropped = table.prune(time.time() * 1000 - STALE_REFRESHES * settings.screener_refresh_sec * 1000)
+    if dropped:
+        logger.info("screener dropped %d stale row(s)", dropped)
+    return updated
+
+
+async def run_refresh_loop(interval_sec: int | None = None) -> None:
+    interval = interval_sec or settings.screener_refresh_sec
+    while True:
+        try:
+            await refresh()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("screener refresh error: %s", e)
+        await asyncio.sleep(interval)
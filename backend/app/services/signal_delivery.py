@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+from typing import Any
+
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.core.db import get_sessionmaker
+from app.core.redis import get_redis
+from app.services.binding_cache import get_binding_cache
+from app.services.signal_store import SIGNAL_PROVIDER_STREAM_PREFIX, ensure_groups, provider_stream
+
+logger = logging.getLogger(__name__)
+
+READ_COUNT = 500
+READ_BLOCK_MS = 1000
+REPLAY_LIMIT = 1000
+QUEUE_SIZE = 1000
+STREAM_REFRESH_SEC = 5.0
+
+
+def _stream_id(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class Subscription:
+    """One connected bot client. Delivers stream entries newer than `last_id`, optionally filtered by pair.
+
+    A subscription resuming from `last_id` holds live entries back until replay() has queued the
+    backlog, then merges them in by id; otherwise a live entry would move `last_id` past the backlog.
+    """
+
+    def __init__(self, bot_id: str, pairs: set[str] | None, last_id: str | None) -> None:
+        self.bot_id = bot_id
+        self.pairs = pairs
+        self.last_id = _stream_id(last_id) if last_id else (0, 0)
+        self.queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+        self._held: list[tuple[str, dict[str, Any]]] | None = [] if last_id else None
+
+    def offer(self, entry_id: str, envelope: dict[str, Any]) -> None:
+        if self._held is not None:
+            self._held.append((entry_id, envelope))
+            return
+        self._deliver(entry_id, envelope)
+
+    def release(self) -> None:
+        """End replay: deliver the held live entries in id order, skipping those replay already sent."""
+        held, self._held = self._held or [], None
+        for entry_id, envelope in sorted(held, key=lambda e: _stream_id(e[0])):
+            self._deliver(entry_id, envelope)
+
+    def _deliver(self, entry_id: str, envelope: dict[str, Any]) -> None:
+        sid = _stream_id(entry_id)
+        if sid <= self.last_id or self.overflowed:
+            return
+        signals = envelope.get("signals") or {}
+        if self.pairs is not None:
+            signals = {p: s for p, s in signals.items() if p in self.pairs}
+            if not signals:
+                return
+        self.last_id = sid
+        message = {
+            "id": entry_id,
+            "provider_id": envelope.get("provider_id"),
+            "timestamp": envelope.get("timestamp"),
+            "ttl_sec": envelope.get("ttl_sec"),
+            "signals": signals,
+        }
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: end the stream; the client reconnects with its last id and replays.
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class SignalHub:
+    def __init__(self) -> None:
+        self._subs: dict[str, set[Subscription]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self._subs)
+
+    def add(self, sub: Subscription) -> None:
+        self._subs.setdefault(sub.bot_id, set()).add(sub)
+
+    def remove(self, sub: Subscription) -> None:
+        subs = self._subs.get(sub.bot_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.bot_id]
+
+    def dispatch(self, bot_ids: list[str], entry_id: str, envelope: dict[str, Any]) -> None:
+        for bot_id in bot_ids:
+            for sub in self._subs.get(bot_id, ()):
+                sub.offer(entry_id, envelope)
+
+
+_hub: SignalHub | None = None
+
+
+def get_hub() -> SignalHub:
+    global _hub
+    if _hub is None:
+        _hub = SignalHub()
+    return _hub
+
+
+def _decode(fields: dict[str, str]) -> dict[str, Any] | None:
+    try:
+        return json.loads(fields.get("payload") or "")
+    except ValueError:
+        return None
+
+
+async def replay(provider_id: str, sub: Subscription) -> None:
+    """Queue entries after the subscription's last id straight from the provider stream.
+
+    Call after adding `sub` to the hub; live entries dispatched meanwhile are merged in afterwards.
+    """
+    try:
+        if sub.last_id == (0, 0):
+            return
+        start = f"({sub.last_id[0]}-{sub.last_id[1]}"
+        entries = await get_redis().xrange(provider_stream(provider_id), min=start, max="+", count=REPLAY_LIMIT)
+        for entry_id, fields in entries:
+            envelope = _decode(fields)
+            if envelope is not None:
+                sub._deliver(entry_id, envelope)
+    finally:
+        sub.release()
+
+
+async def run_delivery_loop() -> None:
+    """Read all provider streams through this instance's consumer group and fan out to connected bots.
+
+    Each backend instance uses its own group so every instance sees every entry for its own sockets.
+    """
+    group = settings.signal_delivery_group or f"delivery:{socket.gethostname()}"
+    consumer = socket.gethostname()
+    hub = get_hub()
+    bindings = get_binding_cache()
+    sessionmaker = get_sessionmaker()
+    providers: set[str] = set()
+    loop = asyncio.get_running_loop()
+    refreshed_at = 0.0
+
+    while True:
+        try:
+            if loop.time() - refreshed_at > STREAM_REFRESH_SEC:
+                # "$": a delivery group only needs entries from now on; history is served by replay().
+                providers = await ensure_groups(get_redis(), group, providers)
+                refreshed_at = loop.time()
+            if not providers:
+                await asyncio.sleep(READ_BLOCK_MS / 1000)
+                continue
+
+            redis = get_redis()
+            streams = {provider_stream(p): ">" for p in providers}
+            batches = await redis.xreadgroup(group, consumer, streams, count=READ_COUNT, block=READ_BLOCK_MS)
+            for stream, entries in batches or []:
+                provider_id = stream[len(SIGNAL_PROVIDER_STREAM_PREFIX) :]
+                if hub:
+                    async with sessionmaker() as session:
+                        bots = await bindings.bots_for(session, provider_id)
+                    for entry_id, fields in entries:
+                        envelope = _decode(fields)
+                        if envelope is not None:
+                            hub.dispatch(bots, entry_id, envelope)
+                await redis.xack(stream, group, *[entry_id for entry_id, _ in entries])
+        except asyncio.CancelledError:
+            raise
+        except ResponseError as e:
+            if "NOGROUP" in str(e):
+                # Stream was trimmed away / recreated: recreate groups on the next pass.
+                providers = set()
+                refreshed_at = 0.0
+                continue
+            logger.warning("signal delivery error: %s", e)
+            await asyncio.sleep(1)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("signal delivery error: %s", e)
+            await asyncio.sleep(1)
@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import socket
+from datetime import datetime, timezone
+from typing import Any
+
+from asyncpg.exceptions import DataError
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import get_engine
+from app.core.redis import get_redis
+from app.models.signals import SignalEvent
+from app.services.signal_store import ensure_groups, provider_stream
+
+logger = logging.getLogger(__name__)
+
+# One group shared by every backend instance: each stream entry is persisted by exactly one of them.
+HISTORY_GROUP = "history"
+READ_COUNT = 1000
+STREAM_REFRESH_SEC = 5.0
+MAX_PAGE = 1000
+
+# COPY column order; must match the staging table (LIKE signal_events).
+COPY_COLUMNS = (
+    "provider_id",
+    "pair",
+    "ts",
+    "stream_id",
+    "received_at",
+    "direction",
+    "confidence",
+    "predicted_price_24h",
+    "ai_stop_loss",
+    "position_size",
+    "ttl_sec",
+    "metadata",
+)
+STAGE_TABLE = "signal_events_stage"
+# Entries whose rows Postgres (or the COPY encoder) refuses; acked and parked here instead of retried.
+HISTORY_DEAD_LETTER_KEY = "signals.history.dead"
+DEAD_LETTER_MAXLEN = 10_000
+# Errors that depend on the rows, not on the database being reachable.
+ROW_ERRORS = (DataError, OverflowError, ValueError, TypeError)
+INT32_MAX = 2**31 - 1
+
+Row = tuple[Any, ...]
+
+
+def rows_from_entry(entry_id: str, fields: dict[str, str] | None) -> list[Row]:
+    """One row per pair of the envelope stored in a provider stream entry; malformed entries yield nothing."""
+    try:
+        envelope = json.loads((fields or {}).get("payload") or "")
+        provider_id = envelope["provider_id"]
+        ts = datetime.fromtimestamp(int(envelope["timestamp"]), tz=timezone.utc)
+        ttl_sec = int(envelope["ttl_sec"])
+        if not 0 <= ttl_sec <= INT32_MAX:
+            raise ValueError("ttl_sec out of range")
+        signals = envelope.get("signals") or {}
+    except (ValueError, KeyError, TypeError, OverflowError, OSError):
+        return []
+    received_at = datetime.fromtimestamp(int(entry_id.partition("-")[0]) / 1000, tz=timezone.utc)
+    rows: list[Row] = []
+    for pair, signal in signals.items():
+        if not isinstance(signal, dict) or "direction" not in signal:
+            continue
+        metadata = signal.get("metadata")
+        rows.append(
+            (
+                provider_id,
+                pair,
+                ts,
+                entry_id,
+                received_at,
+                signal["direction"],
+                signal.get("confidence"),
+                signal.get("predicted_price_24h"),
+                signal.get("ai_stop_loss"),
+                signal.get("position_size"),
+                ttl_sec,
+                json.dumps(metadata, ensure_ascii=False) if metadata is not None else None,
+            )
+        )
+    return rows
+
+
+def _month(ts: datetime) -> tuple[int, int]:
+    return ts.year, ts.month
+
+
+def _partition_ddl(year: int, month: int) -> str:
+    nxt = (year + 1, 1) if month == 12 else (year, month + 1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS signal_events_y{year:04d}m{month:02d} PARTITION OF signal_events "
+        f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{nxt[0]:04d}-{nxt[1]:02d}-01')"
+    )
+
+
+class HistoryWriter:
+    """Buffers rows drained from the provider streams and persists them in COPY batches.
+
+    A batch is COPY'd into a per-connection temp table and moved into `signal_events` with
+    ON CONFLICT DO NOTHING, so redelivered stream entries (crash before XACK) are harmless.
+    When a batch is refused for its data, it is retried entry by entry and the entries that still
+    fail are dead-lettered, so one bad envelope cannot hold back every provider.
+    """
+
+    def __init__(self) -> None:
+        self.rows: list[Row] = []
+        self.acks: dict[str, list[str]] = {}
+        self._partitions: set[tuple[int, int]] = set()
+
+    def add(self, stream: str, entries: list[tuple[str, dict[str, str]]]) -> None:
+        for entry_id, fields in entries:
+            self.rows.extend(rows_from_entry(entry_id, fields))
+        self.acks.setdefault(stream, []).extend(entry_id for entry_id, _ in entries)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(ids) for ids in self.acks.values())
+
+    async def flush(self) -> int:
+        if not self.acks:
+            return 0
+        redis = get_redis()
+        pipe = redis.pipeline(transaction=False)
+        if self.rows:
+            try:
+                await self._copy(self.rows)
+            except ROW_ERRORS as e:
+                logger.warning("signal history batch refused (%s); retrying entry by entry", e)
+                await self._copy_each(pipe)
+        for stream, ids in self.acks.items():
+            pipe.xack(stream, HISTORY_GROUP, *ids)
+        await pipe.execute()
+        written = len(self.rows)
+        self.rows, self.acks = [], {}
+        return written
+
+    async def _copy_each(self, pipe: Pipeline) -> None:
+        """COPY the buffered rows one stream entry at a time; entries that fail are queued to the dead letter."""
+        by_entry: dict[tuple[str, str], list[Row]] = {}
+        for row in self.rows:
+            by_entry.setdefault((row[0], row[3]), []).append(row)
+        dead: set[tuple[str, str]] = set()
+        for (provider_id, entry_id), rows in by_entry.items():
+            try:
+                await self._copy(rows)
+            except ROW_ERRORS as e:
+                dead.add((provider_id, entry_id))
+                logger.warning("signal history: dead-lettering %s entry %s: %s", provider_id, entry_id, e)
+                pipe.xadd(
+                    HISTORY_DEAD_LETTER_KEY,
+                    {"stream": provider_stream(provider_id), "entry_id": entry_id, "error": str(e)[:500]},
+                    maxlen=DEAD_LETTER_MAXLEN,
+                )
+        self.rows = [r for r in self.rows if (r[0], r[3]) not in dead]
+
+    async def _copy(self, rows: list[Row]) -> None:
+        async with get_engine().connect() as conn:
+            raw = await conn.get_raw_connection()
+            apg = raw.driver_connection
+            # The DDL rolls back with a failed batch, so months are only remembered once it commits.
+            created = sorted({_month(r[2]) for r in rows} - self._partitions)
+            async with apg.transaction():
+                for month in created:
+                    await apg.execute(_partition_ddl(*month))
+                await apg.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {STAGE_TABLE} (LIKE signal_events) ON COMMIT DELETE ROWS"
+                )
+                await apg.copy_records_to_table(STAGE_TABLE, records=rows, columns=COPY_COLUMNS)
+                cols = ", ".join(COPY_COLUMNS)
+                await apg.execute(
+                    f"INSERT INTO signal_events ({cols}) SELECT {cols} FROM {STAGE_TABLE} ON CONFLICT DO NOTHING"
+                )
+            self._partitions.update(created)
+
+
+async def run_history_writer() -> None:
+    """Drain every provider stream through the shared history group into Postgres."""
+    consumer = socket.gethostname()
+    writer = HistoryWriter()
+    providers: set[str] = set()
+    loop = asyncio.get_running_loop()
+    refreshed_at = 0.0
+    batch_started = 0.0
+    # Entries delivered to this consumer but never acked (previous crash) are re-read first.
+    read_id = "0"
+
+    try:
+        while True:
+            try:
+                now = loop.time()
+                if now - refreshed_at > STREAM_REFRESH_SEC:
+                    # "0": a new history group starts with whatever the stream still holds.
+                    providers = await ensure_groups(get_redis(), HISTORY_GROUP, providers, start_id="0")
+                    refreshed_at = now
+                if not providers:
+                    await asyncio.sleep(settings.signal_history_flush_sec)
+                    continue
+
+                if writer.pending < settings.signal_history_batch:
+                    wait = settings.signal_history_flush_sec
+                    if writer.pending:
+                        wait -= now - batch_started
+                    streams = {provider_stream(p): read_id for p in providers}
+                    batches = await get_redis().xreadgroup(
+                        HISTORY_GROUP,
+                        consumer,
+                        streams,
+                        count=READ_COUNT,
+                        block=None if read_id == "0" else max(1, int(wait * 1000)),
+                    )
+                    got = False
+                    for stream, entries in batches or []:
+                        if entries:
+                            if not writer.pending:
+                                batch_started = loop.time()
+                            writer.add(stream, entries)
+                            got = True
+                    if read_id == "0":
+                        if not got:
+                            read_id = ">"
+                            continue
+                        # Pending entries are re-read from "0" until acked, so persist them right away.
+                        await writer.flush()
+                        continue
+
+                if writer.pending and (
+                    writer.pending >= settings.signal_history_batch
+                    or loop.time() - batch_started >= settings.signal_history_flush_sec
+                ):
+                    await writer.flush()
+            except asyncio.CancelledError:
+                raise
+            except ResponseError as e:
+                if "NOGROUP" in str(e):
+                    providers = set()
+                    refreshed_at = 0.0
+                    continue
+                logger.warning("signal history error: %s", e)
+                await asyncio.sleep(1)
+            except Exception as e:  # noqa: BLE001
+                # Unacked entries stay buffered (and in the group's PEL); the flush is retried.
+                logger.warning("signal history error: %s", e)
+                await asyncio.sleep(1)
+    finally:
+        try:
+            await writer.flush()
+        except Exception as e:  # noqa: BLE001
+            logger.warning("signal history final flush error: %s", e)
+
+
+def encode_cursor(ts: datetime, stream_id: str, pair: str) -> str:
+    return f"{int(ts.timestamp() * 1000)}:{stream_id}:{pair}"
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, str, str]:
+    ts_ms, stream_id, pair = cursor.split(":", 2)
+    return datetime.fromtimestamp(int(ts_ms) / 1000, tz=timezone.utc), stream_id, pair
+
+
+async def query_history(
+    session: AsyncSession,
+    *,
+    provider_id: str,
+    pair: str | None,
+    start: datetime,
+    end: datetime,
+    limit: int,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """Signals in [start, end) ordered by (ts, stream_id, pair), paginated by keyset cursor."""
+    key = (SignalEvent.ts, SignalEvent.stream_id, SignalEvent.pair)
+    stmt = select(SignalEvent).where(
+        SignalEvent.provider_id == provider_id,
+        SignalEvent.ts >= start,
+        SignalEvent.ts < end,
+    )
+    if pair is not None:
+        stmt = stmt.where(SignalEvent.pair == pair)
+    if cursor:
+        stmt = stmt.where(tuple_(*key) > tuple_(*decode_cursor(cursor)))
+    stmt = stmt.order_by(*key).limit(limit + 1)
+
+    rows = list((await session.execute(stmt)).scalars())
+    more = len(rows) > limit
+    rows = rows[:limit]
+    items = [
+        {
+            "provider_id": r.provider_id,
+            "pair": r.pair,
+            "ts": int(r.ts.timestamp()),
+            "stream_id": r.stream_id,
+            "received_at": int(r.received_at.timestamp() * 1000),
+            "direction": r.direction,
+            "confidence": r.confidence,
+            "predicted_price_24h": r.predicted_price_24h,
+            "ai_stop_loss": r.ai_stop_loss,
+            "position_size": r.position_size,
+            "ttl_sec": r.ttl_sec,
+            "metadata": r.meta,
+        }
+        for r in rows
+    ]
+    last = rows[-1] if rows else None
+    return {
+        "items": items,
+        "next_cursor": encode_cursor(last.ts, last.stream_id, last.pair) if more and last else None,
+    }
@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any
+from uuid import uuid4
+
+from pydantic_core import to_json
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_LAST_PREFIX = "signal:last:"
+# Global expiry index for last signals: member "{provider_id}\x1f{pair}", score = unix time it may be dropped.
+SIGNAL_EXPIRY_KEY = "signals.last.expiry"
+SIGNAL_PROVIDER_STREAM_PREFIX = "signals.provider."
+# Set of provider ids that have a stream; lets stream consumers discover providers without SCAN.
+SIGNAL_PROVIDERS_KEY = "signals.providers"
+STREAM_MAXLEN = 10_000
+SWEEP_BATCH = 1000
+_SEP = "\x1f"
+
+# Drops due (provider, pair) fields from their provider hash. Atomic, so a value rewritten (and re-scored)
+# concurrently is never removed. Hash keys are derived from members, so this assumes a single Redis node.
+_SWEEP_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+for _, member in ipairs(due) do
+  local sep = string.find(member, ARGV[4], 1, true)
+  if sep then
+    redis.call('HDEL', ARGV[3] .. string.sub(member, 1, sep - 1), string.sub(member, sep + 1))
+  end
+end
+if #due > 0 then
+  redis.call('ZREM', KEYS[1], unpack(due))
+end
+return #due
+"""
+
+
+def provider_stream(provider_id: str) -> str:
+    return f"{SIGNAL_PROVIDER_STREAM_PREFIX}{provider_id}"
+
+
+def last_key(provider_id: str) -> str:
+    """Hash of the provider's live signals, field = pair."""
+    return f"{SIGNAL_LAST_PREFIX}{provider_id}"
+
+
+def expires_at(timestamp: int, ttl_sec: int) -> int:
+    # Stale signals stay readable (flagged stale) for a grace period before they are dropped.
+    return timestamp + ttl_sec + settings.signal_last_grace_sec
+
+
+def last_signal_payload(envelope: dict[str, Any], pair: str, signal: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "signal_id": str(uuid4()),
+        "provider_id": envelope["provider_id"],
+        "pair": pair,
+        "direction": signal["direction"],
+        "confidence": signal.get("confidence"),
+        "ts": envelope["timestamp"],
+        "ttl_sec": envelope["ttl_sec"],
+        "ai_stop_loss": signal.get("ai_stop_loss"),
+        "position_size": signal.get("position_size"),
+        "payload": {"metadata": signal.get("metadata") or {}},
+    }
+
+
+class LastBatch:
+    """Per-provider bookkeeping of many queued envelopes (hash TTL, provider set), queued once by `queue`."""
+
+    def __init__(self) -> None:
+        self.expiry: dict[str, int] = {}
+        self.providers: set[str] = set()
+
+    def queue(self, pipe: Pipeline) -> None:
+        now = int(time.time())
+        for key, expiry in self.expiry.items():
+            _queue_hash_ttl(pipe, key, max(1, expiry - now))
+        if self.providers:
+            pipe.sadd(SIGNAL_PROVIDERS_KEY, *self.providers)
+        self.expiry, self.providers = {}, set()
+
+
+def _queue_hash_ttl(pipe: Pipeline, key: str, ttl: int) -> None:
+    # Backstop for a provider that goes silent: the hash outlives its longest-lived field only.
+    pipe.expire(key, ttl, nx=True)
+    pipe.expire(key, ttl, gt=True)
+
+
+def queue_envelope(pipe: Pipeline, envelope: dict[str, Any], batch: LastBatch | None = None) -> int:
+    """Queue all writes for one envelope on `pipe`: last value per pair plus the provider stream append.
+
+    Nothing is sent until the caller executes the pipeline (with `execute_ingest`, which keeps the stream
+    append best-effort), so any number of pairs (and envelopes) costs a single round trip. With `batch`,
+    the hash TTL and provider set updates are left to `batch.queue`, once per provider instead of once
+    per envelope.
+    """
+    provider_id = envelope["provider_id"]
+    signals = envelope["signals"]
+    if signals:
+        key = last_key(provider_id)
+        expiry = expires_at(envelope["timestamp"], envelope["ttl_sec"])
+        # Re-score before rewriting, so a sweep in between can never drop the new value.
+        pipe.zadd(SIGNAL_EXPIRY_KEY, {f"{provider_id}{_SEP}{pair}": expiry for pair in signals})
+        pipe.hset(key, mapping={pair: to_json(last_signal_payload(envelope, pair, signal)) for pair, signal in signals.items()})
+        if batch is None:
+            _queue_hash_ttl(pipe, key, max(1, expiry - int(time.time())))
+        elif expiry > batch.expiry.get(key, 0):
+            batch.expiry[key] = expiry
+    if batch is None:
+        pipe.sadd(SIGNAL_PROVIDERS_KEY, provider_id)
+    else:
+        batch.providers.add(provider_id)
+    pipe.xadd(
+        provider_stream(provider_id),
+        {"schema": envelope.get("schema") or "th.signal.v1", "payload": to_json(envelope)},
+        maxlen=STREAM_MAXLEN,
+    )
+    return len(signals)
+
+
+async def execute_ingest(pipe: Pipeline) -> None:
+    """Execute a pipeline of queued envelopes, treating the provider stream appends as best-effort.
+
+    The pipeline is not a transaction, so by the time any reply is an error every other command has
+    been applied. A failed XADD is logged and dropped: the last values are stored and a client retry
+    would only append duplicates. Any other command error is raised.
+    """
+    commands = [args[0] for args, _ in pipe.command_stack]
+    results = await pipe.execute(raise_on_error=False)
+    failed: list[Exception] = []
+    for command, result in zip(commands, results):
+        if isinstance(result, Exception):
+            if command != "XADD":
+                raise result
+            failed.append(result)
+    if failed:
+        logger.warning("provider stream append failed for %d envelope(s): %s", len(failed), failed[0])
+
+
+async def read_last(redis: Redis, provider_id: str, pairs: list[str], now: float | None = None) -> dict[str, Any]:
+    """Last signal per pair for one provider, in a single HMGET. `stale` is evaluated against `now`."""
+    if not pairs:
+        return {}
+    now = time.time() if now is None else now
+    raws = await redis.hmget(last_key(provider_id), pairs)
+    out: dict[str, Any] = {}
+    for pair, raw in zip(pairs, raws):
+        signal = json.loads(raw) if raw else None
+        if signal is not None:
+            if now > expires_at(signal["ts"], signal["ttl_sec"]):
+                # Due but not swept yet.
+                signal = None
+            else:
+                signal["stale"] = now > signal["ts"] + signal["ttl_sec"]
+        out[pair] = signal
+    return out
+
+
+async def sweep_expired(redis: Redis, now: float | None = None) -> int:
+    """Remove every due last-signal field; returns how many were dropped."""
+    now = time.time() if now is None else now
+    script = redis.register_script(_SWEEP_LUA)
+    removed = 0
+    while True:
+        n = int(await script(keys=[SIGNAL_EXPIRY_KEY], args=[now, SWEEP_BATCH, SIGNAL_LAST_PREFIX, _SEP]))
+        removed += n
+        if n < SWEEP_BATCH:
+            return removed
+
+
+async def _migrate_legacy(redis: Redis, keys: list[str], now: float) -> int:
+    """Move live legacy values into their provider hash (unless it already holds a newer one), then unlink."""
+    pipe = redis.pipeline(transaction=False)
+    expiry_by_key: dict[str, int] = {}
+    for key, raw in zip(keys, await redis.mget(keys)):
+        try:
+            signal = json.loads(raw) if raw else None
+            provider_id, pair = signal["provider_id"], signal["pair"]
+            expiry = expires_at(int(signal["ts"]), int(signal["ttl_sec"]))
+        except (ValueError, TypeError, KeyError):
+            continue
+        if expiry <= now:
+            continue
+        signal.pop("stale", None)
+        hash_key = last_key(provider_id)
+        # GT: a value already rewritten through the hash keeps its (later) expiry.
+        pipe.zadd(SIGNAL_EXPIRY_KEY, {f"{provider_id}{_SEP}{pair}": expiry}, gt=True)
+        pipe.hsetnx(hash_key, pair, to_json(signal))
+        expiry_by_key[hash_key] = max(expiry, expiry_by_key.get(hash_key, 0))
+    for hash_key, expiry in expiry_by_key.items():
+        _queue_hash_ttl(pipe, hash_key, max(1, expiry - int(now)))
+    pipe.unlink(*keys)
+    return (await pipe.execute())[-1]
+
+
+async def purge_legacy_keys(redis: Redis, now: float | None = None) -> int:
+    """Migrate pre-hash `signal:last:{provider}:{pair}` string keys, which never expire on their own.
+
+    Values still inside their TTL + grace are copied into the provider hash and expiry index, then
+    every legacy key is unlinked.
+    """
+    now = time.time() if now is None else now
+    removed = 0
+    batch: list[str] = []
+    async for key in redis.scan_iter(match=f"{SIGNAL_LAST_PREFIX}*", count=1000, _type="string"):
+        batch.append(key)
+        if len(batch) >= 1000:
+            removed += await _migrate_legacy(redis, batch, now)
+            batch = []
+    if batch:
+        removed += await _migrate_legacy(redis, batch, now)
+    return removed
+
+
+async def run_sweeper(interval_sec: float | None = None) -> None:
+    interval = interval_sec or settings.signal_sweep_sec
+    redis = get_redis()
+    try:
+        purged = await purge_legacy_keys(redis)
+        if purged:
+            logger.info("migrated and removed %d legacy last-signal keys", purged)
+    except Exception as e:  # noqa: BLE001
+        logger.warning("legacy last-signal purge error: %s", e)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await sweep_expired(redis)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("last-signal sweep error: %s", e)
+
+
+async def ensure_groups(redis: Redis, group: str, known: set[str], start_id: str = "$") -> set[str]:
+    """Create `group` on the stream of every provider not in `known`; returns the current provider set."""
+    providers = await redis.smembers(SIGNAL_PROVIDERS_KEY)
+    for provider_id in providers - known:
+        try:
+            await redis.xgroup_create(provider_stream(provider_id), group, id=start_id, mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+    return set(providers)
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from fnmatch import fnmatchcase
+from typing import Any
+from uuid import uuid4
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from redis.commands.core import AsyncScript
+from redis.exceptions import ResponseError
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.core.db import get_sessionmaker
+from app.core.redis import get_redis
+from app.models.tasks import TaskArchive
+
+logger = logging.getLogger(__name__)
+
+# Task state lives in a hash per task; streams only carry ids. Every (lane, priority) pair has its own
+# stream, read by agents through one consumer group. Agents ack + delete entries when a task settles,
+# reclaim entries of dead consumers and move tasks out of retries into the dead-letter stream
+# (see agents/task_queue.py).
+TASK_KEY_PREFIX = "trade:tasks:"
+TASK_STREAM_PREFIX = "trade:tasks:stream:"
+TASK_GROUP = "agents"
+DEAD_LETTER_STREAM = "trade:tasks:dead"
+# Retries waiting for their backoff: member = task id, score = unix time it is due.
+DELAYED_KEY = "trade:tasks:delayed"
+# Pre-streams list queue; agents drain it into the default lane on startup.
+LEGACY_QUEUE_KEY = "trade:tasks:queue"
+
+# Sorted-set indexes, member = task id. Listing indexes are scored by created time (ms); agents move
+# ids between the status indexes on every transition. finished:{status} is scored by finish time and
+# drives retention.
+INDEX_PREFIX = "trade:tasks:idx:"
+CREATED_INDEX = f"{INDEX_PREFIX}created"
+TERMINAL_STATUSES = ("done", "error", "dead")
+# Summary fields returned by the listing; payload and result stay behind GET /tasks/{id}.
+LIST_FIELDS = (
+    "id", "type", "status", "lane", "priority", "attempts", "created_at", "started_at", "finished_at", "last_error"
+)
+MAX_PAGE = 500
+COMPACT_BATCH = 500
+
+# Per-task event stream: status events (written by enqueue and the agents' status script) and progress
+# events (percent, message, partial) published by handlers. Served by GET /tasks/{id}/events.
+EVENTS_PREFIX = "trade:tasks:events:"
+EVENTS_MAXLEN = 200
+
+# Idempotency key -> task id, kept for settings.task_idempotency_ttl_sec.
+IDEMPOTENCY_PREFIX = "trade:tasks:idem:"
+MAX_BATCH = 50_000
+ENQUEUE_CHUNK = 1000
+
+# Lanes are served by separate worker slots (AGENT_LANES), so a batch burst cannot occupy the slots
+# interactive tasks need.
+LANES = ("interactive", "default", "batch")
+DEFAULT_LANE = "default"
+# Within a lane agents pick bands by weighted round-robin: high goes first most of the time, low still
+# gets its turn.
+PRIORITIES = ("high", "normal", "low")
+DEFAULT_PRIORITY = "normal"
+
+# First match wins; settings.task_routes are checked before these.
+ROUTES: tuple[tuple[str, str], ...] = (
+    ("ping", "interactive"),
+    # Sweep evaluations are backtests; the coordinator mostly waits on them for hours, so it must not
+    # hold an interactive slot. The rest of the alignment family stays interactive.
+    ("strategylab.alignment.evaluate", "batch"),
+    ("strategylab.alignment.propose", "default"),
+    ("strategylab.alignment.*", "interactive"),
+    ("signals.evaluate", "batch"),
+    ("market.backfill", "batch"),
+    ("backtest.run", "batch"),
+)
+
+_groups_ready: set[str] = set()
+
+
+def task_key(task_id: str) -> str:
+    return f"{TASK_KEY_PREFIX}{task_id}"
+
+
+def stream_key(lane: str, priority: str) -> str:
+    return f"{TASK_STREAM_PREFIX}{lane}:{priority}"
+
+
+def events_key(task_id: str) -> str:
+    return f"{EVENTS_PREFIX}{task_id}"
+
+
+def status_index(status: str) -> str:
+    return f"{INDEX_PREFIX}status:{status}"
+
+
+def type_index(task_type: str) -> str:
+    return f"{INDEX_PREFIX}type:{task_type}"
+
+
+def status_type_index(status: str, task_type: str) -> str:
+    return f"{INDEX_PREFIX}status_type:{status}:{task_type}"
+
+
+def finished_index(status: str) -> str:
+    return f"{INDEX_PREFIX}finished:{status}"
+
+
+def route(task_type: str) -> tuple[str, str]:
+    """Lane for a task type and the rule that chose it."""
+    for pattern, lane in (*settings.task_routes.items(), *ROUTES):
+        if fnmatchcase(task_type, pattern):
+            return lane, pattern
+    return DEFAULT_LANE, "*"
+
+
+async def ensure_group(redis: Redis, stream: str) -> None:
+    if stream in _groups_ready:
+        return
+    try:
+        # "0": a group created after tasks were added still delivers them.
+        await redis.xgroup_create(stream, TASK_GROUP, id="0", mkstream=True)
+    except ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+    _groups_ready.add(stream)
+
+
+# Enqueue is one script so the idempotency check and every write land together: a retried request
+# either sees the earlier task or creates it completely. Keys other than KEYS are not touched.
+# KEYS = task hash, lane stream, events stream, created/status/type/status+type indexes, idempotency key
+# (optional). ARGV = id, type, payload, lane, priority, route, created_at, created_ms, idempotency ttl,
+# events maxlen, idempotency key.
+_ENQUEUE_LUA = """
+if KEYS[8] then
+  local existing = redis.call('GET', KEYS[8])
+  if existing then return {existing, 1} end
+  redis.call('SET', KEYS[8], ARGV[1], 'EX', ARGV[9])
+end
+redis.call('HSET', KEYS[1], 'id', ARGV[1], 'type', ARGV[2], 'payload', ARGV[3], 'status', 'queued',
+  'lane', ARGV[4], 'priority', ARGV[5], 'route', ARGV[6], 'stream', KEYS[2], 'attempts', 0,
+  'created_at', ARGV[7], 'created_ms', ARGV[8], 'idempotency_key', ARGV[11])
+for i = 4, 7 do
+  redis.call('ZADD', KEYS[i], ARGV[8], ARGV[1])
+end
+redis.call('XADD', KEYS[3], 'MAXLEN', '~', ARGV[10], '*', 'event', 'status', 'status', 'queued')
+redis.call('XADD', KEYS[2], '*', 'id', ARGV[1])
+return {ARGV[1], 0}
+"""
+
+_enqueue_script: AsyncScript | None = None
+
+# One page of an index, newest first, after the cursor member. A batch shares one created_ms score, so
+# the cursor is resolved by rank; if it left the index (status change), by its score, skipping members of
+# the same score at or above its id. KEYS = index. ARGV = cursor id, cursor score, limit + 1.
+_PAGE_LUA = """
+local start = 0
+local rank = ARGV[1] ~= '' and redis.call('ZREVRANK', KEYS[1], ARGV[1])
+if rank then
+  start = rank + 1
+elseif ARGV[2] ~= '' then
+  start = redis.call('ZCOUNT', KEYS[1], '(' .. ARGV[2], '+inf')
+  while true do
+    local row = redis.call('ZREVRANGE', KEYS[1], start, start, 'WITHSCORES')
+    if #row == 0 or tonumber(row[2]) ~= tonumber(ARGV[2]) or row[1] < ARGV[1] then break end
+    start = start + 1
+  end
+end
+return redis.call('ZREVRANGE', KEYS[1], start, start + tonumber(ARGV[3]) - 1, 'WITHSCORES')
+"""
+
+_page_script: AsyncScript | None = None
+
+
+def idempotency_key(key: str) -> str:
+    return f"{IDEMPOTENCY_PREFIX}{key}"
+
+
+def plan(
+    task_type: str,
+    payload: dict[str, Any],
+    *,
+    priority: str = DEFAULT_PRIORITY,
+    lane: str | None = None,
+    idempotency: str | None = None,
+) -> dict[str, Any]:
+    """Validate a task spec and resolve its lane; raises ValueError."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    if lane is None:
+        lane, rule = route(task_type)
+    else:
+        rule = "explicit"
+    if lane not in LANES:
+        raise ValueError(f"lane must be one of {', '.join(LANES)}")
+    return {
+        "id": str(uuid4()),
+        "type": task_type,
+        "payload": payload,
+        "lane": lane,
+        "priority": priority,
+        "route": rule,
+        "idempotency_key": idempotency,
+    }
+
+
+def _queue_enqueue(pipe: Pipeline, script: AsyncScript, task: dict[str, Any], created: datetime) -> None:
+    keys = [
+        task_key(task["id"]),
+        stream_key(task["lane"], task["priority"]),
+        events_key(task["id"]),
+        CREATED_INDEX,
+        status_index("queued"),
+        type_index(task["type"]),
+        status_type_index("queued", task["type"]),
+    ]
+    if task["idempotency_key"]:
+        keys.append(idempotency_key(task["idempotency_key"]))
+    args = [
+        task["id"],
+        task["type"],
+        json.dumps(task["payload"], ensure_ascii=False),
+        task["lane"],
+        task["priority"],
+        task["route"],
+        created.isoformat(),
+        int(created.timestamp() * 1000),
+        settings.task_idempotency_ttl_sec,
+        EVENTS_MAXLEN,
+        task["idempotency_key"] or "",
+    ]
+    pipe.evalsha(script.sha, len(keys), *keys, *args)
+
+
+async def enqueue_many(redis: Redis, tasks: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Write planned tasks (see plan()) in pipelined chunks; returns, in order, the scheduling fields
+    of each task plus `duplicate`, which marks an idempotency key seen before (its `id` is the
+    earlier task's)."""
+    global _enqueue_script
+    if _enqueue_script is None:
+        _enqueue_script = redis.register_script(_ENQUEUE_LUA)
+    for stream in {stream_key(t["lane"], t["priority"]) for t in tasks}:
+        await ensure_group(redis, stream)
+
+    out: list[dict[str, Any]] = []
+    created = datetime.now(timezone.utc)
+    for i in range(0, len(tasks), ENQUEUE_CHUNK):
+        chunk = tasks[i : i + ENQUEUE_CHUNK]
+        pipe = redis.pipeline(transaction=False)
+        # The pipeline loads the script first if Redis lacks it.
+        pipe.scripts.add(_enqueue_script)
+        for task in chunk:
+            _queue_enqueue(pipe, _enqueue_script, task, created)
+        for task, (task_id, duplicate) in zip(chunk, await pipe.execute()):
+            out.append(
+                {
+                    "id": task_id,
+                    "lane": task["lane"],
+                    "priority": task["priority"],
+                    "route": task["route"],
+                    "duplicate": bool(duplicate),
+                }
+            )
+    return out
+
+
+async def enqueue(
+    redis: Redis,
+    task_type: str,
+    payload: dict[str, Any],
+    *,
+    priority: str = DEFAULT_PRIORITY,
+    lane: str | None = None,
+    idempotency: str | None = None,
+) -> dict[str, Any]:
+    """Create the task hash and publish its id to the stream of its lane and priority.
+
+    Returns the scheduling fields stored on the hash: id, lane, priority, route, plus `duplicate`.
+    """
+    task = plan(task_type, payload, priority=priority, lane=lane, idempotency=idempotency)
+    return (await enqueue_many(redis, [task]))[0]
+
+
+def encode_cursor(created_ms: int, task_id: str) -> str:
+    return f"{created_ms}:{task_id}"
+
+
+def decode_cursor(cursor: str) -> tuple[int, str]:
+    created_ms, sep, task_id = cursor.partition(":")
+    if not sep or not task_id:
+        raise ValueError("malformed cursor")
+    return int(created_ms), task_id
+
+
+async def list_tasks(
+    redis: Redis,
+    *,
+    status: str | None = None,
+    task_type: str | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+) -> dict[str, Any]:
+    """Newest first, keyset-paginated over the matching index: O(log n + page) per call."""
+    if status and task_type:
+        index = status_type_index(status, task_type)
+    elif status:
+        index = status_index(status)
+    elif task_type:
+        index = type_index(task_type)
+    else:
+        index = CREATED_INDEX
+
+    global _page_script
+    if _page_script is None:
+        _page_script = redis.register_script(_PAGE_LUA)
+    after = decode_cursor(cursor) if cursor else None
+    rows = await _page_script(keys=[index], args=[after[1] if after else "", after[0] if after else "", limit + 1])
+    ids = [(rows[i], int(float(rows[i + 1]))) for i in range(0, len(rows), 2)]
+
+    page = ids[:limit]
+    pipe = redis.pipeline(transaction=False)
+    for task_id, _ in page:
+        pipe.hmget(task_key(task_id), LIST_FIELDS)
+    items = [dict(zip(LIST_FIELDS, values)) for values in await pipe.execute() if values[0] is not None]
+    next_cursor = encode_cursor(page[-1][1], page[-1][0]) if len(ids) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def event_message(task_id: str, entry_id: str, fields: dict[str, str]) -> dict[str, Any]:
+    """Task event stream entry -> SSE payload; `ts` (ms) comes from the entry id."""
+    message: dict[str, Any] = {"task_id": task_id, "ts": int(entry_id.split("-", 1)[0]), **fields}
+    if "percent" in message:
+        message["percent"] = float(message["percent"])
+    if "partial" in message:
+        message["partial"] = _parse_json(message["partial"])
+    return message
+
+
+def _parse_ts(value: str | None) -> datetime | None:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _parse_json(value: str | None) -> Any:
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return {"_raw": value}
+
+
+def archive_row(task: dict[str, str], archived_at: datetime) -> dict[str, Any]:
+    return {
+        "id": task["id"],
+        "type": task.get("type", ""),
+        "status": task.get("status", ""),
+        "lane": task.get("lane"),
+        "priority": task.get("priority"),
+        "attempts": int(task.get("attempts") or 0),
+        "payload": _parse_json(task.get("payload")),
+        "result": _parse_json(task.get("result")),
+        "last_error": task.get("last_error"),
+        "created_at": _parse_ts(task.get("created_at")),
+        "started_at": _parse_ts(task.get("started_at")),
+        "finished_at": _parse_ts(task.get("finished_at")),
+        "archived_at": archived_at,
+    }
+
+
+async def compact_tasks(redis: Redis, now: float | None = None) -> int:
+    """Archive settled tasks past their status retention to Postgres, then drop them and their index entries."""
+    now_ms = int((time.time() if now is None else now) * 1000)
+    archived = 0
+    for status, ttl_sec in settings.task_retention_sec.items():
+        if status not in TERMINAL_STATUSES:
+            continue
+        while True:
+            ids = await redis.zrangebyscore(finished_index(status), "-inf", now_ms - ttl_sec * 1000, start=0, num=COMPACT_BATCH)
+            if not ids:
+                break
+            pipe = redis.pipeline(transaction=False)
+            for task_id in ids:
+                pipe.hgetall(task_key(task_id))
+            tasks = [task for task in await pipe.execute() if task.get("id")]
+
+            archived_at = datetime.now(timezone.utc)
+            if tasks:
+                async with get_sessionmaker()() as session:
+                    # Re-archiving after a crash between the insert and the Redis cleanup is a no-op.
+                    stmt = insert(TaskArchive).on_conflict_do_nothing(index_elements=["id"])
+                    await session.execute(stmt, [archive_row(task, archived_at) for task in tasks])
+                    await session.commit()
+
+            types = {task["id"]: task.get("type", "") for task in tasks}
+            pipe = redis.pipeline(transaction=True)
+            for task_id in ids:
+                pipe.delete(task_key(task_id), events_key(task_id))
+                pipe.zrem(CREATED_INDEX, task_id)
+                pipe.zrem(status_index(status), task_id)
+                pipe.zrem(finished_index(status), task_id)
+                if task_id in types:
+                    pipe.zrem(type_index(types[task_id]), task_id)
+                    pipe.zrem(status_type_index(status, types[task_id]), task_id)
+            await pipe.execute()
+            archived += len(tasks)
+            if len(ids) < COMPACT_BATCH:
+                break
+    return archived
+
+
+async def run_retention_loop(interval_sec: float | None = None) -> None:
+    """Keep Redis bounded: settled tasks live there for settings.task_retention_sec, then only in Postgres."""
+    interval = interval_sec or settings.task_retention_interval_sec
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            n = await compact_tasks(get_redis())
+            if n:
+                logger.info("archived %d task(s)", n)
+        except Exception as e:  # noqa: BLE001
+            logger.warning("task retention error: %s", e)
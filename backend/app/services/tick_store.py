@@ -0,0 +1,300 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from app.core.config import settings
+
+# Column name -> dtype. Each column of a segment is a raw little-endian file appended in place.
+COLUMNS: dict[str, np.dtype] = {
+    "id": np.dtype("<i8"),
+    "ts": np.dtype("<i8"),
+    "price": np.dtype("<f8"),
+    "qty": np.dtype("<f8"),
+    # Binance `m`: buyer is the maker, i.e. the aggressor sold.
+    "buyer_maker": np.dtype("?"),
+}
+MANIFEST = "manifest.json"
+DAY_MS = 86_400_000
+
+Ticks = dict[str, np.ndarray]
+
+
+def empty_ticks() -> Ticks:
+    return {name: np.empty(0, dtype=dt) for name, dt in COLUMNS.items()}
+
+
+def _day(ts_ms: int) -> str:
+    return datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc).strftime("%Y%m%d")
+
+
+class TickStore:
+    """Append-only, day-partitioned columnar trade store.
+
+    Layout: {root}/{exchange}/{symbol}/{YYYYMMDD}-{first id}-{last id}/{column}.bin plus a
+    per-symbol manifest with the id/ts bounds of every segment, ordered by id. Trade ids are
+    consecutive per symbol, so a missing range shows up as an id gap between neighbouring segments;
+    id and time lookups are a manifest scan plus a binary search on a memory-mapped column.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self._manifests: dict[tuple[str, str], list[dict]] = {}
+
+    def _symbol_dir(self, exchange: str, symbol: str) -> Path:
+        return self.root / exchange / symbol
+
+    def _seg_dir(self, exchange: str, symbol: str, seg: dict) -> Path:
+        # Segments written before the id-suffixed layout live in a bare {YYYYMMDD} directory.
+        return self._symbol_dir(exchange, symbol) / seg.get("dir", seg["day"])
+
+    def manifest(self, exchange: str, symbol: str) -> list[dict]:
+        key = (exchange, symbol)
+        if key not in self._manifests:
+            path = self._symbol_dir(exchange, symbol) / MANIFEST
+            try:
+                self._manifests[key] = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._manifests[key] = []
+        return self._manifests[key]
+
+    def _write_manifest(self, exchange: str, symbol: str, segments: list[dict]) -> None:
+        path = self._symbol_dir(exchange, symbol) / MANIFEST
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(segments), encoding="utf-8")
+        os.replace(tmp, path)
+        self._manifests[(exchange, symbol)] = segments
+
+    def first(self, exchange: str, symbol: str) -> tuple[int, int] | None:
+        """(first trade id, first ts) stored for the symbol."""
+        segments = self.manifest(exchange, symbol)
+        if not segments:
+            return None
+        return segments[0]["first_id"], segments[0]["first_ts"]
+
+    def last(self, exchange: str, symbol: str) -> tuple[int, int] | None:
+        """(last trade id, last ts) stored for the symbol."""
+        segments = self.manifest(exchange, symbol)
+        if not segments:
+            return None
+        return segments[-1]["last_id"], segments[-1]["last_ts"]
+
+    def gaps(self, exchange: str, symbol: str, start_ms: int, end_ms: int) -> list[tuple[int, int]]:
+        """Missing trade-id ranges (exclusive bounds) between stored segments that overlap [start_ms, end_ms)."""
+        segments = self.manifest(exchange, symbol)
+        return [
+            (prev["last_id"], nxt["first_id"])
+            for prev, nxt in zip(segments, segments[1:])
+            if nxt["first_id"] > prev["last_id"] + 1 and prev["last_ts"] < end_ms and nxt["first_ts"] > start_ms
+        ]
+
+    def spans(self, exchange: str, symbol: str) -> list[tuple[int, int]]:
+        """(first ts, last ts) of every run of id-contiguous segments; nothing is missing inside a run."""
+        out: list[tuple[int, int]] = []
+        prev_id = None
+        for seg in self.manifest(exchange, symbol):
+            if prev_id is not None and seg["first_id"] == prev_id + 1:
+                out[-1] = (out[-1][0], seg["last_ts"])
+            else:
+                out.append((seg["first_ts"], seg["last_ts"]))
+            prev_id = seg["last_id"]
+        return out
+
+    def append(self, exchange: str, symbol: str, ticks: Ticks) -> int:
+        """Store trades whose ids are not stored yet. Returns the number of rows written.
+
+        Rows may fall before, between or after the stored segments. A run that continues the newest
+        segment on the same day is appended to it in place; every other run becomes a new segment.
+        """
+        segments = [dict(s) for s in self.manifest(exchange, symbol)]
+        firsts = np.array([s["first_id"] for s in segments], dtype=np.int64)
+        lasts = np.array([s["last_id"] for s in segments], dtype=np.int64)
+        ids = ticks["id"]
+        # Index of the segment each id would be inserted before; ids inside a segment are stored already.
+        slot = np.searchsorted(firsts, ids, side="right")
+        keep = ~((slot > 0) & (ids <= lasts[np.maximum(slot - 1, 0)])) if segments else np.ones(ids.shape[0], dtype=bool)
+        if not keep.any():
+            return 0
+        ticks = {name: np.ascontiguousarray(ticks[name][keep], dtype=dt) for name, dt in COLUMNS.items()}
+        ids, slot = ticks["id"], slot[keep]
+
+        days = ticks["ts"] // DAY_MS
+        bounds = np.flatnonzero((np.diff(days) != 0) | (np.diff(ids) != 1) | (np.diff(slot) != 0)) + 1
+        tail = segments[-1] if segments else None
+        added: list[dict] = []
+        for chunk in np.split(np.arange(ids.shape[0]), bounds):
+            lo, hi = int(chunk[0]), int(chunk[-1]) + 1
+            day = _day(int(ticks["ts"][lo]))
+            first_id = int(ids[lo])
+            if tail is not None and tail["day"] == day and first_id == tail["last_id"] + 1:
+                seg, mode = tail, "ab"
+            else:
+                seg = {
+                    "day": day,
+                    "dir": f"{day}-{first_id}-{int(ids[hi - 1])}",
+                    "first_id": first_id,
+                    "first_ts": int(ticks["ts"][lo]),
+                    "count": 0,
+                }
+                mode = "wb"
+                added.append(seg)
+                if slot[lo] == len(segments):
+                    tail = seg
+            seg_dir = self._seg_dir(exchange, symbol, seg)
+            seg_dir.mkdir(parents=True, exist_ok=True)
+            for name, dt in COLUMNS.items():
+                path = seg_dir / f"{name}.bin"
+                if mode == "ab":
+                    # Drop any tail a crashed append left past the rows the manifest vouches for.
+                    os.truncate(path, seg["count"] * dt.itemsize)
+                with open(path, mode) as f:
+                    f.write(ticks[name][lo:hi].tobytes())
+            seg["last_id"] = int(ids[hi - 1])
+            seg["last_ts"] = int(ticks["ts"][hi - 1])
+            seg["count"] += hi - lo
+
+        if added:
+            segments = sorted(segments + added, key=lambda s: s["first_id"])
+        self._write_manifest(exchange, symbol, segments)
+        return int(keep.sum())
+
+    def compact(self, exchange: str, symbol: str) -> None:
+        """Merge runs of id-contiguous segments of the same day into a single segment."""
+        segments = self.manifest(exchange, symbol)
+        runs: list[list[dict]] = []
+        for seg in segments:
+            prev = runs[-1][-1] if runs else None
+            if prev is not None and prev["day"] == seg["day"] and seg["first_id"] == prev["last_id"] + 1:
+                runs[-1].append(seg)
+            else:
+                runs.append([seg])
+        if len(runs) == len(segments):
+            return
+
+        out: list[dict] = []
+        stale: list[Path] = []
+        for run in runs:
+            if len(run) == 1:
+                out.append(run[0])
+                continue
+            head, end = run[0], run[-1]
+            merged = {
+                "day": head["day"],
+                "dir": f"{head['day']}-{head['first_id']}-{end['last_id']}",
+                "first_id": head["first_id"],
+                "first_ts": head["first_ts"],
+                "last_id": end["last_id"],
+                "last_ts": end["last_ts"],
+                "count": sum(int(s["count"]) for s in run),
+            }
+            parts = [self._segment(exchange, symbol, s) for s in run]
+            seg_dir = self._seg_dir(exchange, symbol, merged)
+            seg_dir.mkdir(parents=True, exist_ok=True)
+            for name in COLUMNS:
+                with open(seg_dir / f"{name}.bin", "wb") as f:
+                    for part in parts:
+                        f.write(np.asarray(part[name]).tobytes())
+            out.append(merged)
+            stale.extend(self._seg_dir(exchange, symbol, s) for s in run)
+
+        self._write_manifest(exchange, symbol, out)
+        for path in stale:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def _segment(self, exchange: str, symbol: str, seg: dict) -> Ticks:
+        seg_dir = self._seg_dir(exchange, symbol, seg)
+        count = int(seg["count"])
+        if not count:
+            return empty_ticks()
+        # Only map the rows the manifest vouches for; a crash mid-append can leave a partial tail,
+        # which the next in-place append truncates away.
+        return {name: np.memmap(seg_dir / f"{name}.bin", dtype=dt, mode="r", shape=(count,)) for name, dt in COLUMNS.items()}
+
+    def read(self, exchange: str, symbol: str, start_ms: int, end_ms: int) -> Ticks:
+        """Trades with start_ms <= ts < end_ms."""
+        parts: list[Ticks] = []
+        for seg in self.manifest(exchange, symbol):
+            if seg["last_ts"] < start_ms or seg["first_ts"] >= end_ms:
+                continue
+            cols = self._segment(exchange, symbol, seg)
+            lo, hi = np.searchsorted(cols["ts"], [start_ms, end_ms], side="left")
+            parts.append({name: np.asarray(col[lo:hi]) for name, col in cols.items()})
+        return _concat(parts)
+
+    def read_ids(self, exchange: str, symbol: str, from_id: int, to_id: int) -> Ticks:
+        """Trades with from_id <= id <= to_id."""
+        parts: list[Ticks] = []
+        for seg in self.manifest(exchange, symbol):
+            if seg["last_id"] < from_id or seg["first_id"] > to_id:
+                continue
+            cols = self._segment(exchange, symbol, seg)
+            lo = np.searchsorted(cols["id"], from_id, side="left")
+            hi = np.searchsorted(cols["id"], to_id, side="right")
+            parts.append({name: np.asarray(col[lo:hi]) for name, col in cols.items()})
+        return _concat(parts)
+
+
+def _concat(parts: list[Ticks]) -> Ticks:
+    if not parts:
+        return empty_ticks()
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+
+def ticks_from_binance(trades: list[dict]) -> Ticks:
+    n = len(trades)
+    return {
+        "id": np.fromiter((t["a"] for t in trades), dtype=np.int64, count=n),
+        "ts": np.fromiter((t["T"] for t in trades), dtype=np.int64, count=n),
+        "price": np.fromiter((float(t["p"]) for t in trades), dtype=np.float64, count=n),
+        "qty": np.fromiter((float(t["q"]) for t in trades), dtype=np.float64, count=n),
+        "buyer_maker": np.fromiter((bool(t["m"]) for t in trades), dtype=np.bool_, count=n),
+    }
+
+
+def bars(ticks: Ticks, interval_ms: int) -> dict[str, np.ndarray]:
+    """OHLCV buckets from time-ordered ticks (vectorized with reduceat)."""
+    if not ticks["ts"].size:
+        return {k: np.empty(0) for k in ("ts", "open", "high", "low", "close", "volume")}
+    bucket = ticks["ts"] // interval_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], bucket.shape[0]] - 1
+    price, qty = ticks["price"], ticks["qty"]
+    return {
+        "ts": bucket[starts] * interval_ms,
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends],
+        "volume": np.add.reduceat(qty, starts),
+    }
+
+
+def vwap(ticks: Ticks) -> float | None:
+    volume = float(ticks["qty"].sum())
+    if not volume:
+        return None
+    return float((ticks["price"] * ticks["qty"]).sum() / volume)
+
+
+_store: TickStore | None = None
+_locks: dict[tuple[str, str], asyncio.Lock] = {}
+
+
+def get_tick_store() -> TickStore:
+    global _store
+    if _store is None:
+        _store = TickStore(Path(settings.data_dir) / "ticks")
+    return _store
+
+
+def symbol_lock(exchange: str, symbol: str) -> asyncio.Lock:
+    return _locks.setdefault((exchange, symbol), asyncio.Lock())
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import asyncio
+import math
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+
+from app.services.market_clients import now_ts_ms, sync_binance_ticks
+from app.services.tick_store import Ticks, get_tick_store
+
+# Closed histograms are cached per hour of trades; a zoom only re-reads ticks for the ragged edges.
+CHUNK_MS = 3_600_000
+MAX_CACHED_CHUNKS = 4096
+VALUE_AREA_SHARE = 0.7
+
+
+class Histogram:
+    """Buy/sell volume per price level, levels being floor(price / step) from `lo` upwards."""
+
+    __slots__ = ("lo", "buy", "sell", "last_id")
+
+    def __init__(self, lo: int = 0, buy: np.ndarray | None = None, sell: np.ndarray | None = None, last_id: int = -1) -> None:
+        self.lo = lo
+        self.buy = np.zeros(0) if buy is None else buy
+        self.sell = np.zeros(0) if sell is None else sell
+        self.last_id = last_id
+
+    def __len__(self) -> int:
+        return int(self.buy.shape[0])
+
+    def add(self, ticks: Ticks, step: float) -> Histogram:
+        if not ticks["price"].size:
+            return self
+        levels = np.floor(ticks["price"] / step).astype(np.int64)
+        lo = int(levels.min()) if not len(self) else min(self.lo, int(levels.min()))
+        hi = max(self.lo + len(self), int(levels.max()) + 1) if len(self) else int(levels.max()) + 1
+        self._resize(lo, hi)
+
+        offset = levels - lo
+        qty = ticks["qty"]
+        sell_side = ticks["buyer_maker"]
+        size = hi - lo
+        self.buy += np.bincount(offset, weights=np.where(sell_side, 0.0, qty), minlength=size)
+        self.sell += np.bincount(offset, weights=np.where(sell_side, qty, 0.0), minlength=size)
+        self.last_id = max(self.last_id, int(ticks["id"][-1]))
+        return self
+
+    def _resize(self, lo: int, hi: int) -> None:
+        if len(self) and lo == self.lo and hi == self.lo + len(self):
+            return
+        buy = np.zeros(hi - lo)
+        sell = np.zeros(hi - lo)
+        if len(self):
+            at = self.lo - lo
+            buy[at : at + len(self)] = self.buy
+            sell[at : at + len(self)] = self.sell
+        self.lo, self.buy, self.sell = lo, buy, sell
+
+    @classmethod
+    def merge(cls, parts: list[Histogram]) -> Histogram:
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls()
+        lo = min(p.lo for p in parts)
+        hi = max(p.lo + len(p) for p in parts)
+        out = cls(lo, np.zeros(hi - lo), np.zeros(hi - lo))
+        for p in parts:
+            at = p.lo - lo
+            out.buy[at : at + len(p)] += p.buy
+            out.sell[at : at + len(p)] += p.sell
+        return out
+
+
+def auto_step(price: float) -> float:
+    """Deterministic level width (~0.1% of price, rounded to a power of ten) so chunks stay cacheable."""
+    if price <= 0:
+        return 1.0
+    return 10.0 ** (math.floor(math.log10(price)) - 3)
+
+
+def summarize(hist: Histogram, step: float) -> dict[str, Any]:
+    total = hist.buy + hist.sell
+    nz = np.flatnonzero(total)
+    prices = (hist.lo + nz) * step
+    out: dict[str, Any] = {
+        "step": step,
+        "prices": prices.tolist(),
+        "buy": hist.buy[nz].tolist(),
+        "sell": hist.sell[nz].tolist(),
+        "total_buy": float(hist.buy.sum()),
+        "total_sell": float(hist.sell.sum()),
+        "poc": None,
+        "value_area": None,
+    }
+    if nz.size:
+        vol = total[nz]
+        out["poc"] = float(prices[int(np.argmax(vol))])
+        # Value area: highest-volume levels until VALUE_AREA_SHARE of volume is covered.
+        order = np.argsort(vol)[::-1]
+        cut = int(np.searchsorted(np.cumsum(vol[order]), VALUE_AREA_SHARE * vol.sum())) + 1
+        area = prices[order[:cut]]
+        out["value_area"] = {"low": float(area.min()), "high": float(area.max() + step)}
+    return out
+
+
+_closed: OrderedDict[tuple, Histogram] = OrderedDict()
+_open: dict[tuple, tuple[int, Histogram]] = {}
+# Chunk caches are mutated from a worker thread; one profile build at a time keeps them consistent.
+_build_lock = asyncio.Lock()
+
+
+def _closed_chunk(exchange: str, symbol: str, step: float, chunk_ts: int) -> Histogram:
+    key = (exchange, symbol, step, chunk_ts)
+    hist = _closed.get(key)
+    if hist is None:
+        ticks = get_tick_store().read(exchange, symbol, chunk_ts, chunk_ts + CHUNK_MS)
+        hist = Histogram().add(ticks, step)
+        _closed[key] = hist
+        while len(_closed) > MAX_CACHED_CHUNKS:
+            _closed.popitem(last=False)
+    _closed.move_to_end(key)
+    return hist
+
+
+def _open_chunk(exchange: str, symbol: str, step: float, chunk_ts: int) -> Histogram:
+    """The still-forming hour: keep its histogram and fold in only trades newer than the last seen id."""
+    store = get_tick_store()
+    key = (exchange, symbol, step)
+    state = _open.get(key)
+    if state is None or state[0] != chunk_ts:
+        hist = Histogram().add(store.read(exchange, symbol, chunk_ts, chunk_ts + CHUNK_MS), step)
+    else:
+        hist = state[1]
+        last = store.last(exchange, symbol)
+        if last is not None and last[0] > hist.last_id:
+            hist.add(store.read_ids(exchange, symbol, hist.last_id + 1, last[0]), step)
+    _open[key] = (chunk_ts, hist)
+    return hist
+
+
+def build_profile(exchange: str, symbol: str, start_ms: int, end_ms: int, step: float, now_ms: int) -> Histogram:
+    store = get_tick_store()
+    # Only chunks strictly inside one gap-free run of stored trades are complete enough to cache.
+    spans = store.spans(exchange, symbol)
+
+    parts: list[Histogram] = []
+    first_full = -(-start_ms // CHUNK_MS) * CHUNK_MS
+    last_full = end_ms // CHUNK_MS * CHUNK_MS
+    if first_full > last_full:
+        # Range sits inside a single chunk.
+        return Histogram().add(store.read(exchange, symbol, start_ms, end_ms), step)
+
+    if start_ms < first_full:
+        parts.append(Histogram().add(store.read(exchange, symbol, start_ms, first_full), step))
+    for chunk_ts in range(first_full, last_full, CHUNK_MS):
+        chunk_end = chunk_ts + CHUNK_MS
+        if any(first < chunk_ts and chunk_end <= last for first, last in spans):
+            parts.append(_closed_chunk(exchange, symbol, step, chunk_ts))
+        else:
+            parts.append(Histogram().add(store.read(exchange, symbol, chunk_ts, chunk_end), step))
+    if last_full < end_ms:
+        if last_full <= now_ms < last_full + CHUNK_MS and end_ms >= now_ms:
+            parts.append(_open_chunk(exchange, symbol, step, last_full))
+        else:
+            parts.append(Histogram().add(store.read(exchange, symbol, last_full, end_ms), step))
+    return Histogram.merge(parts)
+
+
+def missing_ranges(spans: list[tuple[int, int]], start_ms: int, end_ms: int) -> list[list[int]]:
+    """Parts of [start_ms, end_ms] outside every gap-free run of stored trades."""
+    out: list[list[int]] = []
+    cursor = start_ms
+    for first, last in spans:
+        if last < cursor:
+            continue
+        if first >= end_ms:
+            break
+        if first > cursor:
+            out.append([cursor, first])
+        cursor = last
+    if cursor < end_ms:
+        out.append([cursor, end_ms])
+    return out
+
+
+async def volume_profile(symbol: str, start_ms: int, end_ms: int, step: float | None = None) -> dict[str, Any]:
+    now_ms = now_ts_ms()
+    end_ms = min(end_ms, now_ms)
+    # A long range can need more trade pages than one sync pulls; say so instead of a silently short profile.
+    complete = await sync_binance_ticks(symbol, start_ms, end_ms)
+    missing = [] if complete else missing_ranges(get_tick_store().spans("binance", symbol), start_ms, end_ms)
+
+    if step is None:
+        last = get_tick_store().read("binance", symbol, max(start_ms, end_ms - CHUNK_MS), end_ms + 1)["price"]
+        step = auto_step(float(last[-1]) if last.size else 0.0)
+
+    async with _build_lock:
+        hist = await asyncio.to_thread(build_profile, "binance", symbol, start_ms, end_ms, step, now_ms)
+    return {"start": start_ms, "end": end_ms, "complete": not missing, "missing": missing, **summarize(hist, step)}
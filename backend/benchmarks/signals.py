@@ -0,0 +1,342 @@
+"""Load generator and latency benchmark for the signals ingest and last-signal read paths.
+
+Drives the ASGI app in-process (no uvicorn, no network) against a real Redis (`--redis-url`) or
+an in-process fakeredis (`--fake-redis`). Bot reads run with a primed binding cache, so Postgres
+is not needed. A real Redis DB is flushed before and after the run, so it must be named explicitly
+and must not be the app's own (settings.redis_url).
+
+    python -m benchmarks.signals --fake-redis                 # print report
+    python -m benchmarks.signals --fake-redis --check         # compare with benchmarks/baseline.json
+    python -m benchmarks.signals --fake-redis --save-baseline # record a new baseline
+    python -m benchmarks.signals --redis-url redis://localhost:6379/15
+
+The baseline stores ratios, not raw numbers: each throughput is divided by (and each p99 multiplied by)
+the rate of a fixed pure-Python calibration loop run in the same process right before and after that
+workload, so a faster, slower or momentarily throttled machine moves both sides alike. Absolute goals
+are reported separately and checked with --check-goals.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+import numpy as np
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+DIRECTIONS = ("buy", "sell", "flat")
+# Absolute targets in the workload's unit; ingest_ndjson is the one-connection goal of /signals/ingest/ndjson.
+GOALS = {"ingest_ndjson": 10_000.0}
+CALIBRATION_ROUNDS = 7
+CALIBRATION_SEC = 0.1
+
+
+def make_pairs(n: int) -> list[str]:
+    return [f"C{i:04d}/USDT" for i in range(n)]
+
+
+def make_envelope(rng: random.Random, provider_id: str, pairs: list[str], ts: int, ttl_sec: int = 300) -> dict[str, Any]:
+    return {
+        "schema": "th.signal.v1",
+        "provider_id": provider_id,
+        "timestamp": ts,
+        "ttl_sec": ttl_sec,
+        "signals": {
+            pair: {
+                "direction": rng.choice(DIRECTIONS),
+                "confidence": round(rng.random(), 3),
+                "predicted_price_24h": round(rng.uniform(1, 1000), 4),
+                "metadata": {"model": "bench"},
+            }
+            for pair in pairs
+        },
+    }
+
+
+def redis_target_problem(fake_redis: bool, redis_url: str | None, app_redis_url: str) -> str | None:
+    """Why the requested Redis must not be used (it gets flushed), or None."""
+    if fake_redis:
+        return "--fake-redis and --redis-url are mutually exclusive" if redis_url else None
+    if not redis_url:
+        return "pass --fake-redis, or --redis-url with a dedicated DB (it is flushed)"
+    if redis_url.rstrip("/") == app_redis_url.rstrip("/"):
+        return f"{redis_url} is the app's own Redis DB (settings.redis_url); use a dedicated one, e.g. .../15"
+    return None
+
+
+def calibrate(rounds: int = CALIBRATION_ROUNDS) -> list[float]:
+    """Per-round rates (envelopes built and serialized per second): the unit baseline ratios are expressed in."""
+    rng = random.Random(0)
+    pairs = make_pairs(50)
+    rates = []
+    for _ in range(rounds):
+        n = 0
+        t0 = time.perf_counter()
+        while (elapsed := time.perf_counter() - t0) < CALIBRATION_SEC:
+            json.dumps(make_envelope(rng, "calibration", pairs, 0))
+            n += 1
+        rates.append(n / elapsed)
+    return rates
+
+
+class Workload:
+    """Runs `requests` calls of `fn` with `concurrency` workers and keeps per-call latencies.
+
+    The calibration rate is sampled around the run and used to express its results as ratios.
+    """
+
+    def __init__(self, name: str, *, unit: str = "req", per_call: int = 1) -> None:
+        self.name = name
+        self.unit = unit
+        self.per_call = per_call
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.elapsed = 0.0
+        self.calibration = 0.0
+
+    async def run(self, fn, requests: int, concurrency: int) -> None:
+        remaining = iter(range(requests))
+
+        async def worker() -> None:
+            for i in remaining:
+                t0 = time.perf_counter()
+                try:
+                    ok = await fn(i)
+                except Exception:  # noqa: BLE001
+                    ok = False
+                self.latencies.append(time.perf_counter() - t0)
+                if not ok:
+                    self.errors += 1
+
+        before = calibrate()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        self.elapsed = time.perf_counter() - t0
+        # Median of the rounds on both sides: short bursts of a shared CPU barely move it.
+        self.calibration = float(np.median(before + calibrate()))
+
+    def report(self) -> dict[str, Any]:
+        lat = np.asarray(self.latencies) * 1000
+        calls = int(lat.size)
+        throughput = calls * self.per_call / self.elapsed if self.elapsed else 0.0
+        p99 = float(np.percentile(lat, 99)) if calls else None
+        report = {
+            "calls": calls,
+            "errors": self.errors,
+            "throughput": round(throughput, 1),
+            "unit": f"{self.unit}/s",
+            "p50_ms": round(float(np.percentile(lat, 50)), 3) if calls else None,
+            "p90_ms": round(float(np.percentile(lat, 90)), 3) if calls else None,
+            "p99_ms": round(p99, 3) if p99 is not None else None,
+            "max_ms": round(float(lat.max()), 3) if calls else None,
+            "calibration": round(self.calibration, 1),
+            "throughput_ratio": round(throughput / self.calibration, 4),
+            "p99_ratio": round(p99 / 1000 * self.calibration, 2) if p99 is not None else None,
+        }
+        if self.name in GOALS:
+            report["goal"] = GOALS[self.name]
+            report["of_goal"] = round(throughput / GOALS[self.name], 4)
+        return report
+
+
+async def run_suite(args: argparse.Namespace) -> dict[str, Any]:
+    from app.core import redis as redis_module
+    from app.core.config import settings
+
+    problem = redis_target_problem(args.fake_redis, args.redis_url, settings.redis_url)
+    if problem:
+        sys.exit(problem)
+    if args.fake_redis:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("--fake-redis needs fakeredis[lua] (see requirements-dev.txt)")
+        redis_module._redis = fakeredis.FakeAsyncRedis(decode_responses=True)
+    else:
+        settings.redis_url = args.redis_url
+
+    from app.main import app
+    from app.services.binding_cache import get_binding_cache
+
+    redis = redis_module.get_redis()
+    if not args.fake_redis:
+        await redis.flushdb()
+
+    rng = random.Random(args.seed)
+    pairs = make_pairs(args.pairs)
+    providers = [f"bench-{i:03d}" for i in range(args.providers)]
+    bots = [f"bench-bot-{i:03d}" for i in range(args.providers)]
+    cache = get_binding_cache()
+    for bot_id, provider_id in zip(bots, providers):
+        cache.prime(bot_id, provider_id)
+
+    now = int(time.time())
+    chunks = [pairs[i : i + args.pairs_per_envelope] for i in range(0, len(pairs), args.pairs_per_envelope)]
+    # Pre-serialized bodies so the client side does not dominate the measurement.
+    bodies = [
+        json.dumps(make_envelope(rng, providers[i % len(providers)], chunks[(i // len(providers)) % len(chunks)], now))
+        for i in range(max(args.requests, len(providers) * len(chunks)))
+    ]
+    read_sets = [",".join(rng.sample(pairs, args.read_pairs)) for _ in range(256)]
+    headers = {"content-type": "application/json"}
+
+    results: dict[str, Any] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def ingest(i: int) -> bool:
+            resp = await client.post("/signals/ingest", content=bodies[i % len(bodies)], headers=headers)
+            return resp.status_code == 200
+
+        # Warm-up also guarantees every (provider, pair) has a value before reads are measured.
+        warm = Workload("warmup")
+        await warm.run(ingest, len(providers) * len(chunks), args.concurrency)
+
+        wl = Workload("ingest", unit="signals", per_call=args.pairs_per_envelope)
+        await wl.run(ingest, args.requests, args.concurrency)
+        results["ingest"] = wl.report()
+
+        batch = args.ndjson_batch
+        ndjson_bodies = ["\n".join(bodies[j % len(bodies)] for j in range(i, i + batch)) for i in range(0, batch * 8, batch)]
+
+        async def ingest_ndjson(i: int) -> bool:
+            resp = await client.post("/signals/ingest/ndjson", content=ndjson_bodies[i % len(ndjson_bodies)])
+            return resp.status_code == 200 and resp.json()["rejected"] == 0
+
+        wl = Workload("ingest_ndjson", unit="envelopes", per_call=batch)
+        await wl.run(ingest_ndjson, max(1, args.requests // batch), min(args.concurrency, 4))
+        results["ingest_ndjson"] = wl.report()
+
+        async def read_provider(i: int) -> bool:
+            resp = await client.get(
+                f"/signals/providers/{providers[i % len(providers)]}/last", params={"pairs": read_sets[i % len(read_sets)]}
+            )
+            return resp.status_code == 200
+
+        wl = Workload("read_provider_last")
+        await wl.run(read_provider, args.requests, args.concurrency)
+        results["read_provider_last"] = wl.report()
+
+        async def read_bot(i: int) -> bool:
+            resp = await client.get(f"/signals/bots/{bots[i % len(bots)]}/last", params={"pairs": read_sets[i % len(read_sets)]})
+            return resp.status_code == 200 and resp.json()["provider_id"] is not None
+
+        wl = Workload("read_bot_last")
+        await wl.run(read_bot, args.requests, args.concurrency)
+        results["read_bot_last"] = wl.report()
+
+    if not args.fake_redis:
+        await redis.flushdb()
+
+    return {
+        "config": {
+            "redis": "fake" if args.fake_redis else "redis",
+            "providers": args.providers,
+            "pairs": args.pairs,
+            "pairs_per_envelope": args.pairs_per_envelope,
+            "read_pairs": args.read_pairs,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "ndjson_batch": args.ndjson_batch,
+        },
+        "results": results,
+    }
+
+
+def baseline_of(report: dict[str, Any]) -> dict[str, Any]:
+    """The machine-independent part of a report: config plus per-workload ratios."""
+    return {
+        "config": report["config"],
+        "results": {
+            name: {"throughput_ratio": r["throughput_ratio"], "p99_ratio": r["p99_ratio"]} for name, r in report["results"].items()
+        },
+    }
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float, goals: bool = False) -> list[str]:
+    """Regressions of `current` against `baseline` ratios: p99 above or throughput below the tolerance band.
+
+    With `goals`, a workload below its absolute GOALS entry is reported too.
+    """
+    problems: list[str] = []
+    if current["config"] != baseline["config"]:
+        problems.append("config differs from baseline; re-record it with --save-baseline")
+        return problems
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            problems.append(f"{name}: missing")
+            continue
+        if cur["errors"]:
+            problems.append(f"{name}: {cur['errors']} errors")
+        if base["p99_ratio"] and cur["p99_ratio"] > base["p99_ratio"] * (1 + tolerance):
+            problems.append(f"{name}: p99 ratio {cur['p99_ratio']} > baseline {base['p99_ratio']} (+{tolerance:.0%})")
+        if cur["throughput_ratio"] < base["throughput_ratio"] * (1 - tolerance):
+            problems.append(
+                f"{name}: throughput ratio {cur['throughput_ratio']} < baseline {base['throughput_ratio']} (-{tolerance:.0%})"
+            )
+    if goals:
+        for name, r in current["results"].items():
+            if "goal" in r and r["throughput"] < r["goal"]:
+                problems.append(f"{name}: {r['throughput']} {r['unit']} is {r['of_goal']:.1%} of the {r['goal']} goal")
+    return problems
+
+
+def _print(report: dict[str, Any]) -> None:
+    print(json.dumps(report["config"]))
+    print(
+        f"{'workload':<20}{'calls':>8}{'errors':>8}{'throughput':>22}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'calibration':>13}{'tput ratio':>12}{'p99 ratio':>11}{'of goal':>9}"
+    )
+    for name, r in report["results"].items():
+        of_goal = f"{r['of_goal']:.1%}" if "of_goal" in r else "-"
+        print(
+            f"{name:<20}{r['calls']:>8}{r['errors']:>8}{r['throughput']:>14} {r['unit']:<7}"
+            f"{r['p50_ms']:>10}{r['p90_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}"
+            f"{r['calibration']:>13}{r['throughput_ratio']:>12}{r['p99_ratio']:>11}{of_goal:>9}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--redis-url", default=None, help="dedicated Redis DB to run against; it is flushed")
+    parser.add_argument("--fake-redis", action="store_true", help="use in-process fakeredis instead of Redis")
+    parser.add_argument("--providers", type=int, default=50)
+    parser.add_argument("--pairs", type=int, default=500)
+    parser.add_argument("--pairs-per-envelope", type=int, default=50)
+    parser.add_argument("--read-pairs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--ndjson-batch", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", type=Path, default=None, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="exit 1 on regression against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--check-goals", action="store_true", help="with --check, also fail below the absolute GOALS")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_suite(args))
+    _print(report)
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(baseline_of(report), indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {args.baseline}")
+    if args.check:
+        problems = compare(report, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance, args.check_goals)
+        for p in problems:
+            print(f"REGRESSION {p}")
+        sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+from pathlib import Path
+
+import pytest
+
+LUA_DIR = Path(__file__).with_name("lua")
+
+
+@pytest.fixture
+def lua_cjson(monkeypatch) -> None:
+    """Lets `lua_modules={"cjson"}` load the pure-Lua cjson in tests/lua into fakeredis' Lua runtime."""
+    monkeypatch.setenv("LUA_PATH", f"{LUA_DIR}/?.lua;;")
@@ -0,0 +1,99 @@
+-- Minimal stand-in for Redis' bundled cjson, for fakeredis' Lua runtime (which has none).
+-- Covers what the app's scripts use: objects, arrays, strings, numbers, booleans and null.
+local cjson = {}
+
+local function is_array(t)
+  local n = 0
+  for k in pairs(t) do
+    if type(k) ~= 'number' then return false end
+    n = n + 1
+  end
+  return n > 0 and n == #t
+end
+
+local function encode(v)
+  local t = type(v)
+  if t == 'nil' then
+    return 'null'
+  elseif t == 'boolean' then
+    return tostring(v)
+  elseif t == 'number' then
+    if v == math.floor(v) and math.abs(v) < 1e15 then return string.format('%d', v) end
+    return string.format('%.14g', v)
+  elseif t == 'string' then
+    return '"' .. v:gsub('[%c"\\]', function(c) return string.format('\\u%04x', c:byte()) end) .. '"'
+  elseif t == 'table' then
+    local out = {}
+    if is_array(v) then
+      for i = 1, #v do out[i] = encode(v[i]) end
+      return '[' .. table.concat(out, ',') .. ']'
+    end
+    for k, x in pairs(v) do out[#out + 1] = encode(tostring(k)) .. ':' .. encode(x) end
+    return '{' .. table.concat(out, ',') .. '}'
+  end
+  error('cannot encode ' .. t)
+end
+
+local escapes = {n = '\n', t = '\t', r = '\r', b = '\b', f = '\f'}
+
+local function decode(s, i)
+  i = s:find('%S', i)
+  local c = s:sub(i, i)
+  if c == '{' or c == '[' then
+    local close = c == '{' and '}' or ']'
+    local t = {}
+    i = s:find('%S', i + 1)
+    if s:sub(i, i) == close then return t, i + 1 end
+    while true do
+      local v
+      if close == '}' then
+        local k
+        k, i = decode(s, i)
+        i = s:find(':', i) + 1
+        v, i = decode(s, i)
+        t[k] = v
+      else
+        v, i = decode(s, i)
+        t[#t + 1] = v
+      end
+      i = s:find('%S', i)
+      if s:sub(i, i) == close then return t, i + 1 end
+      i = i + 1
+    end
+  elseif c == '"' then
+    local buf, j = {}, i + 1
+    while true do
+      local ch = s:sub(j, j)
+      if ch == '"' then break end
+      if ch == '\\' then
+        local e = s:sub(j + 1, j + 1)
+        if e == 'u' then
+          buf[#buf + 1] = string.char(tonumber(s:sub(j + 2, j + 5), 16))
+          j = j + 6
+        else
+          buf[#buf + 1] = escapes[e] or e
+          j = j + 2
+        end
+      else
+        buf[#buf + 1] = ch
+        j = j + 1
+      end
+    end
+    return table.concat(buf), j + 1
+  elseif s:sub(i, i + 3) == 'true' then
+    return true, i + 4
+  elseif s:sub(i, i + 4) == 'false' then
+    return false, i + 5
+  elseif s:sub(i, i + 3) == 'null' then
+    return nil, i + 4
+  end
+  local num = s:match('^-?[%d%.eE+-]+', i)
+  return tonumber(num), i + #num
+end
+
+cjson.encode = encode
+function cjson.decode(s)
+  return (decode(s, 1))
+end
+
+return cjson
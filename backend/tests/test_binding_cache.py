@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api import signals as signals_api
+from app.main import app
+from app.services import binding_cache
+from app.services.binding_cache import BindingCache
+
+# bot -> (provider, enabled)
+BINDINGS = {"on": ("p1", True), "off": ("p1", False)}
+
+
+class _Session:
+    """Answers the cache's two lookups from BINDINGS, honouring an `enabled IS true` filter."""
+
+    async def __aenter__(self) -> "_Session":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    def _rows(self, stmt) -> list[tuple[str, str]]:
+        sql = str(stmt.compile(compile_kwargs={"literal_binds": True}))
+        enabled_only = "enabled IS true" in sql
+        return [(bot, provider) for bot, (provider, enabled) in BINDINGS.items() if enabled or not enabled_only]
+
+    async def scalar(self, stmt) -> str | None:
+        bot_id = stmt.whereclause.clauses[0].right.value
+        return next((provider for bot, provider in self._rows(stmt) if bot == bot_id), None)
+
+    async def scalars(self, stmt) -> list[str]:
+        return [bot for bot, _ in self._rows(stmt)]
+
+
+def test_disabled_bindings_resolve_to_nothing_both_ways() -> None:
+    async def run() -> None:
+        cache = BindingCache(ttl_sec=60)
+        session = _Session()
+        assert await cache.provider_for(session, "on") == "p1"
+        assert await cache.provider_for(session, "off") is None
+        assert await cache.bots_for(session, "p1") == ["on"]
+
+    asyncio.run(run())
+
+
+def test_disabled_binding_cannot_open_a_stream(monkeypatch) -> None:
+    monkeypatch.setattr(signals_api, "get_sessionmaker", lambda: _Session)
+    monkeypatch.setattr(binding_cache, "_cache", BindingCache(ttl_sec=60))
+    client = TestClient(app)
+
+    resp = client.get("/signals/bots/off/stream")
+    assert resp.status_code == 404 and resp.json()["detail"] == "bot has no enabled provider binding"
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/signals/bots/off/ws"):
+            pass
+    assert closed.value.code == 4404
@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import fakeredis.aioredis
+import pytest
+
+from app.core.config import settings
+from app.services.consensus import _vote_args, expire_votes, parse_members, queue_consensus, sync_members
+from app.services.signal_store import SIGNAL_EXPIRY_KEY, last_key
+
+
+def test_parse_members_validates_weights() -> None:
+    assert parse_members({"members": {"a": 2, "b": 0.5}}, "c") == {"a": 2.0, "b": 0.5}
+    for bad in ({}, {"members": {}}, {"members": {"a": 0}}, {"members": {"a": True}}, {"members": {"c": 1}}):
+        with pytest.raises(ValueError):
+            parse_members(bad, "c")
+
+
+def test_vote_args_maps_directions() -> None:
+    envelope = {
+        "provider_id": "a",
+        "timestamp": 10,
+        "ttl_sec": 60,
+        "signals": {"BTC/USDT": {"direction": "Long", "confidence": 0.4}, "ETH/USDT": {"direction": "sell"}, "X": {"direction": "hold"}},
+    }
+    assert _vote_args(envelope) == ["a", 10, 60, "BTC/USDT", 1.0, 0.4, "ETH/USDT", -1.0, 1.0, "X", 0.0, 1.0]
+
+
+def test_consensus_signal_follows_the_votes_still_counted(lua_cjson) -> None:
+    async def run() -> None:
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True, lua_modules={"cjson"})
+        await sync_members(r, "cons", {}, {"a": 1.0, "b": 1.0})
+        pipe = r.pipeline(transaction=False)
+        await queue_consensus(pipe, {"provider_id": "a", "timestamp": 100, "ttl_sec": 60, "signals": {"BTC/USDT": {"direction": "buy"}}})
+        await queue_consensus(pipe, {"provider_id": "b", "timestamp": 130, "ttl_sec": 600, "signals": {"BTC/USDT": {"direction": "buy"}}})
+        await pipe.execute()
+        last = json.loads(await r.hget(last_key("cons"), "BTC/USDT"))
+        assert (last["ts"], last["ttl_sec"]) == (130, 600)
+
+        # b flips to a short-lived vote: ts/ttl come from what is counted now, not the old maximum
+        pipe = r.pipeline(transaction=False)
+        await queue_consensus(pipe, {"provider_id": "b", "timestamp": 140, "ttl_sec": 10, "signals": {"BTC/USDT": {"direction": "sell"}}})
+        await pipe.execute()
+        last = json.loads(await r.hget(last_key("cons"), "BTC/USDT"))
+        assert (last["ts"], last["ttl_sec"], last["direction"]) == (140, 20, "flat")
+
+        # b expires: only a's vote is left
+        assert await expire_votes(r, now=155) == 1
+        last = json.loads(await r.hget(last_key("cons"), "BTC/USDT"))
+        assert (last["ts"], last["ttl_sec"], last["direction"]) == (100, 60, "buy")
+        score = await r.zscore(SIGNAL_EXPIRY_KEY, "cons\x1fBTC/USDT")
+        assert score == 160 + settings.signal_last_grace_sec
+
+        assert await expire_votes(r, now=161) == 1
+        assert await r.hget(last_key("cons"), "BTC/USDT") is None
+        assert await r.zscore(SIGNAL_EXPIRY_KEY, "cons\x1fBTC/USDT") is None
+
+    asyncio.run(run())
@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+import numpy as np
+
+from app.services import correlation as corr_module
+from app.services.correlation import RollingMoments, returns_matrix
+
+
+def test_returns_matrix_aligns_and_drops_sparse_pairs() -> None:
+    tf = 60_000
+    ts = np.arange(0, 11 * tf, tf, dtype=np.int64)
+    series = {
+        "A": (ts, np.exp(np.arange(11) * 0.01)),
+        "B": (ts[::2], np.ones(6)),
+    }
+    kept, dropped, rets = returns_matrix(series, ["A", "B", "C"], end_ts=10 * tf, tf_ms=tf, window=10)
+    assert kept == ["A"]
+    assert dropped == ["B", "C"]
+    assert rets.shape == (10, 1)
+    assert np.allclose(rets[:, 0], 0.01)
+
+
+def _pairwise(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    n = rows.shape[1]
+    cov, corr = np.empty((n, n)), np.empty((n, n))
+    for i in range(n):
+        for j in range(n):
+            both = rows[np.isfinite(rows[:, i]) & np.isfinite(rows[:, j])][:, [i, j]]
+            cov[i, j] = np.cov(both, rowvar=False)[0, 1]
+            corr[i, j] = np.corrcoef(both, rowvar=False)[0, 1]
+    return cov, corr
+
+
+def test_rolling_update_matches_full_recompute() -> None:
+    rng = np.random.default_rng(1)
+    window, n = 1000, 200
+    data = rng.normal(0, 0.01, size=(window + 5, n))
+    data[3, 7] = np.nan
+
+    state = RollingMoments([str(i) for i in range(n)], data[:window], last_ts=0)
+    started = time.perf_counter()
+    state.push(data[window:], 5, last_ts=5)
+    assert time.perf_counter() - started < 0.1
+
+    tail = data[5:]
+    assert state.count == window
+    assert np.allclose(state.cov(), np.cov(tail, rowvar=False))
+    assert np.allclose(state.corr(), np.corrcoef(tail, rowvar=False))
+
+
+def test_moments_are_pairwise_complete_and_take_late_fills() -> None:
+    rng = np.random.default_rng(2)
+    window, n = 50, 4
+    data = rng.normal(0, 0.01, size=(window + 2, n))
+    buffered = data.copy()
+    # one sparse series must not shrink the sample of the others; a bar is also still missing
+    buffered[::3, 0] = np.nan
+    buffered[window - 1, 2] = np.nan
+
+    state = RollingMoments(list("abcd"), buffered[:window], last_ts=0)
+    cov, corr = _pairwise(buffered[:window])
+    assert np.allclose(state.cov(), cov) and np.allclose(state.corr(), corr)
+    # the smallest sample is the pair of the two series with gaps
+    assert state.count == int((np.isfinite(buffered[:window, 0]) & np.isfinite(buffered[:window, 2])).sum())
+
+    # two new bars; the re-read tail has the missing bar filled in
+    fresh = buffered.copy()
+    fresh[window - 1, 2] = data[window - 1, 2]
+    state.push(fresh[window - 4 :], 2, last_ts=2)
+    cov, corr = _pairwise(fresh[2:])
+    assert np.allclose(state.cov(), cov) and np.allclose(state.corr(), corr)
+
+
+def _market(monkeypatch, bars: int, tf: int) -> tuple[dict, list[int]]:
+    """Two random-walk series served by a slow load_closes; returns the clock and the load calls."""
+    rng = np.random.default_rng(3)
+    ts = np.arange(bars, dtype=np.int64) * tf
+    closes = {p: np.exp(np.cumsum(rng.normal(0, 0.01, bars))) for p in ("A", "B")}
+    clock = {"now": 0}
+    loads: list[int] = []
+
+    async def load_closes(session, *, exchange, pairs, timeframe, since_ts, end_ts, min_bars):
+        loads.append(since_ts)
+        await asyncio.sleep(0.01)
+        keep = (ts >= since_ts) & (ts <= end_ts)
+        return {p: (ts[keep], closes[p][keep]) for p in pairs}
+
+    monkeypatch.setattr(corr_module, "load_closes", load_closes)
+    monkeypatch.setattr(corr_module, "now_ts_ms", lambda: clock["now"])
+    monkeypatch.setattr(corr_module, "_states", type(corr_module._states)())
+    monkeypatch.setattr(corr_module, "_memo", type(corr_module._memo)())
+    return clock, loads
+
+
+def test_concurrent_requests_advance_the_state_once(monkeypatch) -> None:
+    tf, window = 60_000, 20
+    clock, loads = _market(monkeypatch, 100, tf)
+    query = {"exchange": "x", "pairs": ["A", "B"], "timeframe": "1m", "window": window}
+
+    async def run() -> None:
+        clock["now"] = 50 * tf
+        await corr_module.correlation(None, **query)
+        clock["now"] = 53 * tf
+        loads.clear()
+        first, second = await asyncio.gather(*(corr_module.correlation(None, **query) for _ in range(2)))
+        assert len(loads) == 1 and first is second
+
+        corr_module._states.clear()
+        corr_module._memo.clear()
+        fresh = await corr_module.correlation(None, **query)
+        assert np.allclose(np.array(first["corr"], dtype=float), np.array(fresh["corr"], dtype=float))
+
+    asyncio.run(run())
+
+
+def test_exchange_fetch_covers_the_whole_window(monkeypatch) -> None:
+    limits: list[int] = []
+
+    async def no_cache(exchange, pairs, timeframe):
+        return {}
+
+    async def fetch_candles(exchange, pair, timeframe, limit):
+        limits.append(limit)
+        return []
+
+    monkeypatch.setattr(corr_module, "get_cached_raw_many", no_cache)
+    monkeypatch.setattr(corr_module, "fetch_candles", fetch_candles)
+    tf = 60_000
+    kwargs = {"exchange": "x", "pairs": ["A"], "timeframe": "1m", "end_ts": 500 * tf}
+    asyncio.run(corr_module.load_closes(None, since_ts=300 * tf, min_bars=180, **kwargs))
+    assert limits == [202]
@@ -0,0 +1,45 @@
+from app.services.instrument_registry import Instrument, InstrumentRegistry
+
+
+def _registry() -> InstrumentRegistry:
+    return InstrumentRegistry(
+        [
+            Instrument("binance", "BTCUSDT", "BTC", "USDT"),
+            Instrument("binance", "ETHUSDT", "ETH", "USDT"),
+            Instrument("kraken", "XBTUSDT", "XBT", "USDT"),
+            Instrument("coinbase", "BTC-USD", "BTC", "USD"),
+            Instrument("bybit", "ETHBTC", "ETH", "BTC", "perp"),
+        ],
+        aliases={"BTC/USDT": {"coinbase": "BTC-USD"}},
+    )
+
+
+def test_lookups_both_directions() -> None:
+    reg = _registry()
+    assert reg.native("BTC/USDT", "binance") == "BTCUSDT"
+    assert reg.native("BTC/USDT", "kraken") == "XBTUSDT"
+    assert reg.native("BTC/USDT", "coinbase") == "BTC-USD"
+    assert reg.native("BTC/USDT", "okx") is None
+    assert reg.normalized("XBTUSDT", "kraken") == "BTC/USDT"
+    # aliases never shadow the exchange's own naming
+    assert reg.normalized("BTC-USD", "coinbase") == "BTC/USD"
+    assert reg.normalized("ethusdt") == "ETH/USDT"
+    assert reg.normalized("ethusdt", "binance") == "ETH/USDT"
+    # an exchange that does not list the symbol has no pair for it, even if another exchange does
+    assert reg.normalized("ETHUSDT", "kraken") is None
+
+
+def test_search_prefix_then_substring() -> None:
+    reg = _registry()
+    assert reg.search("BTC") == ["BTC/USD", "BTC/USDT", "ETH/BTC"]
+    assert reg.search("ethu") == ["ETH/USDT"]
+    assert reg.search("btc", exchange="bybit") == ["ETH/BTC"]
+    assert reg.search("", limit=2) == ["BTC/USD", "BTC/USDT"]
+
+
+def test_snapshot_roundtrip() -> None:
+    reg = _registry()
+    rows = InstrumentRegistry.instruments_from_snapshot(reg.to_snapshot())
+    restored = InstrumentRegistry(rows)
+    assert restored.pairs() == ["BTC/USD", "BTC/USDT", "ETH/BTC", "ETH/USDT"]
+    assert restored.kinds("ETH/BTC") == ["perp"]
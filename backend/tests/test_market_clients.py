@@ -0,0 +1,55 @@
+import asyncio
+
+from app.services import market_clients
+from app.services.tick_store import DAY_MS, TickStore, ticks_from_binance
+
+HOUR_MS = 3_600_000
+START = 10 * DAY_MS
+
+
+def _exchange(monkeypatch, tmp_path, trades: list[dict], page: int = 10) -> tuple[TickStore, list[dict]]:
+    """Serves `trades` like the aggTrades endpoint (by time window or fromId) into a store under tmp_path."""
+    store = TickStore(tmp_path)
+    calls: list[dict] = []
+
+    async def fetch(symbol, start_ms=None, end_ms=None, from_id=None):
+        calls.append({"start_ms": start_ms, "from_id": from_id})
+        if from_id is not None:
+            hits = [t for t in trades if t["a"] >= from_id]
+        else:
+            hits = [t for t in trades if start_ms <= t["T"] <= end_ms]
+        return hits[:page]
+
+    monkeypatch.setattr(market_clients, "_fetch_binance_agg_trades", fetch)
+    monkeypatch.setattr(market_clients, "get_tick_store", lambda: store)
+    monkeypatch.setattr(market_clients, "AGG_TRADES_PAGE", page)
+    return store, calls
+
+
+def _trades(n: int, first_ts: int, step_ms: int) -> list[dict]:
+    return [{"a": i, "T": first_ts + i * step_ms, "p": "1.0", "q": "1.0", "m": False} for i in range(n)]
+
+
+def test_sync_steps_over_empty_hours_and_covers_a_sparse_window(monkeypatch, tmp_path) -> None:
+    # 30 trades spread over hours 1..5; the first hour of the window has none
+    trades = _trades(30, START + HOUR_MS, 4 * HOUR_MS // 30)
+    store, calls = _exchange(monkeypatch, tmp_path, trades)
+
+    assert asyncio.run(market_clients.sync_binance_ticks("BTCUSDT", START, START + 5 * HOUR_MS)) is True
+    assert store.read("binance", "BTCUSDT", START, START + 5 * HOUR_MS)["id"].tolist() == list(range(30))
+    # an empty hour window, a short one with 8 trades, then by id until a short page
+    assert [c["from_id"] for c in calls] == [None, None, 8, 18, 28]
+
+
+def test_sync_pages_back_and_reports_an_exhausted_budget(monkeypatch, tmp_path) -> None:
+    trades = _trades(50, START, 60_000)
+    store, _ = _exchange(monkeypatch, tmp_path, trades)
+    store.append("binance", "BTCUSDT", ticks_from_binance(trades[40:]))
+
+    monkeypatch.setattr(market_clients, "MAX_TICK_PAGES", 2)
+    assert asyncio.run(market_clients.sync_binance_ticks("BTCUSDT", START, START + HOUR_MS)) is False
+    assert store.first("binance", "BTCUSDT")[0] == 20
+
+    monkeypatch.setattr(market_clients, "MAX_TICK_PAGES", 25)
+    assert asyncio.run(market_clients.sync_binance_ticks("BTCUSDT", START, START + HOUR_MS)) is True
+    assert store.read("binance", "BTCUSDT", START, START + HOUR_MS)["id"].tolist() == list(range(50))
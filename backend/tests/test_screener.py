@@ -0,0 +1,73 @@
+import numpy as np
+
+from app.services.screener import ScreenerTable
+
+
+def _table(n: int = 3000) -> ScreenerTable:
+    rng = np.random.default_rng(7)
+    table = ScreenerTable(capacity=16)
+    rows = [
+        (
+            f"C{i}/USDT",
+            f"C{i}USDT",
+            "USDT",
+            "spot" if i % 2 else "perp",
+            {"last": 1.0 + i, "change24hPct": float(rng.normal(0, 5)), "volume24hQuote": float(i * 10)},
+        )
+        for i in range(n)
+    ]
+    table.upsert("binance", rows)
+    return table
+
+
+def test_filter_sort_and_paginate() -> None:
+    table = _table()
+    total, items = table.query(kind="perp", ranges={"volume24hQuote": (1000.0, None)}, sort="volume24hQuote", limit=5)
+    assert total == sum(1 for i in range(3000) if i % 2 == 0 and i * 10 >= 1000)
+    assert [r["pair"] for r in items] == ["C2998/USDT", "C2996/USDT", "C2994/USDT", "C2992/USDT", "C2990/USDT"]
+
+    _, page2 = table.query(kind="perp", sort="volume24hQuote", offset=5, limit=2)
+    assert [r["pair"] for r in page2] == ["C2988/USDT", "C2986/USDT"]
+
+    _, asc = table.query(sort="last", desc=False, limit=1)
+    assert asc[0]["pair"] == "C0/USDT"
+
+
+def test_incremental_upsert_updates_in_place() -> None:
+    table = _table(10)
+    table.upsert("binance", [("C3/USDT", "C3USDT", "USDT", "spot", {"last": 99.0, "volume24hQuote": 1e9})])
+    assert len(table) == 10
+    _, top = table.query(limit=1)
+    assert top[0]["pair"] == "C3/USDT" and top[0]["last"] == 99.0
+    # columns missing from the batch become unknown and sort last
+    assert top[0]["change24hPct"] is None
+    _, by_change = table.query(sort="change24hPct", limit=10)
+    assert by_change[-1]["pair"] == "C3/USDT"
+
+
+def test_top_n_page_matches_a_full_sort() -> None:
+    table = _table(5000)
+    table.upsert("binance", [(f"C{i}/USDT", f"C{i}USDT", "USDT", "spot", {"last": 1.0}) for i in range(0, 5000, 7)])
+    total, everything = table.query(ranges={"last": (None, 4000.0)}, sort="change24hPct", limit=5000)
+    assert total == len(everything)
+    for offset in (0, 40, total - 30):
+        _, page = table.query(ranges={"last": (None, 4000.0)}, sort="change24hPct", offset=offset, limit=50)
+        assert [r["pair"] for r in page] == [r["pair"] for r in everything[offset : offset + 50]]
+
+
+def test_prune_drops_rows_that_stopped_updating() -> None:
+    table = ScreenerTable(capacity=4)
+    table.upsert("binance", [(f"C{i}/USDT", f"C{i}USDT", "USDT", "spot", {"last": float(i), "updatedAt": 1000.0 * i}) for i in range(6)])
+    table.upsert("okx", [("C1/USDT", "C1-USDT", "USDT", "spot", {"last": 7.0})])
+    assert table.prune(2500.0) == 3
+    assert len(table) == 4
+    _, rows = table.query(sort="last", desc=False)
+    assert [(r["exchange"], r["pair"]) for r in rows] == [("binance", "C3/USDT"), ("binance", "C4/USDT"), ("binance", "C5/USDT"), ("okx", "C1/USDT")]
+
+    # surviving rows are still updated in place, dropped ones come back as new rows
+    table.upsert("binance", [("C4/USDT", "C4USDT", "USDT", "spot", {"last": 40.0, "updatedAt": 9000.0})])
+    table.upsert("binance", [("C0/USDT", "C0USDT", "USDT", "spot", {"last": 0.5, "updatedAt": 9000.0})])
+    assert len(table) == 5
+    _, top = table.query(exchange="binance", sort="last", limit=1)
+    assert top[0]["pair"] == "C4/USDT" and top[0]["last"] == 40.0
+    assert table.prune(2500.0) == 0
@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from app.services import signal_delivery
+from app.services.signal_delivery import Subscription, replay
+
+
+class _Stream:
+    def __init__(self, entries: list[tuple[str, dict]]) -> None:
+        self.entries = entries
+        self.sub: Subscription | None = None
+
+    async def xrange(self, name, min, max, count):
+        # A live entry is dispatched while the replay read is in flight.
+        self.sub.offer("5-0", {"signals": {"BTC/USDT": {}}})
+        return self.entries
+
+
+def _ids(sub: Subscription) -> list[str]:
+    out = []
+    while not sub.queue.empty():
+        out.append(sub.queue.get_nowait()["id"])
+    return out
+
+
+def test_replay_keeps_backlog_when_live_entry_arrives_first(monkeypatch) -> None:
+    payload = {"payload": json.dumps({"signals": {"BTC/USDT": {}}})}
+    stream = _Stream([("2-0", payload), ("3-0", payload), ("5-0", payload)])
+    monkeypatch.setattr(signal_delivery, "get_redis", lambda: stream)
+    sub = stream.sub = Subscription("bot", None, "1-0")
+
+    asyncio.run(replay("p", sub))
+    assert _ids(sub) == ["2-0", "3-0", "5-0"]
+
+    sub.offer("6-0", {"signals": {"BTC/USDT": {}}})
+    assert _ids(sub) == ["6-0"]
+
+
+def test_fresh_subscription_delivers_live_entries_immediately() -> None:
+    sub = Subscription("bot", {"ETH/USDT"}, None)
+    sub.offer("1-0", {"signals": {"BTC/USDT": {}}})
+    sub.offer("2-0", {"signals": {"ETH/USDT": {}}})
+    assert _ids(sub) == ["2-0"]
@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+import json
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import fakeredis
+import pytest
+from pydantic import ValidationError
+
+from app.api.signals import CanonicalSignalEnvelope
+from app.services import signal_history
+from app.services.signal_history import (
+    COPY_COLUMNS,
+    HISTORY_DEAD_LETTER_KEY,
+    HISTORY_GROUP,
+    HistoryWriter,
+    _partition_ddl,
+    decode_cursor,
+    encode_cursor,
+    rows_from_entry,
+)
+
+
+def test_rows_from_entry_flattens_pairs() -> None:
+    envelope = {
+        "provider_id": "p1",
+        "timestamp": 1_700_000_000,
+        "ttl_sec": 60,
+        "signals": {"BTC/USDT": {"direction": "long", "confidence": 0.7, "metadata": {"k": 1}}, "bad": {}},
+    }
+    rows = rows_from_entry("1700000000500-0", {"payload": json.dumps(envelope)})
+    assert len(rows) == 1
+    row = dict(zip(COPY_COLUMNS, rows[0]))
+    assert row["pair"] == "BTC/USDT"
+    assert row["ts"] == datetime.fromtimestamp(1_700_000_000, tz=timezone.utc)
+    assert row["received_at"].timestamp() == 1_700_000_000.5
+    assert json.loads(row["metadata"]) == {"k": 1}
+    assert rows_from_entry("1-0", {"payload": "not json"}) == []
+    assert rows_from_entry("1-0", None) == []
+    # values no column (or datetime) can hold are malformed too
+    assert rows_from_entry("1-0", {"payload": json.dumps({**envelope, "timestamp": 10**20})}) == []
+    assert rows_from_entry("1-0", {"payload": json.dumps({**envelope, "ttl_sec": 2**31})}) == []
+    for bad in ({"timestamp": 10**20}, {"ttl_sec": 2**31}, {"ttl_sec": -1}):
+        with pytest.raises(ValidationError):
+            CanonicalSignalEnvelope.model_validate({**envelope, **bad})
+
+
+def test_cursor_roundtrip_and_partition_bounds() -> None:
+    ts = datetime(2026, 3, 1, 12, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(ts, "5-1", "ETH:USDT")) == (ts, "5-1", "ETH:USDT")
+    assert "FROM ('2026-12-01') TO ('2027-01-01')" in _partition_ddl(2026, 12)
+
+
+
+class _Apg:
+    """Records statements; the INSERT fails until `fail_insert` is cleared, rolling the batch back.
+
+    COPY refuses any batch holding a "BAD" pair, like an out-of-range column value.
+    """
+
+    def __init__(self) -> None:
+        self.statements: list[str] = []
+        self.fail_insert = True
+        self.copied = 0
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, sql: str) -> None:
+        self.statements.append(sql)
+        if sql.startswith("INSERT") and self.fail_insert:
+            raise RuntimeError("insert failed")
+
+    async def copy_records_to_table(self, table, records, columns) -> None:
+        if any(r[1] == "BAD" for r in records):
+            raise OverflowError("value out of int32 range")
+        self.copied += len(records)
+
+
+def _engine(monkeypatch, apg: _Apg) -> None:
+    conn = SimpleNamespace(get_raw_connection=AsyncMock(return_value=SimpleNamespace(driver_connection=apg)))
+    engine = SimpleNamespace(connect=lambda: contextlib.nullcontext(conn))
+    monkeypatch.setattr(signal_history, "get_engine", lambda: engine)
+
+
+def test_partitions_are_remembered_only_after_commit(monkeypatch) -> None:
+    apg = _Apg()
+    _engine(monkeypatch, apg)
+    envelope = {"provider_id": "p", "timestamp": 1_700_000_000, "ttl_sec": 60, "signals": {"BTC/USDT": {"direction": "long"}}}
+    rows = rows_from_entry("1-0", {"payload": json.dumps(envelope)})
+    writer = HistoryWriter()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(writer._copy(rows))
+    apg.fail_insert = False
+    asyncio.run(writer._copy(rows))
+    asyncio.run(writer._copy(rows))
+    assert sum(sql.startswith("CREATE TABLE") for sql in apg.statements) == 2
+
+
+def test_refused_entries_are_dead_lettered_and_acked(monkeypatch) -> None:
+    apg = _Apg()
+    apg.fail_insert = False
+    _engine(monkeypatch, apg)
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(signal_history, "get_redis", lambda: r)
+
+    async def run() -> None:
+        stream = "signals.provider.p"
+        for pair in ("BTC/USDT", "BAD", "ETH/USDT"):
+            envelope = {"provider_id": "p", "timestamp": 1_700_000_000, "ttl_sec": 60, "signals": {pair: {"direction": "long"}}}
+            await r.xadd(stream, {"payload": json.dumps(envelope)})
+        await r.xgroup_create(stream, HISTORY_GROUP, id="0")
+        (_, entries), = await r.xreadgroup(HISTORY_GROUP, "c", {stream: ">"})
+        writer = HistoryWriter()
+        writer.add(stream, entries)
+
+        assert await writer.flush() == 2
+        assert apg.copied == 2
+        assert (await r.xpending(stream, HISTORY_GROUP))["pending"] == 0
+        (dead,) = await r.xrange(HISTORY_DEAD_LETTER_KEY)
+        assert dead[1]["entry_id"] == entries[1][0] and "int32" in dead[1]["error"]
+
+    asyncio.run(run())
@@ -0,0 +1,111 @@
+import asyncio
+import json
+
+import fakeredis
+import httpx
+import pytest
+from redis.asyncio.client import Pipeline
+from redis.exceptions import ResponseError
+
+from app.api import signals as signals_api
+from app.core import redis as redis_module
+from app.main import app
+from app.services.signal_store import last_key
+
+
+def _line(provider_id: str, pair: str = "BTC/USDT", **extra) -> bytes:
+    envelope = {"provider_id": provider_id, "timestamp": 100, "ttl_sec": 60, "signals": {pair: {"direction": "buy"}}, **extra}
+    return json.dumps(envelope).encode()
+
+
+def _post(monkeypatch, body, **limits) -> tuple[dict, fakeredis.FakeAsyncRedis, int]:
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(redis_module, "_redis", r)
+    for name, value in limits.items():
+        monkeypatch.setattr(signals_api, name, value)
+    executed = []
+    execute = Pipeline.execute
+
+    async def counting_execute(self, raise_on_error=True):
+        executed.append(len(self))
+        return await execute(self, raise_on_error)
+
+    monkeypatch.setattr(Pipeline, "execute", counting_execute)
+
+    async def run() -> dict:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            resp = await client.post("/signals/ingest/ndjson", content=body)
+        assert resp.status_code == 200
+        return resp.json()
+
+    return asyncio.run(run()), r, len(executed)
+
+
+def test_ndjson_applies_lines_in_batches(monkeypatch) -> None:
+    lines = [_line("a", f"P{i}/USDT") for i in range(4)] + [b"", _line("b")]
+    out, r, executes = _post(monkeypatch, b"\n".join(lines) + b"\n", NDJSON_BATCH=2)
+    assert (out["ok"], out["lines"], out["accepted"], out["rejected"], out["written"]) == (True, 6, 5, 0, 5)
+    assert executes == 3
+    assert sorted(asyncio.run(r.hkeys(last_key("a")))) == [f"P{i}/USDT" for i in range(4)]
+    assert asyncio.run(r.smembers("signals.providers")) == {"a", "b"}
+
+
+def test_ndjson_reports_errors_per_line(monkeypatch) -> None:
+    body = b"\n".join([_line("a"), b"{not json", json.dumps({"provider_id": "b", "timestamp": 1}).encode(), _line("a", "ETH/USDT")])
+    out, r, _ = _post(monkeypatch, body)
+    assert (out["ok"], out["lines"], out["accepted"], out["rejected"]) == (False, 4, 2, 2)
+    assert [e["line"] for e in out["errors"]] == [2, 3]
+    assert out["errors"][1]["error"].startswith("ttl_sec")
+
+    async def errors_for(provider_id: str) -> int:
+        keys = [k async for k in r.scan_iter(match=f"signals.metrics:{provider_id}:*")]
+        return sum([int(await r.hget(k, "errors") or 0) for k in keys])
+
+    assert asyncio.run(errors_for("b")) == 1
+
+
+def test_ndjson_rejects_oversized_lines_and_keeps_counting(monkeypatch) -> None:
+    big = _line("a", metadata="x" * 400)
+    # Whole body in one chunk: the oversized line is complete when it is seen.
+    out, _, _ = _post(monkeypatch, b"\n".join([_line("a"), big, _line("a", "ETH/USDT"), big]), NDJSON_MAX_LINE_BYTES=256)
+    assert (out["lines"], out["accepted"], out["rejected"]) == (4, 2, 2)
+    assert [(e["line"], e["error"]) for e in out["errors"]] == [(2, "line exceeds 256 bytes"), (4, "line exceeds 256 bytes")]
+
+    # Streamed in small chunks: an oversized line is rejected before its newline, a final one has none.
+    async def chunks():
+        body = b"\n".join([big, _line("a"), big, _line("a", "ETH/USDT"), big])
+        for i in range(0, len(body), 64):
+            yield body[i : i + 64]
+
+    out, _, _ = _post(monkeypatch, chunks(), NDJSON_MAX_LINE_BYTES=256)
+    assert (out["lines"], out["accepted"], out["rejected"]) == (5, 2, 3)
+    assert [e["line"] for e in out["errors"]] == [1, 3, 5]
+
+
+def test_stream_append_is_best_effort(monkeypatch, caplog) -> None:
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(redis_module, "_redis", r)
+    execute = Pipeline.execute
+
+    async def streams_fail(self, raise_on_error=True):
+        commands = [args[0] for args, _ in self.command_stack]
+        results = await execute(self, raise_on_error)
+        return [ResponseError("OOM command not allowed") if c == "XADD" else res for c, res in zip(commands, results)]
+
+    monkeypatch.setattr(Pipeline, "execute", streams_fail)
+
+    async def run() -> None:
+        await r.set(last_key("b"), "not a hash")
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # The XADD reply is an error; the last value pipelined with it is stored and the request succeeds.
+            resp = await client.post("/signals/ingest", content=_line("a"), headers={"content-type": "application/json"})
+            assert resp.status_code == 200
+            assert await r.hget(last_key("a"), "BTC/USDT")
+            # A failed state write is still an error.
+            with pytest.raises(ResponseError):
+                await client.post("/signals/ingest", content=_line("b"), headers={"content-type": "application/json"})
+
+    asyncio.run(run())
+    assert "provider stream append failed for 1 envelope(s)" in caplog.text
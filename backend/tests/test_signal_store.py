@@ -0,0 +1,39 @@
+import asyncio
+import json
+
+import fakeredis
+
+from app.core.config import settings
+from app.services.signal_store import SIGNAL_EXPIRY_KEY, last_key, purge_legacy_keys, read_last
+
+
+def _legacy(provider_id: str, pair: str, ts: int, ttl_sec: int = 60, **extra) -> str:
+    payload = {"provider_id": provider_id, "pair": pair, "direction": "buy", "ts": ts, "ttl_sec": ttl_sec, "stale": False, **extra}
+    return json.dumps(payload)
+
+
+def test_purge_migrates_live_legacy_values_into_hashes() -> None:
+    async def run() -> None:
+        r = fakeredis.FakeAsyncRedis(decode_responses=True)
+        now = 1_000
+        await r.set("signal:last:a:BTC/USDT", _legacy("a", "BTC/USDT", now - 10))
+        await r.set("signal:last:a:ETH/USDT", _legacy("a", "ETH/USDT", now - 10_000))  # past TTL + grace
+        await r.set("signal:last:b:BTC/USDT", _legacy("b", "BTC/USDT", now - 30, direction="sell"))
+        await r.set("signal:last:c:BTC/USDT", "{broken")
+        # b already has a newer value written through the hash: it is kept, with its own expiry.
+        await r.hset(last_key("b"), "BTC/USDT", _legacy("b", "BTC/USDT", now))
+        await r.zadd(SIGNAL_EXPIRY_KEY, {"b\x1fBTC/USDT": now + 60 + settings.signal_last_grace_sec})
+
+        assert await purge_legacy_keys(r, now=now) == 4
+        assert [k async for k in r.scan_iter(match="signal:last:*", _type="string")] == []
+
+        got = await read_last(r, "a", ["BTC/USDT", "ETH/USDT"], now=now)
+        assert got["BTC/USDT"]["direction"] == "buy" and got["BTC/USDT"]["stale"] is False
+        assert got["ETH/USDT"] is None
+        assert await r.zscore(SIGNAL_EXPIRY_KEY, "a\x1fBTC/USDT") == now - 10 + 60 + settings.signal_last_grace_sec
+        assert await r.ttl(last_key("a")) > 0
+
+        assert (await read_last(r, "b", ["BTC/USDT"], now=now))["BTC/USDT"]["ts"] == now
+        assert await r.zscore(SIGNAL_EXPIRY_KEY, "b\x1fBTC/USDT") == now + 60 + settings.signal_last_grace_sec
+
+    asyncio.run(run())
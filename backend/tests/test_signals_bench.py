@@ -0,0 +1,48 @@
+import random
+
+from benchmarks.signals import baseline_of, compare, make_envelope, make_pairs, redis_target_problem
+
+
+def _report(p99: float, throughput: float, errors: int = 0, **extra) -> dict:
+    return {
+        "config": {"redis": "fake"},
+        "results": {
+            "ingest": {"errors": errors, "p99_ratio": p99, "throughput_ratio": throughput, "throughput": 500.0, "unit": "x/s", **extra}
+        },
+    }
+
+
+def test_compare_flags_latency_and_throughput_regressions() -> None:
+    base = _report(10.0, 1.0)
+    assert compare(_report(12.0, 0.8), base, 0.25) == []
+    problems = compare(_report(13.0, 0.7, errors=2), base, 0.25)
+    assert len(problems) == 3
+    assert compare({**_report(1.0, 1.0), "config": {"redis": "redis"}}, base, 0.25)
+
+
+def test_goals_are_only_checked_on_request() -> None:
+    base = _report(10.0, 1.0)
+    cur = _report(10.0, 1.0, goal=1000.0, of_goal=0.5)
+    assert compare(cur, base, 0.25) == []
+    assert compare(cur, base, 0.25, goals=True) == ["ingest: 500.0 x/s is 50.0% of the 1000.0 goal"]
+
+
+def test_baseline_keeps_only_ratios() -> None:
+    report = _report(10.0, 1.0, p50_ms=3.0)
+    assert baseline_of(report) == {"config": {"redis": "fake"}, "results": {"ingest": {"throughput_ratio": 1.0, "p99_ratio": 10.0}}}
+
+
+def test_envelope_generator_is_deterministic() -> None:
+    pairs = make_pairs(3)
+    a = make_envelope(random.Random(7), "p", pairs, 100)
+    b = make_envelope(random.Random(7), "p", pairs, 100)
+    assert a == b and list(a["signals"]) == pairs
+
+
+def test_only_an_explicit_dedicated_redis_is_flushed() -> None:
+    app_url = "redis://redis:6379/0"
+    assert redis_target_problem(True, None, app_url) is None
+    assert redis_target_problem(False, "redis://localhost:6379/15", app_url) is None
+    assert redis_target_problem(False, None, app_url)
+    assert redis_target_problem(False, "redis://redis:6379/0/", app_url)
+    assert redis_target_problem(True, "redis://localhost:6379/15", app_url)
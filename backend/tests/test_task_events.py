@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+import fakeredis
+import httpx
+
+from app.api import tasks as tasks_api
+from app.core import redis as redis_module
+from app.main import app
+from app.services.task_queue import events_key, task_key
+
+
+def _events(body: str) -> list[dict]:
+    """(id, event, data) of each SSE message; comments and the retry hint are skipped."""
+    out = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if "data" in fields:
+            out.append({"id": fields.get("id"), "event": fields["event"], **json.loads(fields["data"])})
+    return out
+
+
+def _get(monkeypatch, r, url: str, *, headers: dict | None = None, during=None) -> list[dict]:
+    monkeypatch.setattr(redis_module, "_redis", r)
+    monkeypatch.setattr(tasks_api, "SSE_HEARTBEAT_SEC", 0.05)
+
+    async def run() -> list[dict]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            request = client.get(url, headers=headers or {})
+            if during is None:
+                resp = await asyncio.wait_for(request, 5)
+            else:
+                resp, _ = await asyncio.wait_for(asyncio.gather(request, during()), 5)
+        assert resp.status_code == 200
+        return _events(resp.text)
+
+    return asyncio.run(run())
+
+
+async def _task(r, status: str, *events: dict) -> list[str]:
+    await r.hset(task_key("t1"), mapping={"id": "t1", "type": "ping", "status": status})
+    return [await r.xadd(events_key("t1"), fields) for fields in events]
+
+
+def test_events_resume_after_last_event_id_and_end_on_a_terminal_status(monkeypatch) -> None:
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    ids = asyncio.run(
+        _task(
+            r,
+            "done",
+            {"event": "status", "status": "queued"},
+            {"event": "status", "status": "running"},
+            {"event": "progress", "percent": "50"},
+            {"event": "status", "status": "done"},
+        )
+    )
+    events = _get(monkeypatch, r, "/tasks/t1/events", headers={"Last-Event-ID": ids[1]})
+    assert [e["id"] for e in events] == ids[2:]
+    assert (events[0]["event"], events[0]["percent"]) == ("progress", 50.0)
+    assert events[-1]["status"] == "done"
+
+    events = _get(monkeypatch, r, f"/tasks/t1/events?last_id={ids[2]}")
+    assert [e["id"] for e in events] == ids[3:]
+
+
+def test_live_events_stream_until_the_task_settles(monkeypatch) -> None:
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    asyncio.run(_task(r, "running", {"event": "status", "status": "running"}))
+
+    async def finish() -> None:
+        await asyncio.sleep(0.2)
+        await r.xadd(events_key("t1"), {"event": "progress", "percent": "90"})
+        await r.xadd(events_key("t1"), {"event": "status", "status": "error"})
+        await r.hset(task_key("t1"), "status", "error")
+
+    events = _get(monkeypatch, r, "/tasks/t1/events", during=finish)
+    assert [(e["event"], e.get("status")) for e in events] == [("status", "running"), ("progress", None), ("status", "error")]
+
+
+def test_expired_events_fall_back_to_the_task_hash(monkeypatch) -> None:
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    asyncio.run(_task(r, "dead"))
+    assert _get(monkeypatch, r, "/tasks/t1/events", headers={"Last-Event-ID": "1-0"}) == [
+        {"id": None, "event": "status", "task_id": "t1", "status": "dead"}
+    ]
+
+    # archived: no hash left either
+    asyncio.run(r.delete(task_key("t1")))
+
+    async def missing() -> int:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return (await client.get("/tasks/t1/events")).status_code
+
+    assert asyncio.run(missing()) == 404
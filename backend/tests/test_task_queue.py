@@ -0,0 +1,181 @@
+import asyncio
+
+import fakeredis.aioredis
+import pytest
+
+from app.core.config import settings
+from app.services import task_queue
+from app.services.task_queue import (
+    CREATED_INDEX,
+    compact_tasks,
+    decode_cursor,
+    encode_cursor,
+    enqueue,
+    enqueue_many,
+    event_message,
+    events_key,
+    finished_index,
+    list_tasks,
+    plan,
+    route,
+    status_index,
+    status_type_index,
+    stream_key,
+    task_key,
+    type_index,
+)
+
+
+def test_route_matches_patterns_with_settings_first(monkeypatch) -> None:
+    assert route("ping") == ("interactive", "ping")
+    assert route("strategylab.alignment.propose") == ("default", "strategylab.alignment.propose")
+    assert route("strategylab.alignment.other") == ("interactive", "strategylab.alignment.*")
+    assert route("signals.evaluate") == ("batch", "signals.evaluate")
+    assert route("market.backfill") == ("batch", "market.backfill")
+    assert route("backtest.run") == ("batch", "backtest.run")
+    assert route("strategylab.alignment.evaluate") == ("batch", "strategylab.alignment.evaluate")
+    assert route("something.else") == ("default", "*")
+
+    monkeypatch.setattr(settings, "task_routes", {"signals.*": "default"})
+    assert route("signals.evaluate") == ("default", "signals.*")
+
+
+def test_stream_key_per_lane_and_priority() -> None:
+    assert stream_key("batch", "low") == "trade:tasks:stream:batch:low"
+
+
+def test_cursor_round_trip() -> None:
+    assert decode_cursor(encode_cursor(1700000000123, "abc")) == (1700000000123, "abc")
+    with pytest.raises(ValueError):
+        decode_cursor("nope")
+
+
+def test_event_message_decodes_progress_fields() -> None:
+    msg = event_message("t1", "1700000000123-0", {"event": "progress", "percent": "42.5", "partial": '{"rows": 10}'})
+    assert msg == {"task_id": "t1", "ts": 1700000000123, "event": "progress", "percent": 42.5, "partial": {"rows": 10}}
+
+
+def test_plan_resolves_lane_and_validates() -> None:
+    task = plan("ping", {"a": 1}, idempotency="k1")
+    assert (task["lane"], task["priority"], task["route"], task["idempotency_key"]) == ("interactive", "normal", "ping", "k1")
+    assert plan("ping", {}, lane="batch")["route"] == "explicit"
+    with pytest.raises(ValueError):
+        plan("ping", {}, priority="urgent")
+    with pytest.raises(ValueError):
+        plan("ping", {}, lane="nope")
+
+
+def test_list_tasks_pages_through_a_batch_sharing_one_score(monkeypatch) -> None:
+    monkeypatch.setattr(task_queue, "_enqueue_script", None)
+    monkeypatch.setattr(task_queue, "_page_script", None)
+
+    async def run() -> None:
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        created = await enqueue_many(r, [plan("ping", {"i": i}) for i in range(25)])
+        expected = sorted((t["id"] for t in created), reverse=True)
+
+        seen, cursor = [], None
+        while True:
+            page = await list_tasks(r, limit=10, cursor=cursor)
+            seen += [item["id"] for item in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert seen == expected
+
+        # the cursor's task left the index: resume after its score and id instead
+        first = await list_tasks(r, limit=10)
+        await r.zrem(CREATED_INDEX, first["items"][-1]["id"])
+        second = await list_tasks(r, limit=10, cursor=first["next_cursor"])
+        assert [item["id"] for item in second["items"]] == expected[10:20]
+
+    asyncio.run(run())
+
+
+def test_repeated_idempotency_key_returns_the_earlier_task(monkeypatch) -> None:
+    monkeypatch.setattr(task_queue, "_enqueue_script", None)
+
+    async def run() -> None:
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        first = await enqueue(r, "ping", {"n": 1}, idempotency="k1")
+        again = await enqueue(r, "ping", {"n": 2}, idempotency="k1")
+        other = await enqueue(r, "ping", {"n": 3}, idempotency="k2")
+        assert (first["duplicate"], again["duplicate"], other["duplicate"]) == (False, True, False)
+        assert again["id"] == first["id"] != other["id"]
+        # the repeat wrote nothing
+        assert await r.zcard(CREATED_INDEX) == 2
+        assert (await r.hgetall(task_key(first["id"])))["payload"] == '{"n": 1}'
+
+        batch = await enqueue_many(r, [plan("ping", {}, idempotency="k3"), plan("ping", {}, idempotency="k3")])
+        assert [t["duplicate"] for t in batch] == [False, True] and batch[0]["id"] == batch[1]["id"]
+
+    asyncio.run(run())
+
+
+class _Session:
+    def __init__(self, r, archived: list[dict]) -> None:
+        self.r = r
+        self.archived = archived
+        self.rows: list[dict] = []
+
+    async def __aenter__(self) -> "_Session":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        return None
+
+    async def execute(self, stmt, rows: list[dict]) -> None:
+        self.rows += rows
+
+    async def commit(self) -> None:
+        # the hashes are still in Redis when the archive commits
+        for row in self.rows:
+            assert await self.r.exists(task_key(row["id"]))
+        self.archived += self.rows
+
+
+def test_compact_archives_past_retention_then_cleans_up(monkeypatch) -> None:
+    monkeypatch.setattr(task_queue, "_enqueue_script", None)
+    now = 100 * 86400
+    day_ms = 86400 * 1000
+
+    async def settle(r, task_id: str, task_type: str, status: str, finished_ms: int) -> None:
+        # what the agent's set_status() does for a settled task
+        created = (await r.hgetall(task_key(task_id)))["created_ms"]
+        await r.zrem(status_index("queued"), task_id)
+        await r.zrem(status_type_index("queued", task_type), task_id)
+        await r.zadd(status_index(status), {task_id: created})
+        await r.zadd(status_type_index(status, task_type), {task_id: created})
+        await r.zadd(finished_index(status), {task_id: finished_ms})
+        await r.hset(task_key(task_id), "status", status)
+
+    async def run() -> None:
+        r = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        archived: list[dict] = []
+        monkeypatch.setattr(task_queue, "get_sessionmaker", lambda: lambda: _Session(r, archived))
+        now_ms = now * 1000
+        ages = {"done-old": ("done", 2), "done-new": ("done", 0.5), "error-kept": ("error", 2), "dead-old": ("dead", 31)}
+        ids = {}
+        for name, (status, days) in ages.items():
+            task = await enqueue(r, "ping", {"name": name})
+            ids[name] = task["id"]
+            await settle(r, task["id"], "ping", status, now_ms - int(days * day_ms))
+        queued = (await enqueue(r, "ping", {}))["id"]
+
+        assert await compact_tasks(r, now=now) == 2
+        assert sorted(row["payload"]["name"] for row in archived) == ["dead-old", "done-old"]
+        assert {row["status"] for row in archived} == {"done", "dead"}
+
+        for name in ("done-old", "dead-old"):
+            task_id, status = ids[name], ages[name][0]
+            assert not await r.exists(task_key(task_id), events_key(task_id))
+            for index in (CREATED_INDEX, status_index(status), finished_index(status), type_index("ping"), status_type_index(status, "ping")):
+                assert await r.zscore(index, task_id) is None
+        for task_id in (ids["done-new"], ids["error-kept"], queued):
+            assert await r.exists(task_key(task_id)) and await r.zscore(CREATED_INDEX, task_id) is not None
+        assert await r.zrange(finished_index("done"), 0, -1) == [ids["done-new"]]
+
+        # nothing left past retention: a second pass is a no-op
+        assert await compact_tasks(r, now=now) == 0
+
+    asyncio.run(run())
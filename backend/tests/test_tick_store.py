@@ -0,0 +1,76 @@
+import numpy as np
+
+from app.services.tick_store import DAY_MS, TickStore, bars, vwap
+
+
+def _ticks(ids: list[int], ts: list[int], price: list[float]) -> dict[str, np.ndarray]:
+    return {
+        "id": np.asarray(ids, dtype=np.int64),
+        "ts": np.asarray(ts, dtype=np.int64),
+        "price": np.asarray(price, dtype=np.float64),
+        "qty": np.ones(len(ids)),
+        "buyer_maker": np.zeros(len(ids), dtype=bool),
+    }
+
+
+def test_append_partitions_by_day_and_dedupes(tmp_path) -> None:
+    store = TickStore(tmp_path)
+    t0 = 10 * DAY_MS - 2000
+    assert store.append("binance", "BTCUSDT", _ticks([1, 2, 3], [t0, t0 + 1000, t0 + 2000], [1.0, 2.0, 3.0])) == 3
+    # overlapping batch: only ids above the last stored one are written
+    assert store.append("binance", "BTCUSDT", _ticks([3, 4], [t0 + 2000, t0 + 2500], [3.0, 4.0])) == 1
+
+    segments = store.manifest("binance", "BTCUSDT")
+    assert [s["count"] for s in segments] == [2, 2]
+    assert store.last("binance", "BTCUSDT") == (4, t0 + 2500)
+
+    reopened = TickStore(tmp_path)
+    assert reopened.read("binance", "BTCUSDT", t0 + 1000, t0 + 2500)["id"].tolist() == [2, 3]
+    assert reopened.read_ids("binance", "BTCUSDT", 2, 4)["price"].tolist() == [2.0, 3.0, 4.0]
+
+
+
+def test_append_truncates_unvouched_tail(tmp_path) -> None:
+    store = TickStore(tmp_path)
+    t0 = 10 * DAY_MS
+    store.append("binance", "BTCUSDT", _ticks([1, 2], [t0, t0 + 1], [1.0, 2.0]))
+    seg_dir = store._seg_dir("binance", "BTCUSDT", store.manifest("binance", "BTCUSDT")[0])
+    # a crash after writing some columns but before the manifest
+    with open(seg_dir / "id.bin", "ab") as f:
+        f.write(np.asarray([99], dtype=np.int64).tobytes())
+
+    store.append("binance", "BTCUSDT", _ticks([3], [t0 + 2], [3.0]))
+    got = TickStore(tmp_path).read("binance", "BTCUSDT", t0, t0 + 10)
+    assert got["id"].tolist() == [1, 2, 3]
+    assert got["price"].tolist() == [1.0, 2.0, 3.0]
+
+
+def test_backfill_before_and_between_segments(tmp_path) -> None:
+    store = TickStore(tmp_path)
+    t0 = 10 * DAY_MS
+    store.append("binance", "BTCUSDT", _ticks([10, 11], [t0 + 10, t0 + 11], [10.0, 11.0]))
+    store.append("binance", "BTCUSDT", _ticks([20], [t0 + 20], [20.0]))
+    assert store.gaps("binance", "BTCUSDT", t0, t0 + 30) == [(11, 20)]
+
+    # older history and part of the gap arrive in one batch, overlapping what is stored
+    assert store.append("binance", "BTCUSDT", _ticks([8, 9, 10, 12, 13], [t0 + 8, t0 + 9, t0 + 10, t0 + 12, t0 + 13], [8.0, 9.0, 10.0, 12.0, 13.0])) == 4
+    assert store.first("binance", "BTCUSDT") == (8, t0 + 8)
+    assert store.gaps("binance", "BTCUSDT", t0, t0 + 30) == [(13, 20)]
+
+    store.compact("binance", "BTCUSDT")
+    assert [(s["first_id"], s["last_id"]) for s in store.manifest("binance", "BTCUSDT")] == [(8, 13), (20, 20)]
+    reopened = TickStore(tmp_path)
+    assert reopened.read("binance", "BTCUSDT", t0, t0 + 30)["id"].tolist() == [8, 9, 10, 11, 12, 13, 20]
+    assert reopened.append("binance", "BTCUSDT", _ticks([21], [t0 + 21], [21.0])) == 1
+    assert reopened.manifest("binance", "BTCUSDT")[-1]["count"] == 2
+
+def test_bars_and_vwap() -> None:
+    ticks = _ticks([1, 2, 3, 4], [0, 400, 1200, 1900], [10.0, 12.0, 11.0, 9.0])
+    b = bars(ticks, 1000)
+    assert b["ts"].tolist() == [0, 1000]
+    assert b["open"].tolist() == [10.0, 11.0]
+    assert b["high"].tolist() == [12.0, 11.0]
+    assert b["low"].tolist() == [10.0, 9.0]
+    assert b["close"].tolist() == [12.0, 9.0]
+    assert b["volume"].tolist() == [2.0, 2.0]
+    assert vwap(ticks) == 10.5
@@ -0,0 +1,34 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from app.services import tick_store, volume_profile
+from app.services.tick_store import TickStore
+from app.services.volume_profile import CHUNK_MS, build_profile, missing_ranges
+
+
+def _ticks(ids: list[int], ts: list[int]) -> dict[str, np.ndarray]:
+    return {
+        "id": np.asarray(ids, dtype=np.int64),
+        "ts": np.asarray(ts, dtype=np.int64),
+        "price": np.full(len(ids), 100.0),
+        "qty": np.ones(len(ids)),
+        "buyer_maker": np.zeros(len(ids), dtype=bool),
+    }
+
+
+def test_chunks_over_a_store_gap_are_not_cached(tmp_path, monkeypatch) -> None:
+    store = TickStore(tmp_path)
+    monkeypatch.setattr(tick_store, "_store", store)
+    monkeypatch.setattr(volume_profile, "_closed", OrderedDict())
+    h = CHUNK_MS
+    # trades 1-2 in hour 0, 3-9 missing, 10-12 from late hour 2 into hour 4
+    store.append("binance", "BTCUSDT", _ticks([1, 2], [h // 2, h - 1]))
+    store.append("binance", "BTCUSDT", _ticks([10, 11, 12], [3 * h - 1, 3 * h + 1, 4 * h + 1]))
+    assert store.spans("binance", "BTCUSDT") == [(h // 2, h - 1), (3 * h - 1, 4 * h + 1)]
+
+    hist = build_profile("binance", "BTCUSDT", 0, 4 * h, 1.0, now_ms=10 * h)
+    assert float(hist.buy.sum()) == 4.0
+    # only hour 3 lies strictly inside a gap-free run
+    assert [key[-1] for key in volume_profile._closed] == [3 * h]
+    assert missing_ranges(store.spans("binance", "BTCUSDT"), 0, 5 * h) == [[0, h // 2], [h - 1, 3 * h - 1], [4 * h + 1, 5 * h]]